@@ -1,16 +1,19 @@
-from typing import Optional
+import os
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, File, UploadFile, Form
+from fastapi import APIRouter, Depends, File, UploadFile, status
+from starlette.concurrency import run_in_threadpool
 import requests
-import os
 
 from backend.core.container import Container
 from backend.core.dependencies import get_current_user_payload
-from backend.core.exceptions import PredictionError, ValidationError
+from backend.core.exceptions import PredictionError, ValidationError, ConflictError
+from backend.model.genetic_analysis_job import GeneticAnalysisJob, JOB_SUCCEEDED, JOB_FAILED
 from backend.schema.auth_schema import Payload
-from backend.schema.genetic_analysis_schema import GeneticAnalysisResponse, GeneticAnalysisCost
+from backend.schema.genetic_analysis_schema import GeneticAnalysisResponse, GeneticAnalysisCost, \
+    GeneticAnalysisJobInfo
 from backend.services.billing_service import BillingService
+from backend.services.genetic_analysis_service import GeneticAnalysisService, GENETIC_ANALYSIS_COST, VCF_SUFFIXES
 from backend.utils.date import get_now
 
 router = APIRouter(
@@ -18,63 +21,124 @@ router = APIRouter(
     tags=["genetic-analysis"],
 )
 
-GENETIC_ANALYSIS_COST = 50
+
+def validate_vcf_filename(vcf_file: UploadFile) -> str:
+    # Compressed VCFs are passed through as-is; the plink service streams them with bgzip
+    filename = os.path.basename(vcf_file.filename or "")
+    if not filename.lower().endswith(VCF_SUFFIXES):
+        raise ValidationError(detail="VCF file must have .vcf, .vcf.gz or .vcf.bgz extension.")
+    return filename
+
+
+def job_info(job: GeneticAnalysisJob) -> GeneticAnalysisJobInfo:
+    return GeneticAnalysisJobInfo(
+        job_id=job.id,
+        status=job.status,
+        cost=job.cost,
+        cached=job.cached,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
+
+@router.post("/jobs", response_model=GeneticAnalysisJobInfo, status_code=status.HTTP_202_ACCEPTED)
+@inject
+async def submit_genetic_analysis_job(
+        vcf_file: UploadFile = File(...),
+        current_user_payload: Payload = Depends(get_current_user_payload),
+        billing_service: BillingService = Depends(Provide[Container.billing_service]),
+        genetic_analysis_service: GeneticAnalysisService = Depends(Provide[Container.genetic_analysis_service])
+):
+    filename = validate_vcf_filename(vcf_file)
+    if not billing_service.reserve_funds(current_user_payload.id, GENETIC_ANALYSIS_COST):
+        raise PredictionError(detail=f"Insufficient funds for genetic analysis. Required: {GENETIC_ANALYSIS_COST} credits.")
+
+    try:
+        # Streamed from the spooled upload in a worker thread, chunk by chunk
+        job = await run_in_threadpool(genetic_analysis_service.submit_job, current_user_payload.id, filename,
+                                      vcf_file.file)
+    except ValidationError:
+        billing_service.cancel_reservation(current_user_payload.id, GENETIC_ANALYSIS_COST)
+        raise
+    except Exception as e:
+        billing_service.cancel_reservation(current_user_payload.id, GENETIC_ANALYSIS_COST)
+        raise PredictionError(detail=f"Could not queue genetic analysis: {str(e)}")
+    return job_info(job)
+
+
+@router.get("/jobs/{job_id}", response_model=GeneticAnalysisJobInfo)
+@inject
+async def get_genetic_analysis_job(
+        job_id: int,
+        current_user_payload: Payload = Depends(get_current_user_payload),
+        genetic_analysis_service: GeneticAnalysisService = Depends(Provide[Container.genetic_analysis_service])
+):
+    return job_info(genetic_analysis_service.get_job(job_id, current_user_payload.id))
+
+
+@router.get("/jobs/{job_id}/result", response_model=GeneticAnalysisResponse)
+@inject
+async def get_genetic_analysis_result(
+        job_id: int,
+        current_user_payload: Payload = Depends(get_current_user_payload),
+        genetic_analysis_service: GeneticAnalysisService = Depends(Provide[Container.genetic_analysis_service])
+):
+    job = genetic_analysis_service.get_job(job_id, current_user_payload.id)
+    if job.status == JOB_FAILED:
+        raise PredictionError(detail=job.error)
+    if job.status != JOB_SUCCEEDED:
+        raise ConflictError(detail=f"Genetic analysis job {job_id} is {job.status}")
+    return GeneticAnalysisResponse(
+        status="success",
+        analysis_result=job.result,
+        transaction_id=job.transaction_id,
+        cost=job.cost,
+        cached=job.cached,
+        timestamp=job.updated_at
+    )
+
 
 @router.post("/analyze-rheumatoid-arthritis", response_model=GeneticAnalysisResponse)
 @inject
-async def analyze_rheumatoid_arthritis_risk(
+def analyze_rheumatoid_arthritis_risk(
         vcf_file: UploadFile = File(...),
         current_user_payload: Payload = Depends(get_current_user_payload),
-        billing_service: BillingService = Depends(Provide[Container.billing_service])
+        billing_service: BillingService = Depends(Provide[Container.billing_service]),
+        genetic_analysis_service: GeneticAnalysisService = Depends(Provide[Container.genetic_analysis_service])
 ):
+    # Synchronous variant of /jobs; a plain def so FastAPI runs it in its threadpool
+    # instead of blocking the event loop for the duration of the pipeline
+    filename = validate_vcf_filename(vcf_file)
     if not billing_service.reserve_funds(current_user_payload.id, GENETIC_ANALYSIS_COST):
         raise PredictionError(detail=f"Insufficient funds for genetic analysis. Required: {GENETIC_ANALYSIS_COST} credits.")
 
+    vcf_path = None
     try:
-        vcf_dir = 'input/vcf'
-        os.makedirs(vcf_dir, exist_ok=True)
-        vcf_path = os.path.join(vcf_dir, vcf_file.filename)
-        
-        with open(vcf_path, 'wb') as f:
-            content = await vcf_file.read()
-            f.write(content)
-        
-        plink_api_url = os.environ.get("PLINK_API_URL", "http://plink:5000")
-        payload = {
-            "vcf_file": f"vcf/{vcf_file.filename}",
-            "prs_file": "prs/PGS002769_hmPOS_GRCh38.txt"
-        }
-        
-        response = requests.post(f"{plink_api_url}/predict", json=payload, timeout=300)
-        response.raise_for_status()
-        plink_result = response.json()
-        
-        transaction = billing_service.finalize_transaction(current_user_payload.id, GENETIC_ANALYSIS_COST)
-        
-        try:
-            os.remove(vcf_path)
-        except:
-            pass  
-        
-        return GeneticAnalysisResponse(
-            status="success",
-            analysis_result=plink_result,
-            transaction_id=transaction.id,
-            cost=GENETIC_ANALYSIS_COST,
-            timestamp=get_now()
-        )
-        
+        vcf_path, vcf_sha256 = genetic_analysis_service.save_upload(filename, vcf_file.file)
+        plink_result = genetic_analysis_service.request_prediction(vcf_path, vcf_sha256)
+        transaction = genetic_analysis_service.settle(current_user_payload.id, GENETIC_ANALYSIS_COST, plink_result)
+    except ValidationError:
+        billing_service.cancel_reservation(current_user_payload.id, GENETIC_ANALYSIS_COST)
+        raise
     except requests.RequestException as e:
         billing_service.cancel_reservation(current_user_payload.id, GENETIC_ANALYSIS_COST)
         raise PredictionError(detail=f"Analysis service error: {str(e)}")
     except Exception as e:
         billing_service.cancel_reservation(current_user_payload.id, GENETIC_ANALYSIS_COST)
-        try:
-            if 'vcf_path' in locals():
-                os.remove(vcf_path)
-        except:
-            pass
         raise PredictionError(detail=f"An error occurred during analysis: {str(e)}")
+    finally:
+        if vcf_path:
+            genetic_analysis_service.remove_upload(vcf_path)
+
+    return GeneticAnalysisResponse(
+        status="success",
+        analysis_result=plink_result,
+        transaction_id=transaction.id if transaction else None,
+        cost=GENETIC_ANALYSIS_COST if transaction else 0,
+        cached=transaction is None,
+        timestamp=get_now()
+    )
 
 
 @router.get("/cost", response_model=GeneticAnalysisCost)
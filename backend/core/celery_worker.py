@@ -27,3 +27,21 @@ def async_make_batch_predictions(model_name, prediction_requests):
     for request in prediction_requests:
         results.append(make_prediction(model, request['merchant_id'], request['cluster_id']))
     return results
+
+
+_container = None
+
+
+def _get_container():
+    # One container (and database engine) per worker process
+    global _container
+    if _container is None:
+        from backend.core.container import Container
+        _container = Container()
+    return _container
+
+
+@celery.task
+def async_run_genetic_analysis(job_id):
+    genetic_analysis_service = _get_container().genetic_analysis_service()
+    return genetic_analysis_service.run_job(job_id).status
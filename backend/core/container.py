@@ -4,10 +4,12 @@ from backend.core.config import configs
 from backend.core.database import Database
 from backend.repository.predictor_repository import PredictorRepository
 from backend.repository.billing_repository import BillingRepository
+from backend.repository.genetic_analysis_repository import GeneticAnalysisRepository
 from backend.repository.prediction_repository import PredictionRepository
 from backend.repository.user_repository import UserRepository
 from backend.services.auth_service import AuthService
 from backend.services.billing_service import BillingService
+from backend.services.genetic_analysis_service import GeneticAnalysisService
 from backend.services.prediction_service import PredictionService
 from backend.services.predictor_service import PredictorService
 from backend.services.user_service import UserService
@@ -31,9 +33,13 @@ class Container(containers.DeclarativeContainer):
     billing_repository = providers.Factory(BillingRepository, session_factory=db.provided.session)
     prediction_repository = providers.Factory(PredictionRepository, session_factory=db.provided.session)
     predictor_repository = providers.Factory(PredictorRepository, session_factory=db.provided.session)
+    genetic_analysis_repository = providers.Factory(GeneticAnalysisRepository, session_factory=db.provided.session)
 
     user_service = providers.Factory(UserService, user_repository=user_repository)
     auth_service = providers.Factory(AuthService, user_repository=user_repository)
     billing_service = providers.Factory(BillingService, billing_repository=billing_repository)
     predictor_service = providers.Factory(PredictorService, predictor_repository=predictor_repository)
     prediction_service = providers.Factory(PredictionService, prediction_repository=prediction_repository)
+    genetic_analysis_service = providers.Factory(GeneticAnalysisService,
+                                                 genetic_analysis_repository=genetic_analysis_repository,
+                                                 billing_service=billing_service)
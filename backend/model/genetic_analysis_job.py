@@ -0,0 +1,23 @@
+from typing import Optional
+
+from sqlalchemy import JSON, Column
+from sqlmodel import Field
+
+from backend.model.base_model import BaseModel
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class GeneticAnalysisJob(BaseModel, table=True):
+    user_id: int = Field(foreign_key="user.id")
+    status: str = Field(default=JOB_QUEUED)
+    vcf_file: str = Field()
+    vcf_sha256: str = Field()
+    cost: int = Field()
+    transaction_id: Optional[int] = Field(default=None, foreign_key="transaction.id")
+    cached: bool = Field(default=False)
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = Field(default=None, nullable=True)
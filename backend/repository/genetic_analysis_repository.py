@@ -0,0 +1,31 @@
+from backend.core.exceptions import NotFoundError
+from backend.model.genetic_analysis_job import GeneticAnalysisJob
+from backend.repository.base_repository import BaseRepository
+
+
+class GeneticAnalysisRepository(BaseRepository):
+    def __init__(self, session_factory):
+        super().__init__(session_factory, GeneticAnalysisJob)
+
+    def create_job(self, user_id: int, vcf_file: str, vcf_sha256: str, cost: int) -> GeneticAnalysisJob:
+        with self.session_factory() as session:
+            job = GeneticAnalysisJob(user_id=user_id, vcf_file=vcf_file, vcf_sha256=vcf_sha256, cost=cost)
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+
+    def get_user_job(self, job_id: int, user_id: int) -> GeneticAnalysisJob:
+        with self.session_factory() as session:
+            job = session.query(GeneticAnalysisJob) \
+                .filter(GeneticAnalysisJob.id == job_id, GeneticAnalysisJob.user_id == user_id) \
+                .first()
+            if not job:
+                raise NotFoundError(detail=f"Genetic analysis job {job_id} not found")
+            return job
+
+    def update_job(self, job_id: int, **fields) -> GeneticAnalysisJob:
+        with self.session_factory() as session:
+            session.query(GeneticAnalysisJob).filter(GeneticAnalysisJob.id == job_id).update(fields)
+            session.commit()
+        return self.read_by_id(job_id)
@@ -9,10 +9,21 @@ from backend.utils.date import get_now
 class GeneticAnalysisResponse(BaseModel):
     status: str = Field(..., description="Status of the analysis (success/error)")
     analysis_result: Optional[Dict[str, Any]] = Field(None, description="The PLINK analysis result")
-    transaction_id: int = Field(..., description="ID of the billing transaction")
+    transaction_id: Optional[int] = Field(None, description="ID of the billing transaction, none for cached results")
     cost: int = Field(..., description="Cost of the analysis in credits")
+    cached: bool = Field(False, description="Whether the result was served from the result cache")
     timestamp: datetime = Field(default_factory=get_now, description="Timestamp of the analysis")
 
 
+class GeneticAnalysisJobInfo(BaseModel):
+    job_id: int = Field(..., description="ID of the analysis job")
+    status: str = Field(..., description="Job status (queued/running/succeeded/failed)")
+    cost: int = Field(..., description="Credits reserved for the job, or charged once it succeeded")
+    cached: bool = Field(False, description="Whether the result was served from the result cache")
+    error: Optional[str] = Field(None, description="Error message of a failed job")
+    created_at: Optional[datetime] = Field(None, description="Submission time")
+    updated_at: Optional[datetime] = Field(None, description="Time of the last status change")
+
+
 class GeneticAnalysisCost(BaseModel):
     cost: int = Field(..., description="Cost of genetic analysis in credits")
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import shutil
+import zlib
+from typing import BinaryIO, Optional, Tuple
+
+import requests
+
+from backend.core.celery_worker import async_run_genetic_analysis
+from backend.core.exceptions import ValidationError
+from backend.model.genetic_analysis_job import GeneticAnalysisJob, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+from backend.repository.genetic_analysis_repository import GeneticAnalysisRepository
+from backend.services.base_service import BaseService
+from backend.services.billing_service import BillingService
+from backend.utils.hash import get_rand_hash
+
+GENETIC_ANALYSIS_COST = 50
+VCF_SUFFIXES = (".vcf", ".vcf.gz", ".vcf.bgz")
+UPLOAD_DIR = "input/vcf"
+PLINK_TIMEOUT = 300
+PLINK_RETRY_SECONDS = 30
+# Registered score ids (input/prs/manifest.json) computed for every analysis; the first one is reported
+GENETIC_ANALYSIS_SCORES = [s for s in os.environ.get("GENETIC_ANALYSIS_SCORES", "PGS000195").split(",") if s]
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+VCF_MAGIC = b"##fileformat=VCF"
+
+
+def validate_vcf_header(head: bytes):
+    # Checks the start of an upload, inflating the first gzip/BGZF block of compressed ones
+    if head.startswith(GZIP_MAGIC):
+        try:
+            head = zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(head, len(VCF_MAGIC))
+        except zlib.error:
+            raise ValidationError(detail="Compressed VCF file could not be decompressed.")
+    if not head.startswith(VCF_MAGIC):
+        raise ValidationError(detail="File does not appear to be a valid VCF format (missing VCF header).")
+
+
+def plink_retry_after(response) -> Optional[int]:
+    # Seconds the plink service asked us to wait when it refused a job with 429/503
+    if response is None or response.status_code not in (429, 503):
+        return None
+    try:
+        return max(1, int(response.headers.get("Retry-After", PLINK_RETRY_SECONDS)))
+    except ValueError:
+        return PLINK_RETRY_SECONDS
+
+
+class GeneticAnalysisService(BaseService):
+    def __init__(self, genetic_analysis_repository: GeneticAnalysisRepository, billing_service: BillingService):
+        super().__init__(genetic_analysis_repository)
+        self.genetic_analysis_repository = genetic_analysis_repository
+        self.billing_service = billing_service
+
+    @staticmethod
+    def save_upload(filename: str, upload: BinaryIO) -> Tuple[str, str]:
+        """
+        Stream an uploaded VCF to its own directory under input/vcf in fixed-size chunks,
+        hashing it on the way; the first chunk is checked for a VCF header before anything
+        is kept. Returns the path relative to input/ that the plink service expects and
+        the SHA-256 of the file.
+        """
+        upload_id = get_rand_hash()
+        upload_dir = os.path.join(UPLOAD_DIR, upload_id)
+        os.makedirs(upload_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        try:
+            with open(os.path.join(upload_dir, filename), 'wb') as f:
+                chunk = upload.read(UPLOAD_CHUNK_SIZE)
+                validate_vcf_header(chunk)
+                while chunk:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    chunk = upload.read(UPLOAD_CHUNK_SIZE)
+        except Exception:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            raise
+        return f"vcf/{upload_id}/{filename}", digest.hexdigest()
+
+    @staticmethod
+    def remove_upload(vcf_file: str):
+        shutil.rmtree(os.path.join("input", os.path.dirname(vcf_file)), ignore_errors=True)
+
+    @staticmethod
+    def request_prediction(vcf_file: str, vcf_sha256: str) -> dict:
+        plink_api_url = os.environ.get("PLINK_API_URL", "http://plink:5000")
+        payload = {
+            "vcf_file": vcf_file,
+            "scores": GENETIC_ANALYSIS_SCORES,
+            "vcf_sha256": vcf_sha256
+        }
+        response = requests.post(f"{plink_api_url}/predict", json=payload, timeout=PLINK_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def settle(self, user_id: int, cost: int, plink_result: dict):
+        # Re-uploads of an already analysed file are served from the result cache and not charged
+        if plink_result.get("cached"):
+            self.billing_service.cancel_reservation(user_id, cost)
+            return None
+        return self.billing_service.finalize_transaction(user_id, cost)
+
+    def submit_job(self, user_id: int, filename: str, upload: BinaryIO) -> GeneticAnalysisJob:
+        """Store the upload and queue it for the worker; funds must already be reserved."""
+        vcf_file, vcf_sha256 = self.save_upload(filename, upload)
+        try:
+            job = self.genetic_analysis_repository.create_job(user_id=user_id, vcf_file=vcf_file,
+                                                              vcf_sha256=vcf_sha256, cost=GENETIC_ANALYSIS_COST)
+            async_run_genetic_analysis.delay(job.id)
+        except Exception:
+            self.remove_upload(vcf_file)
+            raise
+        return job
+
+    def get_job(self, job_id: int, user_id: int) -> GeneticAnalysisJob:
+        return self.genetic_analysis_repository.get_user_job(job_id, user_id)
+
+    def run_job(self, job_id: int) -> GeneticAnalysisJob:
+        """Run a queued job in the worker and finalize or cancel its reservation."""
+        job = self.genetic_analysis_repository.read_by_id(job_id)
+        if job.status != JOB_QUEUED:
+            # Redelivered task of a job that was already picked up
+            return job
+        self.genetic_analysis_repository.update_job(job_id, status=JOB_RUNNING)
+        try:
+            plink_result = self.request_prediction(job.vcf_file, job.vcf_sha256)
+            transaction = self.settle(job.user_id, job.cost, plink_result)
+        except requests.HTTPError as e:
+            retry_after = plink_retry_after(e.response)
+            if retry_after is not None:
+                # The plink service queue is full: keep the upload and the reservation and try again later
+                async_run_genetic_analysis.apply_async((job_id,), countdown=retry_after)
+                return self.genetic_analysis_repository.update_job(job_id, status=JOB_QUEUED)
+            return self._fail_job(job, f"Analysis service error: {e}")
+        except requests.RequestException as e:
+            return self._fail_job(job, f"Analysis service error: {e}")
+        except Exception as e:
+            return self._fail_job(job, str(e))
+        self.remove_upload(job.vcf_file)
+        return self.genetic_analysis_repository.update_job(
+            job_id,
+            status=JOB_SUCCEEDED,
+            result=plink_result,
+            cached=transaction is None,
+            cost=0 if transaction is None else job.cost,
+            transaction_id=transaction.id if transaction else None,
+        )
+
+    def _fail_job(self, job: GeneticAnalysisJob, error: str) -> GeneticAnalysisJob:
+        self.billing_service.cancel_reservation(job.user_id, job.cost)
+        self.remove_upload(job.vcf_file)
+        return self.genetic_analysis_repository.update_job(job.id, status=JOB_FAILED, error=error)
@@ -0,0 +1,189 @@
+"""
+Synthetic VCF generator for the pipeline benchmarks.
+
+Records are spread over chromosomes 1-22 in proportion to their length. Every
+PGS000195 site of the chosen assembly is included with its real position, rsID
+and alleles, so the PRS and drug annotation steps have work to do. Duplicates,
+multi-allelic records, sex chromosomes and missing IDs can be mixed in.
+
+    python benchmarks/generate_vcf.py -o /tmp/bench.vcf.gz --records 1000000 --samples 4
+"""
+import argparse
+import gzip
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHROM_LENGTHS = {
+    "GRCh37": [249250621, 243199373, 198022430, 191154276, 180915260, 171115067, 159138663, 146364022,
+               141213431, 135534747, 135006516, 133851895, 115169878, 107349540, 102531392, 90354753,
+               81195210, 78077248, 59128983, 63025520, 48129895, 51304566],
+    "GRCh38": [248956422, 242193529, 198295559, 190214555, 181538259, 170805979, 159345973, 145138636,
+               138394717, 133797422, 135086622, 133275309, 114364328, 107043718, 101991189, 90338345,
+               83257441, 80373285, 58617616, 64444167, 46709983, 50818468],
+}
+SEX_CHROM_LENGTHS = {
+    "GRCh37": {"X": 155270560, "Y": 59373566},
+    "GRCh38": {"X": 156040895, "Y": 57227415},
+}
+BASES = np.array(list("ACGT"))
+CHUNK_ROWS = 100000
+
+
+def load_pgs_sites(assembly):
+    """Real PGS000195 sites of `assembly`: chrom, pos, rsID, REF/ALT and ALT frequency."""
+    prefix = os.path.join(REPO_ROOT, "input", "prs", f"PGS000195_hmPOS_{assembly}")
+    score = pd.read_csv(f"{prefix}.txt", sep="\t", dtype=str)
+    freq = pd.read_csv(f"{prefix}.freq", sep="\t", dtype=str).drop_duplicates(subset=["ID"])
+    sites = score.merge(freq[["ID", "REF", "ALT", "ALT_FREQS"]], left_on="rsID", right_on="ID", how="left")
+    sites = sites.dropna(subset=["hm_chr", "hm_pos"])
+    return pd.DataFrame({
+        "chrom": sites["hm_chr"].astype(str),
+        "pos": sites["hm_pos"].astype(int),
+        "id": sites["rsID"],
+        "ref": sites["REF"].fillna(sites["other_allele"]),
+        "alt": sites["ALT"].fillna(sites["effect_allele"]),
+        "freq": sites["ALT_FREQS"].astype(float).fillna(0.3),
+    })
+
+
+def _genotypes(rng, freqs, samples, missing_rate, multiallelic):
+    # GT strings per record and sample, drawn in HWE from each record's ALT frequency
+    dosages = rng.binomial(2, freqs[:, None], size=(len(freqs), samples))
+    gts = np.array(["0/0", "0/1", "1/1"])[dosages]
+    if multiallelic.any():
+        second = rng.random((len(freqs), samples)) < 0.2
+        gts = np.where(multiallelic[:, None] & second & (dosages > 0), "1/2", gts)
+    if missing_rate:
+        gts = np.where(rng.random(gts.shape) < missing_rate, "./.", gts)
+    return ["\t".join(row) for row in gts]
+
+
+def _chrom_records(rng, chrom, length, count, pgs, args, id_offset):
+    """Data lines of one chromosome, sorted by position."""
+    pos = np.sort(rng.integers(1, length, size=count))
+    ref_idx = rng.integers(0, 4, size=count)
+    alt_shift = rng.integers(1, 4, size=count)
+    refs = BASES[ref_idx]
+    alts = BASES[(ref_idx + alt_shift) % 4]
+    # Second ALT of multi-allelic records, distinct from REF and the first ALT
+    thirds = BASES[(ref_idx + alt_shift % 3 + 1) % 4]
+    ids = np.array([f"rs{id_offset + i}" for i in range(count)], dtype=object)
+    freqs = rng.uniform(0.01, 0.5, size=count)
+
+    sites = pgs[pgs["chrom"] == chrom]
+    if len(sites):
+        pos = np.concatenate([pos, sites["pos"].to_numpy()])
+        refs = np.concatenate([refs, sites["ref"].to_numpy()])
+        alts = np.concatenate([alts, sites["alt"].to_numpy()])
+        ids = np.concatenate([ids, sites["id"].to_numpy(dtype=object)])
+        freqs = np.concatenate([freqs, sites["freq"].to_numpy()])
+        thirds = np.concatenate([thirds, np.full(len(sites), "N")])
+        order = np.argsort(pos, kind="stable")
+        pos, refs, alts, ids, freqs, thirds = (
+            pos[order], refs[order], alts[order], ids[order], freqs[order], thirds[order]
+        )
+
+    n = len(pos)
+    is_pgs = np.isin(ids, sites["id"].to_numpy()) if len(sites) else np.zeros(n, dtype=bool)
+    multiallelic = (rng.random(n) < args.multiallelic_rate) & ~is_pgs
+    alts = alts.astype(object)
+    alts[multiallelic] = alts[multiallelic] + "," + thirds[multiallelic].astype(object)
+    missing_id = (rng.random(n) < args.missing_id_rate) & ~is_pgs
+    ids[missing_id] = "."
+    duplicate = rng.random(n) < args.duplicate_rate
+
+    for start in range(0, n, CHUNK_ROWS):
+        stop = min(n, start + CHUNK_ROWS)
+        gts = _genotypes(rng, freqs[start:stop], args.samples, args.missing_gt_rate, multiallelic[start:stop])
+        lines = []
+        for i in range(start, stop):
+            line = f"{args.chr_prefix}{chrom}\t{pos[i]}\t{ids[i]}\t{refs[i]}\t{alts[i]}\t.\tPASS\t.\tGT\t{gts[i - start]}\n"
+            lines.append(line)
+            if duplicate[i]:
+                lines.append(line)
+        yield "".join(lines)
+
+
+def generate_vcf(output, records=10000, samples=1, assembly="GRCh37", seed=0, duplicate_rate=0.0,
+                 multiallelic_rate=0.0, sex_chrom_rate=0.0, missing_id_rate=0.0, missing_gt_rate=0.0,
+                 chr_prefix="", index=False):
+    """Write a synthetic VCF with about `records` data lines; returns the path written."""
+    args = argparse.Namespace(samples=samples, duplicate_rate=duplicate_rate, multiallelic_rate=multiallelic_rate,
+                              missing_id_rate=missing_id_rate, missing_gt_rate=missing_gt_rate,
+                              chr_prefix=chr_prefix)
+    rng = np.random.default_rng(seed)
+    pgs = load_pgs_sites(assembly)
+
+    lengths = dict(zip([str(c) for c in range(1, 23)], CHROM_LENGTHS[assembly]))
+    filler = max(0, records - len(pgs))
+    sex_records = int(filler * sex_chrom_rate)
+    autosome_weights = np.array(list(lengths.values()), dtype=float)
+    counts = rng.multinomial(filler - sex_records, autosome_weights / autosome_weights.sum())
+    chroms = list(zip(lengths, lengths.values(), counts))
+    if sex_records:
+        sex_lengths = SEX_CHROM_LENGTHS[assembly]
+        chroms += [("X", sex_lengths["X"], sex_records - sex_records // 4), ("Y", sex_lengths["Y"], sex_records // 4)]
+
+    compressed = output.endswith((".gz", ".bgz"))
+    plain_path = output[:output.rindex(".")] if compressed else output
+    with open(plain_path, "w") as f:
+        f.write("##fileformat=VCFv4.2\n")
+        f.write(f"##source=RAdar synthetic benchmark VCF (seed={seed})\n")
+        f.write(f"##reference={assembly}\n")
+        for chrom, length, _ in chroms:
+            f.write(f"##contig=<ID={chr_prefix}{chrom},length={length}>\n")
+        f.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        sample_names = "\t".join(f"SAMPLE{i + 1}" for i in range(samples))
+        f.write(f"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{sample_names}\n")
+        id_offset = 900000000
+        for chrom, length, count in chroms:
+            for block in _chrom_records(rng, chrom, length, int(count), pgs, args, id_offset):
+                f.write(block)
+            id_offset += int(count)
+
+    if not compressed:
+        return output
+    if pysam is not None:
+        pysam.tabix_compress(plain_path, output, force=True)
+        if index:
+            pysam.tabix_index(output, preset="vcf", force=True)
+    else:
+        with open(plain_path, "rb") as src, gzip.open(output, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+    os.remove(plain_path)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", required=True, help=".vcf, or .vcf.gz to bgzip the result")
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=1)
+    parser.add_argument("--assembly", choices=sorted(CHROM_LENGTHS), default="GRCh37")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="fraction of records written twice")
+    parser.add_argument("--multiallelic-rate", type=float, default=0.0)
+    parser.add_argument("--sex-chrom-rate", type=float, default=0.0, help="fraction of records on chrX/chrY")
+    parser.add_argument("--missing-id-rate", type=float, default=0.0, help="fraction of records with ID '.'")
+    parser.add_argument("--missing-gt-rate", type=float, default=0.0, help="fraction of './.' calls")
+    parser.add_argument("--chr-prefix", default="", help="e.g. 'chr' for chr1, chr2, ...")
+    parser.add_argument("--index", action="store_true", help="write a .tbi index next to a .vcf.gz")
+    args = parser.parse_args()
+    path = generate_vcf(args.output, args.records, args.samples, args.assembly, args.seed, args.duplicate_rate,
+                        args.multiallelic_rate, args.sex_chrom_rate, args.missing_id_rate, args.missing_gt_rate,
+                        args.chr_prefix, args.index)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
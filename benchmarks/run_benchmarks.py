@@ -0,0 +1,194 @@
+"""
+Pipeline benchmarks on synthetic VCFs.
+
+Every case runs run_plink_pipeline in a fresh process on a VCF from
+generate_vcf.py and records the end-to-end wall time, the per-stage metrics of
+the job and the peak RSS of the service process and of bcftools/plink2.
+Results are written as JSON; with --baseline they are compared against an
+earlier result file and the run fails when a case got slower or bigger than
+--tolerance allows.
+
+    python benchmarks/run_benchmarks.py --sizes 10000,100000 --samples 1,8 -o bench.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json -o bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from generate_vcf import generate_vcf, load_pgs_sites
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+DRUG_ANNOTATIONS = os.path.join(REPO_ROOT, "input", "annotations", "drug_toxicity_annotations.tsv")
+
+
+def _run_case(vcf_path, assembly, engine, results):
+    # Runs in a fresh process so peak RSS belongs to this case only
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, SRC_DIR)
+    from metrics import JobMetrics
+    from score_registry import registry
+    from utils import run_plink_pipeline
+
+    registry.load()
+    metrics = JobMetrics()
+    start = time.perf_counter()
+    run_plink_pipeline(vcf_path, assembly, True, engine=engine, metrics=metrics)
+    wall = time.perf_counter() - start
+    results.put({
+        "wall_seconds": wall,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "child_peak_rss_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+        "stages": metrics.as_dict()["stages"],
+    })
+
+
+def run_case(vcf_path, assembly, engine):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_case, args=(vcf_path, assembly, engine, results))
+    process.start()
+    # Read before joining: a child blocks on exit until its queued result is consumed
+    while True:
+        alive = process.is_alive()
+        try:
+            result = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not alive:
+                process.join()
+                raise RuntimeError(f"{engine} pipeline failed on {vcf_path} (exit code {process.exitcode})")
+    process.join()
+    return result
+
+
+def summarize(name, params, runs):
+    stage_walls = {}
+    for run in runs:
+        for stage in run["stages"]:
+            stage_walls.setdefault(stage["stage"], []).append(stage["wall_seconds"])
+    return {
+        "name": name,
+        **params,
+        "repeats": len(runs),
+        "wall_seconds": round(statistics.median(r["wall_seconds"] for r in runs), 4),
+        "peak_rss_bytes": max(r["peak_rss_bytes"] for r in runs),
+        "child_peak_rss_bytes": max(r["child_peak_rss_bytes"] for r in runs),
+        "stage_wall_seconds": {stage: round(statistics.median(walls), 4) for stage, walls in stage_walls.items()},
+        "runs": runs,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of each case against `baseline`; returns the names of regressed cases."""
+    previous = {case["name"]: case for case in baseline["cases"]}
+    regressed = []
+    print(f"{'case':<40} {'wall':>10} {'base':>10} {'change':>8} {'peak MB':>9} {'base':>9} {'change':>8}")
+    for case in results["cases"]:
+        base = previous.get(case["name"])
+        if base is None:
+            print(f"{case['name']:<40} {case['wall_seconds']:>10.3f} {'-':>10}")
+            continue
+        wall_change = case["wall_seconds"] / base["wall_seconds"] - 1 if base["wall_seconds"] else 0.0
+        rss_change = case["peak_rss_bytes"] / base["peak_rss_bytes"] - 1 if base["peak_rss_bytes"] else 0.0
+        print(f"{case['name']:<40} {case['wall_seconds']:>10.3f} {base['wall_seconds']:>10.3f} {wall_change:>+8.1%} "
+              f"{case['peak_rss_bytes'] / 2 ** 20:>9.1f} {base['peak_rss_bytes'] / 2 ** 20:>9.1f} {rss_change:>+8.1%}")
+        if wall_change > tolerance or rss_change > tolerance:
+            regressed.append(case["name"])
+    return regressed
+
+
+def ensure_annotations(data_dir, assembly):
+    # The drug annotation table is not in the repository; fall back to a few PGS rsIDs
+    if os.path.exists(DRUG_ANNOTATIONS):
+        return DRUG_ANNOTATIONS
+    path = os.path.join(data_dir, "drug_toxicity_annotations.tsv")
+    with open(path, "w") as f:
+        f.write("Variant\tDrug\tAnnotation\n")
+        for rsid in load_pgs_sites(assembly)["id"].head(20):
+            f.write(f"{rsid}\tsynthetic\tbenchmark\n")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated record counts, up to 10000000")
+    parser.add_argument("--samples", default="1", help="comma-separated sample counts")
+    parser.add_argument("--engines", default=None, help="default: numpy, plus plink2 when bcftools/plink2 are installed")
+    parser.add_argument("--assembly", choices=("GRCh37", "GRCh38"), default="GRCh37")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-rate", type=float, default=0.001)
+    parser.add_argument("--multiallelic-rate", type=float, default=0.01)
+    parser.add_argument("--sex-chrom-rate", type=float, default=0.03)
+    parser.add_argument("--missing-id-rate", type=float, default=0.01)
+    parser.add_argument("--data-dir", default=None, help="keep generated VCFs here and reuse them across runs")
+    parser.add_argument("--baseline", default=None, help="result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown or growth")
+    args = parser.parse_args()
+
+    engines = args.engines.split(",") if args.engines else (
+        ["numpy", "plink2"] if shutil.which("plink2") and shutil.which("bcftools") else ["numpy"]
+    )
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="radar_bench_")
+    os.makedirs(data_dir, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix="radar_bench_out_")
+    os.environ.setdefault("PRS_RESULTS_DIR", os.path.join(scratch, "output"))
+    os.environ.setdefault("PRS_SCRATCH_DIR", scratch)
+    os.environ.setdefault("PRS_LOG_DIR", os.path.join(scratch, "log"))
+    os.environ.setdefault("PRS_DRUG_ANNOTATIONS", ensure_annotations(data_dir, args.assembly))
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "cases": [],
+    }
+    try:
+        for records in [int(size) for size in args.sizes.split(",")]:
+            for samples in [int(n) for n in args.samples.split(",")]:
+                vcf_path = os.path.join(data_dir, f"synthetic_{args.assembly}_{records}x{samples}_s{args.seed}.vcf.gz")
+                if not os.path.exists(vcf_path):
+                    print(f"Generating {vcf_path}...")
+                    generate_vcf(vcf_path, records, samples, args.assembly, args.seed, args.duplicate_rate,
+                                 args.multiallelic_rate, args.sex_chrom_rate, args.missing_id_rate)
+                for engine in engines:
+                    name = f"{engine}-{args.assembly}-{records}x{samples}"
+                    print(f"Running {name}...")
+                    runs = [run_case(vcf_path, args.assembly, engine) for _ in range(args.repeats)]
+                    params = {"engine": engine, "assembly": args.assembly, "records": records, "samples": samples,
+                              "vcf_bytes": os.path.getsize(vcf_path)}
+                    results["cases"].append(summarize(name, params, runs))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+        if regressed:
+            print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
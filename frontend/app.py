@@ -4,9 +4,11 @@ from dash import dcc, html
 from frontend.callbacks.callbacks import register_callbacks  # Remove the 's' from callbacks
 from frontend.ui_kit.styles import page_content_style
 from frontend.ui_kit.components.chat_popup import chat_popup
+from frontend.services.snp_images import snp_images
 
 app = dash.Dash(__name__, suppress_callback_exceptions=True, title="RAdar: Rheumatoid Arthritis Predictor", assets_folder="assets")
 server = app.server
+snp_images.register(server)
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
     dcc.Interval(id='interval-component', interval=5 * 60 * 1000),
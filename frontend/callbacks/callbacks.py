@@ -27,6 +27,7 @@ from frontend.layouts.sign_up_layout import sign_up_layout
 from frontend.ui_kit.components.error_message import error_message
 from frontend.ui_kit.components.navigation import navigation_bar
 from frontend.ui_kit.components.user_balance import user_balance
+from frontend.ui_kit.utils import VCF_SUFFIXES, vcf_head, vcf_sample_name
 
 from frontend.data.remote_data import send_chat_message
 import uuid
@@ -402,7 +403,7 @@ def register_callbacks(_app):
                 balance = fetch_user_balance(user_session=user_session)
                 visible_style = {**card_style, 'display': 'block'}
                 hidden_style = {**card_style, 'display': 'none'}
-                sample_name = filename.replace('.vcf', '') if filename.endswith('.vcf') else filename
+                sample_name = vcf_sample_name(filename)
                 return risk_results, create_variants_section(sample_name), user_balance(balance), visible_style, visible_style, visible_style, "", hidden_style, "", hidden_style, "", visible_style, user_session, reset_button_content
             
             plink_result, error = analyze_rheumatoid_arthritis_risk(decoded, filename, user_session)
@@ -412,30 +413,33 @@ def register_callbacks(_app):
                 balance = fetch_user_balance(user_session=user_session)
                 visible_style = {**card_style, 'display': 'block'}
                 hidden_style = {**card_style, 'display': 'none'}
-                sample_name = filename.replace('.vcf', '') if filename.endswith('.vcf') else filename
+                sample_name = vcf_sample_name(filename)
                 return risk_results, create_variants_section(sample_name), user_balance(balance), visible_style, visible_style, visible_style, "", hidden_style, "", hidden_style, "", visible_style, user_session, reset_button_content
             
             if plink_result and plink_result.get('status') == 'success':
-                plink_data = plink_result.get('results', [{}])[0] 
+                # The quantile table travels with the record so the PDF uses the same one
+                plink_data = {**plink_result.get('results', [{}])[0], 'distribution': plink_result.get('distribution')}
                 risk_results = create_risk_results(plink_data)
                 
-                sample_name = filename.replace('.vcf', '') if filename.endswith('.vcf') else filename
-                drug_annotation_content = create_drug_annotation_section(sample_name)
-                top_10_snps_content = create_top_10_snps_section(sample_name)
-                variants_section_content = create_variants_section(sample_name)
-                snp_dandelion_content = snp_dandelion_plot(sample_name)
+                sample_name = vcf_sample_name(filename)
+                results_dir = plink_result.get('results_dir', 'output')
+                drug_annotation_content = create_drug_annotation_section(sample_name, results_dir)
+                top_10_snps_content = create_top_10_snps_section(sample_name, results_dir)
+                variants_section_content = create_variants_section(sample_name, results_dir)
+                snp_dandelion_content = snp_dandelion_plot(sample_name, results_dir)
                 
                 # Store prediction data in session for PDF generation
                 updated_session = user_session.copy()
                 updated_session['latest_sample_id'] = sample_name
                 updated_session['latest_plink_data'] = plink_data
+                updated_session['latest_results_dir'] = results_dir
             else:
                 error_msg = plink_result.get('error', 'Unknown error')
                 risk_results = create_risk_results(error_message=error_msg)
                 balance = fetch_user_balance(user_session=user_session)
                 visible_style = {**card_style, 'display': 'block'}
                 hidden_style = {**card_style, 'display': 'none'}
-                sample_name = filename.replace('.vcf', '') if filename.endswith('.vcf') else filename
+                sample_name = vcf_sample_name(filename)
                 return risk_results, create_variants_section(sample_name), user_balance(balance), visible_style, visible_style, visible_style, "", hidden_style, "", hidden_style, "", visible_style, user_session, reset_button_content
             
         except Exception as e:
@@ -444,7 +448,7 @@ def register_callbacks(_app):
             balance = fetch_user_balance(user_session=user_session)
             visible_style = {**card_style, 'display': 'block'}
             hidden_style = {**card_style, 'display': 'none'}
-            sample_name = filename.replace('.vcf', '') if filename.endswith('.vcf') else filename
+            sample_name = vcf_sample_name(filename)
             return risk_results, create_variants_section(sample_name), user_balance(balance), visible_style, visible_style, visible_style, "", hidden_style, "", hidden_style, "", visible_style, user_session, reset_button_content
         
         balance = fetch_user_balance(user_session=user_session)
@@ -484,11 +488,12 @@ def register_callbacks(_app):
     def validate_vcf_file(filename, file_content):
         errors = []
         
-        if not filename.lower().endswith('.vcf'):
-            errors.append("File must have .vcf extension")
+        if not filename.lower().endswith(VCF_SUFFIXES):
+            errors.append("File must have .vcf, .vcf.gz or .vcf.bgz extension")
         
         try:
-            content_str = file_content.decode('utf-8', errors='replace')
+            # Compressed uploads are checked on their first inflated block only
+            content_str = vcf_head(file_content).decode('utf-8', errors='replace')
             lines = content_str.split('\n')
             
             if not any(line.startswith('##fileformat=VCF') for line in lines[:10]):
@@ -762,7 +767,9 @@ def register_callbacks(_app):
                 print("No sample_id or plink_data found in session")
                 raise PreventUpdate
             
-            pdf_b64 = pdf_generator.generate_pdf_report(plink_data, sample_id)
+            results_dir = user_session.get('latest_results_dir', 'output')
+            
+            pdf_b64 = pdf_generator.generate_pdf_report(plink_data, sample_id, results_dir)
             
             if pdf_b64:
                 return {
@@ -1,29 +1,33 @@
 import os
 import base64
+import time
 
 import requests
 
 API_URL = os.environ.get("API_URL", "http://localhost:8000/api")
 PLINK_API_URL = os.environ.get("PLINK_API_URL", "http://plink:5000")
+GENETIC_ANALYSIS_POLL_SECONDS = float(os.environ.get("GENETIC_ANALYSIS_POLL_SECONDS", "2"))
+GENETIC_ANALYSIS_TIMEOUT = float(os.environ.get("GENETIC_ANALYSIS_TIMEOUT", "900"))
+GENETIC_ANALYSIS_SCORES = [s for s in os.environ.get("GENETIC_ANALYSIS_SCORES", "PGS000195").split(",") if s]
 
 
 class APIClient:
     def __init__(self, base_url=API_URL):
         self.base_url = base_url
 
-    def _send_request(self, method, path, token=None, **kwargs):
+    def _send_request(self, method, path, token=None, timeout=300, **kwargs):  # 5 minute default timeout
         headers = kwargs.get('headers', {})
         if token:
             headers['Authorization'] = f'Bearer {token}'
-        response = requests.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+        response = requests.request(method, f"{self.base_url}{path}", headers=headers, timeout=timeout, **kwargs)
         response.raise_for_status()
         return response.json()
 
-    def get(self, path, token=None, **kwargs):
-        return self._send_request('GET', path, token=token, **kwargs)
+    def get(self, path, token=None, timeout=300, **kwargs):
+        return self._send_request('GET', path, token=token, timeout=timeout, **kwargs)
 
-    def post(self, path, token=None, **kwargs):
-        return self._send_request('POST', path, token=token, **kwargs)
+    def post(self, path, token=None, timeout=300, **kwargs):
+        return self._send_request('POST', path, token=token, timeout=timeout, **kwargs)
 
 
 api_client = APIClient()
@@ -101,7 +105,7 @@ def call_plink_prediction(vcf_filename):
     try:
         payload = {
             "vcf_file": f"vcf/{vcf_filename}",
-            "prs_file": "prs/PGS002769_hmPOS_GRCh38.txt"
+            "scores": GENETIC_ANALYSIS_SCORES
         }
         response = requests.post(f"{PLINK_API_URL}/predict", json=payload, timeout=300)
         response.raise_for_status()
@@ -111,19 +115,24 @@ def call_plink_prediction(vcf_filename):
 
 
 def analyze_rheumatoid_arthritis_risk(vcf_file_content, filename, user_session):
+    # Submits an analysis job and polls it until the worker has finished
     try:
         files = {
-            'vcf_file': (filename, vcf_file_content, 'text/plain')
+            'vcf_file': (filename, vcf_file_content, 'application/gzip' if filename.endswith(('.gz', '.bgz')) else 'text/plain')
         }
-        
-        response = requests.post(
-            f"{API_URL}/v1/genetic-analysis/analyze-rheumatoid-arthritis",
-            files=files,
-            headers={'Authorization': f'Bearer {user_session["access_token"]}'},
-            timeout=300
-        )
-        response.raise_for_status()
-        result = response.json()
+        token = user_session["access_token"]
+        job = api_client.post("/v1/genetic-analysis/jobs", token=token, files=files, timeout=300)
+
+        deadline = time.monotonic() + GENETIC_ANALYSIS_TIMEOUT
+        while job.get("status") in ("queued", "running"):
+            if time.monotonic() > deadline:
+                return None, f"Analysis is still {job['status']}, please check again later"
+            time.sleep(GENETIC_ANALYSIS_POLL_SECONDS)
+            job = api_client.get(f"/v1/genetic-analysis/jobs/{job['job_id']}", token=token, timeout=30)
+
+        if job.get("status") == "failed":
+            return None, job.get("error") or "Analysis failed"
+        result = api_client.get(f"/v1/genetic-analysis/jobs/{job['job_id']}/result", token=token, timeout=30)
         
         if result.get("status") == "success" and "analysis_result" in result:
             return result["analysis_result"], None
@@ -148,40 +157,6 @@ def get_genetic_analysis_cost():
         return 50  
 
 
-import os
-import base64
-import requests
-
-API_URL = os.environ.get("API_URL", "http://localhost:8000/api")
-PLINK_API_URL = os.environ.get("PLINK_API_URL", "http://plink:5000")
-
-
-class APIClient:
-    def __init__(self, base_url=API_URL):
-        self.base_url = base_url
-
-    def _send_request(self, method, path, token=None, timeout=300, **kwargs):  # 5 minute default timeout
-        headers = kwargs.get('headers', {})
-        if token:
-            headers['Authorization'] = f'Bearer {token}'
-        response = requests.request(
-            method, 
-            f"{self.base_url}{path}", 
-            headers=headers, 
-            timeout=timeout,  # Add timeout parameter
-            **kwargs
-        )
-        response.raise_for_status()
-        return response.json()
-
-    def get(self, path, token=None, timeout=300, **kwargs):
-        return self._send_request('GET', path, token=token, timeout=timeout, **kwargs)
-
-    def post(self, path, token=None, timeout=300, **kwargs):
-        return self._send_request('POST', path, token=token, timeout=timeout, **kwargs)
-
-api_client = APIClient()
-
 def send_chat_message(message, session_id):
     client = APIClient()
     response = client.post('/v1/chatbot/chat', 
@@ -185,7 +185,7 @@ def info_cards(app_name: str):
         html.Div([
             html.Div("Quick start", style=heading_style),
             html.Div([
-                html.Div("• Go to Analyze and upload your .vcf", style=text_style),
+                html.Div("• Go to Analyze and upload your .vcf or .vcf.gz", style=text_style),
                 html.Div("• Review matched SNPs and coverage", style=text_style),
                 html.Div("• See overall PRS and interpretation bands", style=text_style),
                 html.Div("• Export PDF summary for the chart/metrics", style=text_style),
@@ -4,11 +4,8 @@ import numpy as np
 import pandas as pd
 import plotly.express as px
 from statistics import quantiles
-from scipy.stats import percentileofscore
 import math
 import random
-import base64
-import os
 from pathlib import Path
 
 from frontend.data.remote_data import fetch_user_balance, fetch_prediction_history
@@ -16,6 +13,10 @@ from frontend.ui_kit.components.user_balance import user_balance
 from frontend.ui_kit.styles import table_style, table_header_style, table_cell_style, input_style, \
     dropdown_style, secondary_button_style, text_style, heading5_style, primary_button_style, \
     card_style, upload_style
+from frontend.services.score_distribution import load_score_distribution, percentile_of, population_scores, \
+    score_average
+from frontend.services.annotation_store import annotation_store
+from frontend.services.snp_images import snp_images
 from frontend.ui_kit.utils import format_timestamp
 
 risk_colors = {
@@ -45,6 +46,8 @@ def compute_risk_label(risk_percentile):
 
 def plot_normal_hist(risk, samples, risk_percentile):
     percentiles = quantiles(samples, n=10)
+    # Marker height follows the density scale of the score distribution
+    peak = float(np.histogram(samples, bins='auto', density=True)[0].max())
     hist = go.Histogram(
         x=samples,
         histnorm='probability density',
@@ -53,14 +56,14 @@ def plot_normal_hist(risk, samples, risk_percentile):
     )
     risk_line = go.Scatter(
         x=[risk, risk],
-        y=[0, 0.5],
+        y=[0, peak],
         mode='lines',
         name='Your Risk',
         line=dict(color='firebrick', dash='dash')
     )
     annotation = dict(
         x=risk,
-        y=0.5,
+        y=peak,
         text=f"<br>Percentile: {risk_percentile:.1f}%",
         showarrow=True,
         arrowhead=2,
@@ -93,7 +96,7 @@ def plot_normal_hist(risk, samples, risk_percentile):
 def genetic_upload_form():
     return html.Div([
         html.H3("Upload Genetic Data", style={'color': '#333', 'marginBottom': '15px'}),
-        html.P("Upload your sequencing data in VCF format", 
+        html.P("Upload your sequencing data in VCF format (.vcf or bgzipped .vcf.gz)", 
                style={'color': '#666', 'marginBottom': '10px'}),
         
         html.Div([
@@ -110,6 +113,7 @@ def genetic_upload_form():
                 html.Span(id='upload-text', children='Drag and Drop or Click to Select Genetic Data File', style={})
             ]),
             style=upload_style,
+            accept='.vcf,.gz,.bgz',
             multiple=False
         ),
         
@@ -135,7 +139,7 @@ def create_error_display(error_message):
         error_type = "Invalid VCF Format"
         description = "The uploaded file appears to be corrupted or is not a valid VCF format."
         suggestions = [
-            "Ensure your file is in VCF format (.vcf extension)",
+            "Ensure your file is in VCF format (.vcf, .vcf.gz or .vcf.bgz extension)",
             "Check that the file is not corrupted during upload",
             "Try re-downloading the original file from your genetic testing provider"
         ]
@@ -244,16 +248,14 @@ def create_risk_results(plink_data=None, error_message=None):
         return create_error_display(error_message)
     
     if plink_data:
-        risk = plink_data.get('score', 0.0)
         sample_id = plink_data.get('id', 'Unknown')
         snps_used = plink_data.get('number_of_alleles_detected', 0)
         
-        mean = 1.05
-        std_dev = 0.94 
-        
-        np.random.seed(0)
-        samples = np.random.normal(loc=mean, scale=std_dev, size=1000)
-        risk_percentile = percentileofscore(samples, risk, kind='weak')
+        levels, values = load_score_distribution(plink_data.get('distribution'))
+        samples = population_scores(values)
+        # The quantile tables hold SCORE1_AVG values, not the scaled `score`
+        risk_average = score_average(plink_data)
+        risk_percentile = percentile_of(risk_average, levels, values)
         risk_label = compute_risk_label(risk_percentile)
     else:
         return html.Div([
@@ -270,7 +272,7 @@ def create_risk_results(plink_data=None, error_message=None):
 
         html.Div([
             dcc.Graph(
-                figure=plot_normal_hist(risk, samples, risk_percentile),
+                figure=plot_normal_hist(risk_average, samples, risk_percentile),
                 config={'displayModeBar': False},
                 style={'flex': '2', 'minWidth': '400px'}
             ),
@@ -378,12 +380,11 @@ def format_links(link_str):
         formatted_links.append(f"[{i+1}]({url})")
     return ' '.join(formatted_links)
 
-def create_variants_section(sample):
-    csv_path = 'input/annotations/yet_another_final_PGS000195_metadata.csv'
-    tsv_path = f'output/{sample}_final_prs_table.tsv'
+def create_variants_section(sample, results_dir='output'):
+    tsv_path = f'{results_dir}/{sample}_final_prs_table.tsv'
 
-    df_metadata = pd.read_csv(csv_path)
     df_snps = pd.read_csv(tsv_path, sep='\t')
+    df_metadata = annotation_store.metadata(df_snps['rsid'])
 
     df = pd.merge(df_metadata, df_snps, left_on='rsID', right_on='rsid', how='inner')
 
@@ -473,8 +474,8 @@ def create_variants_section(sample):
     ])
 
 
-def snp_dandelion_plot(sample):
-    tsv_path = f'output/{sample}_final_prs_table.tsv'
+def snp_dandelion_plot(sample, results_dir='output'):
+    tsv_path = f'{results_dir}/{sample}_final_prs_table.tsv'
     try:
         df = pd.read_csv(tsv_path, sep='\t')
         df_sorted = df.sort_values('effect_size', ascending=False).head(3)
@@ -486,8 +487,6 @@ def snp_dandelion_plot(sample):
         image_components = []
         
         for i, rs_id in enumerate(top_rs_ids):
-            image_path = f'input/images/{rs_id}.png'
-            annotation_path = f'input/annotations/snps_annotations/{rs_id}.tsv'
             
             snp_components = []
             
@@ -507,13 +506,12 @@ def snp_dandelion_plot(sample):
                 })
             ])
             
-            if os.path.exists(image_path):
-                with open(image_path, 'rb') as f:
-                    encoded_image = base64.b64encode(f.read()).decode('ascii')
-                
+            image_props = snp_images.img_props(rs_id)
+            if image_props:
                 snp_components.append(
                     html.Img(
-                        src=f'data:image/png;base64,{encoded_image}',
+                        **image_props,
+                        alt=f"SNP plot for {rs_id}",
                         style={
                             'width': '100%', 
                             'maxWidth': '800px', 
@@ -543,10 +541,9 @@ def snp_dandelion_plot(sample):
                     })
                 )
             
-            if os.path.exists(annotation_path):
+            annotation_df = annotation_store.snp_annotations(rs_id)
+            if annotation_df is not None:
                 try:
-                    annotation_df = pd.read_csv(annotation_path, sep='\t')
-                    
                     if 'NCBI Gene Page' in annotation_df.columns:
                         annotation_df['NCBI Gene Page'] = annotation_df['NCBI Gene Page'].apply(
                             lambda x: f"[Link]({x})" if pd.notna(x) and str(x).startswith('http') else x
@@ -671,9 +668,9 @@ def snp_dandelion_plot(sample):
 
 
 
-def create_top_10_snps_section(sample):
+def create_top_10_snps_section(sample, results_dir='output'):
     
-    tsv_path = f'output/{sample}_final_prs_table.tsv'
+    tsv_path = f'{results_dir}/{sample}_final_prs_table.tsv'
     
     try:
         if not tsv_path:
@@ -821,8 +818,8 @@ def create_top_10_snps_section(sample):
 #         ]
 #     )
 
-def create_drug_annotation_section(sample):
-    csv_path = f'output/{sample}_intersection_with_drug_annotation.csv'
+def create_drug_annotation_section(sample, results_dir='output'):
+    csv_path = f'{results_dir}/{sample}_intersection_with_drug_annotation.csv'
     
     try:
         if not Path(csv_path).exists():
@@ -0,0 +1,215 @@
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+METADATA_CSV = os.environ.get("ANNOTATION_METADATA_CSV", "input/annotations/yet_another_final_PGS000195_metadata.csv")
+SNP_ANNOTATIONS_DIR = os.environ.get("ANNOTATION_SNPS_DIR", "input/annotations/snps_annotations")
+ANNOTATION_STORE_PATH = os.environ.get("ANNOTATION_STORE_PATH", "output/.annotations.sqlite")
+# How often a process re-checks the source files for changes
+ANNOTATION_STORE_CHECK_SECONDS = float(os.environ.get("ANNOTATION_STORE_CHECK_SECONDS", "5"))
+ANNOTATION_STORE_MMAP_MB = int(os.environ.get("ANNOTATION_STORE_MMAP_MB", "256"))
+
+SCHEMA_VERSION = "1"
+# SQLite's default limit on bound parameters is 999
+_LOOKUP_CHUNK = 900
+
+
+def _frame(columns, rows):
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _rows_json(df):
+    # NaN becomes null and numpy scalars plain JSON numbers, at full double precision
+    return json.loads(df.to_json(orient="values", double_precision=15))
+
+
+class AnnotationStore:
+    """
+    The per-variant metadata CSV and the per-SNP annotation TSVs compiled into one
+    SQLite file, indexed by rsID. Every Dash worker opens it read-only and memory
+    mapped, so the pages are shared through the OS page cache and a lookup is one
+    index probe instead of a CSV parse. When the sources change the file is rebuilt
+    under a temporary name and renamed over the old one; open connections keep
+    reading the old file until their next freshness check.
+    """
+
+    def __init__(self, path=ANNOTATION_STORE_PATH, metadata_csv=METADATA_CSV, snps_dir=SNP_ANNOTATIONS_DIR,
+                 check_seconds=ANNOTATION_STORE_CHECK_SECONDS):
+        self.path = path
+        self.metadata_csv = metadata_csv
+        self.snps_dir = snps_dir
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._checked = 0.0
+        self._signature = None
+        self.builds = 0
+
+    def source_signature(self):
+        """Hash of the names, sizes and mtimes of the source files."""
+        digest = hashlib.sha256(SCHEMA_VERSION.encode())
+        if os.path.exists(self.metadata_csv):
+            stat = os.stat(self.metadata_csv)
+            digest.update(f"metadata\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        if os.path.isdir(self.snps_dir):
+            with os.scandir(self.snps_dir) as entries:
+                for entry in sorted((e for e in entries if e.name.endswith(".tsv")), key=lambda e: e.name):
+                    stat = entry.stat()
+                    digest.update(f"{entry.name}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        return digest.hexdigest()
+
+    def _stored_signature(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            connection = self._open()
+            try:
+                row = connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            finally:
+                connection.close()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    def build(self, signature=None):
+        """Compile the sources into a new store file and rename it over the current one."""
+        signature = signature or self.source_signature()
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, partial = tempfile.mkstemp(prefix=".annotations.", suffix=".partial", dir=directory)
+        os.close(fd)
+        try:
+            connection = sqlite3.connect(partial)
+            try:
+                self._write(connection, signature)
+                connection.commit()
+            finally:
+                connection.close()
+            os.chmod(partial, 0o644)
+            os.replace(partial, self.path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        with self._lock:
+            self.builds += 1
+
+    def _write(self, connection, signature):
+        connection.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE metadata (rsid TEXT, row TEXT);
+            CREATE TABLE snp_annotations (rsid TEXT PRIMARY KEY, columns TEXT, rows TEXT);
+        """)
+        meta = {"signature": signature, "schema": SCHEMA_VERSION, "created": str(time.time())}
+        if os.path.exists(self.metadata_csv):
+            df = pd.read_csv(self.metadata_csv)
+            meta["metadata_columns"] = json.dumps([str(c) for c in df.columns])
+            rsids = df["rsID"].astype(str) if "rsID" in df.columns else pd.Series([""] * len(df))
+            connection.executemany(
+                "INSERT INTO metadata (rsid, row) VALUES (?, ?)",
+                ((rsid.lower(), json.dumps(row)) for rsid, row in zip(rsids, _rows_json(df)))
+            )
+        connection.execute("CREATE INDEX metadata_rsid ON metadata (rsid)")
+        if os.path.isdir(self.snps_dir):
+            for name in sorted(os.listdir(self.snps_dir)):
+                if not name.endswith(".tsv"):
+                    continue
+                df = pd.read_csv(os.path.join(self.snps_dir, name), sep="\t")
+                connection.execute(
+                    "INSERT OR REPLACE INTO snp_annotations (rsid, columns, rows) VALUES (?, ?, ?)",
+                    (name[:-len(".tsv")].lower(), json.dumps([str(c) for c in df.columns]), json.dumps(_rows_json(df)))
+                )
+        connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+
+    def _open(self):
+        # immutable: the file is never written in place, only replaced by a rename
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        connection.execute(f"PRAGMA mmap_size = {ANNOTATION_STORE_MMAP_MB * 1024 * 1024}")
+        return connection
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked < self.check_seconds:
+            return
+        signature = self.source_signature()
+        if signature != self._signature or not os.path.exists(self.path):
+            if self._stored_signature() != signature:
+                # One builder at a time across worker processes; the others wait and reuse its file
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(f"{self.path}.lock", "w") as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    if self._stored_signature() != signature:
+                        self.build(signature)
+            with self._lock:
+                self._signature = signature
+        self._checked = now
+
+    def _connection(self):
+        self._ensure_current()
+        local = self._local
+        if getattr(local, "signature", None) != self._signature:
+            if getattr(local, "connection", None) is not None:
+                local.connection.close()
+            local.connection = self._open()
+            local.signature = self._signature
+        return local.connection
+
+    def _meta(self, connection, key):
+        row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def has_metadata(self):
+        return self._meta(self._connection(), "metadata_columns") is not None
+
+    def metadata(self, rsids=None):
+        """
+        Rows of the metadata CSV, in file order: all of them, or those whose rsID is in
+        `rsids`. Raises FileNotFoundError when there is no metadata CSV.
+        """
+        connection = self._connection()
+        columns = self._meta(connection, "metadata_columns")
+        if columns is None:
+            raise FileNotFoundError(self.metadata_csv)
+        if rsids is None:
+            rows = connection.execute("SELECT row FROM metadata ORDER BY rowid").fetchall()
+        else:
+            keys = sorted({str(rsid).lower() for rsid in rsids})
+            found = []
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start:start + _LOOKUP_CHUNK]
+                found += connection.execute(
+                    f"SELECT rowid, row FROM metadata WHERE rsid IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+            rows = [(row,) for _, row in sorted(found)]
+        return _frame(json.loads(columns), [json.loads(row) for row, in rows])
+
+    def snp_annotations(self, rsid):
+        """The annotation TSV of one SNP as a DataFrame, or None when there is none."""
+        row = self._connection().execute(
+            "SELECT columns, rows FROM snp_annotations WHERE rsid = ?", (str(rsid).lower(),)
+        ).fetchone()
+        if row is None:
+            return None
+        return _frame(json.loads(row[0]), json.loads(row[1]))
+
+    def stats(self):
+        connection = self._connection()
+        return {
+            "path": self.path,
+            "bytes": os.path.getsize(self.path),
+            "metadata_rows": connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0],
+            "snp_annotations": connection.execute("SELECT COUNT(*) FROM snp_annotations").fetchone()[0],
+            "builds": self.builds,
+        }
+
+
+annotation_store = AnnotationStore()
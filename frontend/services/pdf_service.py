@@ -24,8 +24,9 @@ from frontend.layouts.prediction_layout import (
     risk_colors
 )
 from statistics import quantiles
-from scipy.stats import percentileofscore
-import numpy as np
+from frontend.services.score_distribution import load_score_distribution, percentile_of, population_scores, \
+    score_average
+from frontend.services.annotation_store import annotation_store
 
 
 class PDFReportGenerator:
@@ -47,17 +48,17 @@ class PDFReportGenerator:
             textColor=colors.HexColor('#007bff')
         )
         
-    def generate_pdf_report(self, plink_data, sample_id):
+    def generate_pdf_report(self, plink_data, sample_id, results_dir='output'):
         try:
             risk = plink_data.get('score', 0.0)
             snps_used = plink_data.get('number_of_alleles_detected', 0)
             snps_total = plink_data.get('number_of_alleles_observed', 0)
             
-            mean = 1.05
-            std_dev = 0.94
-            np.random.seed(0)
-            samples = np.random.normal(loc=mean, scale=std_dev, size=1000)
-            risk_percentile = percentileofscore(samples, risk, kind='weak')
+            levels, values = load_score_distribution(plink_data.get('distribution'))
+            samples = population_scores(values)
+            # The quantile tables hold SCORE1_AVG values, not the scaled `score`
+            risk_average = score_average(plink_data)
+            risk_percentile = percentile_of(risk_average, levels, values)
             risk_label = compute_risk_label(risk_percentile)
             
             with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
@@ -101,7 +102,7 @@ class PDFReportGenerator:
                 
                 # Risk distribution plot
                 try:
-                    risk_plot_img = self._generate_risk_plot(risk, samples, risk_percentile)
+                    risk_plot_img = self._generate_risk_plot(risk_average, samples, risk_percentile)
                     if risk_plot_img:
                         story.append(Paragraph("Risk Distribution", self.heading_style))
                         story.append(Paragraph("This chart shows where your risk score falls within the population distribution.", self.styles['Normal']))
@@ -113,7 +114,7 @@ class PDFReportGenerator:
                 
                 # Scatter plot
                 try:
-                    scatter_plot_img = self._generate_scatter_plot(sample_id)
+                    scatter_plot_img = self._generate_scatter_plot(sample_id, results_dir)
                     if scatter_plot_img:
                         story.append(Paragraph("PRS Effect Weights Across Genome", self.heading_style))
                         story.append(Paragraph("This scatter plot shows the effect weights of genetic variants across the genome. Red points indicate variants present in your genetic data.", self.styles['Normal']))
@@ -125,7 +126,7 @@ class PDFReportGenerator:
                 
                 # Top SNPs table
                 try:
-                    top_snps_data = self._get_top_snps_data(sample_id)
+                    top_snps_data = self._get_top_snps_data(sample_id, results_dir)
                     if top_snps_data:
                         story.append(Paragraph("Top 10 Most Influential SNPs", self.heading_style))
                         story.append(Paragraph("These are the genetic variants with the highest effect sizes in your risk calculation.", self.styles['Normal']))
@@ -160,7 +161,7 @@ class PDFReportGenerator:
                 
                 # Drug interactions table
                 try:
-                    drug_data = self._get_drug_annotation_data(sample_id)
+                    drug_data = self._get_drug_annotation_data(sample_id, results_dir)
                     if drug_data:
                         story.append(Paragraph("Drug-Gene Interactions", self.heading_style))
                         story.append(Paragraph("These genetic variants may affect drug efficacy and toxicity.", self.styles['Normal']))
@@ -250,7 +251,7 @@ class PDFReportGenerator:
             print(f"Error generating risk plot: {str(e)}")
             return None
     
-    def _generate_scatter_plot(self, sample_id):
+    def _generate_scatter_plot(self, sample_id, results_dir='output'):
         try:
             # Check if kaleido is available for image export
             try:
@@ -261,13 +262,12 @@ class PDFReportGenerator:
                 
             import plotly.express as px
             
-            csv_path = 'input/annotations/yet_another_final_PGS000195_metadata.csv'
-            tsv_path = f'output/{sample_id}_final_prs_table.tsv'
+            tsv_path = f'{results_dir}/{sample_id}_final_prs_table.tsv'
             
-            if not (Path(csv_path).exists() and Path(tsv_path).exists()):
+            if not (annotation_store.has_metadata() and Path(tsv_path).exists()):
                 return None
             
-            df = pd.read_csv(csv_path)
+            df = annotation_store.metadata()
             df_snps = pd.read_csv(tsv_path, sep='\t')
             
             df['is_in_sample'] = df['rsID'].isin(df_snps['rsid'])
@@ -302,9 +302,9 @@ class PDFReportGenerator:
             print(f"Error generating scatter plot: {str(e)}")
             return None
     
-    def _get_top_snps_data(self, sample_id):
+    def _get_top_snps_data(self, sample_id, results_dir='output'):
         try:
-            tsv_path = f'output/{sample_id}_final_prs_table.tsv'
+            tsv_path = f'{results_dir}/{sample_id}_final_prs_table.tsv'
             if not Path(tsv_path).exists():
                 return []
             
@@ -319,9 +319,9 @@ class PDFReportGenerator:
             print(f"Error getting top SNPs data: {str(e)}")
             return []
     
-    def _get_drug_annotation_data(self, sample_id):
+    def _get_drug_annotation_data(self, sample_id, results_dir='output'):
         try:
-            csv_path = f'output/{sample_id}_intersection_with_drug_annotation.csv'
+            csv_path = f'{results_dir}/{sample_id}_intersection_with_drug_annotation.csv'
             if not Path(csv_path).exists():
                 return []
             
@@ -0,0 +1,62 @@
+import json
+import os
+from bisect import bisect_right
+from functools import lru_cache
+from statistics import NormalDist
+
+# Used when the plink service did not send a quantile table for the score file: the
+# HWE mean and standard deviation of PGS000195's SCORE1_AVG
+FALLBACK_MEAN = 0.0156
+FALLBACK_STD_DEV = 0.0042
+QUANTILE_POINTS = 1001
+
+
+@lru_cache(maxsize=1)
+def fallback_distribution():
+    # Normal quantiles, exact and without touching any random number generator
+    normal = NormalDist(FALLBACK_MEAN, FALLBACK_STD_DEV)
+    levels = [i / (QUANTILE_POINTS - 1) for i in range(QUANTILE_POINTS)]
+    values = [normal.inv_cdf(min(max(level, 1e-6), 1 - 1e-6)) for level in levels]
+    return levels, values
+
+
+@lru_cache(maxsize=16)
+def _load_table(path):
+    # Table files are named after the score file content, so caching by path is safe
+    with open(path) as f:
+        table = json.load(f)
+    return table["levels"], table["values"]
+
+
+def load_score_distribution(path=None):
+    """(levels, values) quantile table written by the plink service, or the fallback normal table."""
+    if path and os.path.exists(path):
+        return _load_table(path)
+    return fallback_distribution()
+
+
+def score_average(plink_data):
+    """
+    SCORE1_AVG of a result, the scale of the quantile tables. The result's `score` is
+    SCORE1_AVG times NAMED_ALLELE_DOSAGE_SUM (`number_of_alleles_detected`).
+    """
+    score = plink_data.get('score', 0.0)
+    detected = plink_data.get('number_of_alleles_detected', 0)
+    return score / detected if detected else 0.0
+
+
+def percentile_of(score, levels, values):
+    """Percent of the population scoring at or below `score`, by binary search in the quantile table."""
+    i = bisect_right(values, score)
+    if i == 0:
+        return 0.0
+    if i == len(values):
+        return 100.0
+    low, high = values[i - 1], values[i]
+    fraction = (score - low) / (high - low) if high > low else 0.0
+    return 100.0 * (levels[i - 1] + fraction * (levels[i] - levels[i - 1]))
+
+
+def population_scores(values):
+    # Inner quantiles are equally likely, so they stand in for a population sample in histograms
+    return values[1:-1]
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from flask import abort, send_file
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+SNP_IMAGES_DIR = os.environ.get("SNP_IMAGES_DIR", "input/images")
+SNP_IMAGE_CACHE_DIR = os.environ.get("SNP_IMAGE_CACHE_DIR", "output/.snp_images")
+# Display widths pre-generated when Pillow is available; the layout picks one through srcset
+SNP_IMAGE_WIDTHS = (400, 800)
+SNP_IMAGE_ROUTE = "/snp-images"
+# URLs carry the content hash, so a response never goes stale
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+_RSID = re.compile(r"[A-Za-z0-9_-]+")
+_NAME = re.compile(r"(?P<rsid>[A-Za-z0-9_-]+)\.(?P<digest>[0-9a-f]{12})(?:\.(?P<width>\d+))?\.(?P<fmt>png|webp)")
+_MIMETYPES = {"png": "image/png", "webp": "image/webp"}
+
+
+class SnpImages:
+    """
+    SNP plot images from `input/images/{rsid}.png` served by URL instead of inlined as
+    base64. URLs name the source's content hash, and responses carry an ETag and a
+    year-long immutable Cache-Control, so the browser fetches each image once. With
+    Pillow, WebP and PNG copies at SNP_IMAGE_WIDTHS are generated into the cache
+    directory ahead of the first request.
+    """
+
+    def __init__(self, images_dir=SNP_IMAGES_DIR, cache_dir=SNP_IMAGE_CACHE_DIR, widths=SNP_IMAGE_WIDTHS):
+        self.images_dir = images_dir
+        self.cache_dir = cache_dir
+        self.widths = tuple(widths)
+        self._lock = threading.Lock()
+        self._digests = {}
+
+    @property
+    def resizable(self):
+        return Image is not None
+
+    def source_path(self, rsid):
+        return os.path.join(self.images_dir, f"{rsid}.png")
+
+    def digest(self, rsid):
+        """Content hash of the source image, or None when there is none; cached per mtime and size."""
+        if not _RSID.fullmatch(str(rsid)):
+            return None
+        path = self.source_path(rsid)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()[:12]
+        with self._lock:
+            self._digests[path] = (key, digest)
+        return digest
+
+    def url(self, rsid, width=None, fmt="png"):
+        digest = self.digest(rsid)
+        if digest is None:
+            return None
+        if width is None or not self.resizable:
+            return f"{SNP_IMAGE_ROUTE}/{rsid}.{digest}.png"
+        return f"{SNP_IMAGE_ROUTE}/{rsid}.{digest}.{width}.{fmt}"
+
+    def img_props(self, rsid):
+        """src/srcSet/sizes for an html.Img of the SNP's plot, or None when there is no image."""
+        if self.digest(rsid) is None:
+            return None
+        if not self.resizable:
+            return {"src": self.url(rsid)}
+        return {
+            "src": self.url(rsid, max(self.widths), "webp"),
+            "srcSet": ", ".join(f"{self.url(rsid, width, 'webp')} {width}w" for width in self.widths),
+            "sizes": f"(max-width: {max(self.widths)}px) 100vw, {max(self.widths)}px",
+        }
+
+    def variant_path(self, rsid, digest, width, fmt):
+        """Path of a resized copy, generated on first use and named after the source hash."""
+        path = os.path.join(self.cache_dir, f"{rsid}.{digest}.{width}.{fmt}")
+        if os.path.exists(path):
+            return path
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with Image.open(self.source_path(rsid)) as image:
+            image = image.convert("RGBA") if fmt == "webp" else image.copy()
+            if image.width > width:
+                image.thumbnail((width, image.height * width // image.width), Image.LANCZOS)
+            fd, partial = tempfile.mkstemp(prefix=f".{rsid}.", suffix=".partial", dir=self.cache_dir)
+            with os.fdopen(fd, "wb") as f:
+                if fmt == "webp":
+                    image.save(f, "WEBP", quality=80, method=6)
+                else:
+                    image.save(f, "PNG", optimize=True)
+        os.chmod(partial, 0o644)
+        os.replace(partial, path)
+        return path
+
+    def pregenerate(self):
+        """Generate every width and format of every source image; returns the number written or found."""
+        if not self.resizable or not os.path.isdir(self.images_dir):
+            return 0
+        count = 0
+        for name in sorted(os.listdir(self.images_dir)):
+            rsid, ext = os.path.splitext(name)
+            digest = self.digest(rsid) if ext == ".png" else None
+            if digest is None:
+                continue
+            for width in self.widths:
+                for fmt in _MIMETYPES:
+                    try:
+                        self.variant_path(rsid, digest, width, fmt)
+                        count += 1
+                    except OSError as e:
+                        print(f"Could not generate {rsid} at {width}px as {fmt}: {e}")
+        return count
+
+    def response(self, name):
+        match = _NAME.fullmatch(name)
+        if not match:
+            abort(404)
+        rsid, digest, width, fmt = match.group("rsid", "digest", "width", "fmt")
+        # An old hash means the layout that asked for it is stale; its image is gone
+        if self.digest(rsid) != digest:
+            abort(404)
+        if width is None:
+            if fmt != "png":
+                abort(404)
+            path, etag = self.source_path(rsid), digest
+        else:
+            if int(width) not in self.widths or not self.resizable:
+                abort(404)
+            path, etag = self.variant_path(rsid, digest, int(width), fmt), f"{digest}.{width}.{fmt}"
+        response = send_file(os.path.abspath(path), mimetype=_MIMETYPES[fmt], conditional=True, etag=etag)
+        response.headers["Cache-Control"] = f"public, max-age={CACHE_MAX_AGE}, immutable"
+        return response
+
+    def register(self, server):
+        """Add the image route to the Dash app's Flask server and pre-generate the copies in the background."""
+        server.add_url_rule(f"{SNP_IMAGE_ROUTE}/<name>", "snp_image", self.response)
+        threading.Thread(target=self.pregenerate, name="snp-image-pregenerate", daemon=True).start()
+
+
+snp_images = SnpImages()
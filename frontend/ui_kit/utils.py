@@ -1,7 +1,11 @@
+import zlib
 from datetime import datetime
 
 import pytz
 
+VCF_SUFFIXES = ('.vcf', '.vcf.gz', '.vcf.bgz')
+GZIP_MAGIC = b'\x1f\x8b'
+
 
 # Default timezone is 'Europe/Moscow'
 def format_timestamp(timestamp_str, timezone='Europe/Moscow'):
@@ -9,3 +13,26 @@ def format_timestamp(timestamp_str, timezone='Europe/Moscow'):
     utc_time = utc_time.replace(tzinfo=pytz.UTC)
     local_time = utc_time.astimezone(pytz.timezone(timezone))
     return local_time.strftime('%B %d, %Y, %H:%M')
+
+
+def vcf_sample_name(filename):
+    for suffix in VCF_SUFFIXES[::-1]:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+def vcf_head(file_content, size=1024 * 1024):
+    # First `size` bytes of a VCF, inflating only as much of a (b)gzipped upload as needed.
+    # BGZF files are a series of gzip members, so decompression continues past member ends.
+    if not file_content.startswith(GZIP_MAGIC):
+        return file_content[:size]
+    head = b''
+    data = file_content
+    while data and len(head) < size:
+        inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        head += inflater.decompress(data, size - len(head))
+        if not inflater.eof:
+            break
+        data = inflater.unused_data
+    return head
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+import pandas as pd
+
+from site_index import has_annotation_positions
+from vcf_io import iter_vcf_lines
+
+# Reference VCF with the rsIDs and positions of the build (dbSNP, or any subset of it);
+# "{assembly}" in the path is replaced by GRCh37 or GRCh38
+ANNOTATION_SITES_VCF = os.environ.get("PRS_ANNOTATION_SITES_VCF", "")
+ANNOTATION_SITES_DIR = os.environ.get("PRS_ANNOTATION_SITES_DIR", "output/.annotation_sites")
+
+_COLUMNS = ["Variant", "chrom", "pos", "ref", "alt"]
+
+
+class AnnotationSites:
+    """
+    Positions of the drug annotation rsIDs, looked up in a reference sites VCF so an
+    indexed upload can be read by region fetch when the annotation table names its
+    variants by rsID only. The reference is read once per set of rsIDs, reference
+    file and build; the sites found are kept in memory and under `directory`.
+    """
+
+    def __init__(self, sites_vcf=ANNOTATION_SITES_VCF, directory=ANNOTATION_SITES_DIR):
+        self.sites_vcf = sites_vcf
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._sites = {}
+        self.lookups = 0
+
+    def reference_for(self, assembly):
+        if not self.sites_vcf or not assembly:
+            return None
+        path = self.sites_vcf.replace("{assembly}", assembly)
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def _key(rsids, reference, assembly):
+        stat = os.stat(reference)
+        digest = hashlib.sha256(
+            f"{os.path.abspath(reference)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{assembly}\0".encode()
+        )
+        digest.update("\n".join(sorted(rsids)).encode())
+        return digest.hexdigest()
+
+    def locate(self, annotations, assembly):
+        """
+        `annotations` with chrom, pos, ref and alt columns from the reference for the
+        rsIDs it has, for SiteIndex.add_annotations. Returned unchanged when the table
+        has its own positions or there is no reference for `assembly`.
+        """
+        reference = self.reference_for(assembly)
+        if reference is None or has_annotation_positions(annotations):
+            return annotations
+        sites = self.sites(set(annotations["Variant"]), reference, assembly)
+        return annotations.merge(sites, on="Variant", how="left")
+
+    def sites(self, rsids, reference, assembly):
+        """DataFrame of _COLUMNS for the (lower-case) `rsids` found in `reference`."""
+        key = self._key(rsids, reference, assembly)
+        with self._lock:
+            sites = self._sites.get(key)
+        if sites is not None:
+            return sites
+        path = os.path.join(self.directory, f"{key}.tsv")
+        if os.path.exists(path):
+            sites = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+        else:
+            sites = self._scan(rsids, reference)
+            self._write(sites, path)
+        with self._lock:
+            self._sites[key] = sites
+        return sites
+
+    def _scan(self, rsids, reference):
+        found = {}
+        lines = iter_vcf_lines(reference)
+        try:
+            for line in lines:
+                if line.startswith("#"):
+                    continue
+                fields = line.split("\t", 5)
+                if len(fields) < 5:
+                    continue
+                for rsid in fields[2].lower().split(";"):
+                    if rsid in rsids and rsid not in found:
+                        # Multi-allelic reference sites give the position only
+                        alt = fields[4] if "," not in fields[4] else ""
+                        found[rsid] = (rsid, fields[0], fields[1], fields[3] if alt else "", alt)
+                if len(found) == len(rsids):
+                    break
+        finally:
+            lines.close()
+        with self._lock:
+            self.lookups += 1
+        return pd.DataFrame(list(found.values()), columns=_COLUMNS)
+
+    def _write(self, sites, path):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, partial = tempfile.mkstemp(prefix=".sites.", suffix=".partial", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            sites.to_csv(f, sep="\t", index=False)
+        os.chmod(partial, 0o644)
+        os.replace(partial, path)
+
+
+annotation_sites = AnnotationSites()
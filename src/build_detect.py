@@ -0,0 +1,131 @@
+import os
+import re
+
+from score_registry import registry
+from vcf_io import iter_vcf_lines, normalize_chrom
+
+ASSEMBLIES = ("GRCh37", "GRCh38")
+AUTO_ASSEMBLY = "auto"
+# Used when neither the header nor the sampled records tell the builds apart
+DEFAULT_ASSEMBLY = os.environ.get("PRS_DEFAULT_ASSEMBLY", "GRCh37")
+DETECT_MAX_RECORDS = int(os.environ.get("PRS_DETECT_MAX_RECORDS", "5000"))
+# Lead in score-site hits over the other build, with a clear majority, that stops sampling early
+DETECT_MIN_VOTES = int(os.environ.get("PRS_DETECT_MIN_VOTES", "5"))
+
+CONTIG_LENGTHS = {
+    "GRCh37": dict(zip(
+        [str(c) for c in range(1, 23)] + ["X", "Y"],
+        [249250621, 243199373, 198022430, 191154276, 180915260, 171115067, 159138663, 146364022,
+         141213431, 135534747, 135006516, 133851895, 115169878, 107349540, 102531392, 90354753,
+         81195210, 78077248, 59128983, 63025520, 48129895, 51304566, 155270560, 59373566]
+    )),
+    "GRCh38": dict(zip(
+        [str(c) for c in range(1, 23)] + ["X", "Y"],
+        [248956422, 242193529, 198295559, 190214555, 181538259, 170805979, 159345973, 145138636,
+         138394717, 133797422, 135086622, 133275309, 114364328, 107043718, 101991189, 90338345,
+         83257441, 80373285, 58617616, 64444167, 46709983, 50818468, 156040895, 57227415]
+    )),
+}
+REFERENCE_NAMES = (
+    ("GRCh38", re.compile(r"grch38|hg38|b38|hs38|gca_000001405\.15", re.IGNORECASE)),
+    ("GRCh37", re.compile(r"grch37|hg19|b37|hs37|g1k_v37|gca_000001405\.1\b", re.IGNORECASE)),
+)
+_CONTIG = re.compile(r"##contig=<(.*)>")
+
+
+def header_assembly(header_lines):
+    """
+    Build named by the header: contig lengths first, then the ##reference/##assembly
+    line. Returns (assembly or None, method, evidence).
+    """
+    hits = {assembly: 0 for assembly in ASSEMBLIES}
+    for line in header_lines:
+        match = _CONTIG.match(line)
+        if not match:
+            continue
+        fields = dict(part.split("=", 1) for part in match.group(1).split(",") if "=" in part)
+        chrom, length = normalize_chrom(fields.get("ID", "")), fields.get("length", "")
+        if not length.isdigit():
+            continue
+        for assembly in ASSEMBLIES:
+            if CONTIG_LENGTHS[assembly].get(chrom) == int(length):
+                hits[assembly] += 1
+    if bool(hits["GRCh37"]) != bool(hits["GRCh38"]):
+        return max(hits, key=hits.get), "header_contigs", hits
+
+    for line in header_lines:
+        if line.startswith(("##reference=", "##assembly=")):
+            for assembly, pattern in REFERENCE_NAMES:
+                if pattern.search(line):
+                    return assembly, "header_reference", {"line": line.strip()[:200]}
+    return None, None, hits
+
+
+def _score_site_positions():
+    positions = {}
+    for assembly in ASSEMBLIES:
+        sites = set()
+        for entry in registry.entries(assembly):
+            sites.update(registry.get(entry["prs_path"]).site_positions)
+        positions[assembly] = sites
+    return positions
+
+
+def _clear_lead(leader_votes, other_votes, min_lead):
+    # A clear majority of score-site hits; the builds share only a few positions by chance
+    return leader_votes - other_votes >= min_lead and leader_votes >= 2 * other_votes
+
+
+def detect_assembly(vcf_path, max_records=DETECT_MAX_RECORDS, min_votes=DETECT_MIN_VOTES):
+    """
+    Genome build of a VCF, without a full run. The header decides when its contig
+    lengths or reference name identify a build. Otherwise data records are sampled
+    (by region fetch of the score sites when the file is indexed) and each record at
+    a registered score site's hm_pos votes for that build. Returns a dict with
+    "assembly", "method" and the evidence; "method" is "default" when undecided.
+    """
+    site_positions = _score_site_positions()
+    lines = iter_vcf_lines(vcf_path, site_positions["GRCh37"] | site_positions["GRCh38"])
+    header_lines, votes, records = [], {assembly: 0 for assembly in ASSEMBLIES}, 0
+    try:
+        for line in lines:
+            if line.startswith("#"):
+                header_lines.append(line)
+                continue
+            if records == 0:
+                assembly, method, evidence = header_assembly(header_lines)
+                if assembly:
+                    return {"assembly": assembly, "method": method, "evidence": evidence}
+            records += 1
+            head = line.split("\t", 2)
+            if len(head) > 2 and head[1].isdigit():
+                site = (normalize_chrom(head[0]), int(head[1]))
+                for assembly in ASSEMBLIES:
+                    if site in site_positions[assembly]:
+                        votes[assembly] += 1
+            leader, other = sorted(ASSEMBLIES, key=votes.get, reverse=True)
+            if _clear_lead(votes[leader], votes[other], min_votes) or records >= max_records:
+                break
+    finally:
+        lines.close()
+
+    if records == 0:
+        assembly, method, evidence = header_assembly(header_lines)
+        if assembly:
+            return {"assembly": assembly, "method": method, "evidence": evidence}
+
+    leader, other = sorted(ASSEMBLIES, key=votes.get, reverse=True)
+    evidence = {"score_site_hits": votes, "records_sampled": records}
+    if _clear_lead(votes[leader], votes[other], 1):
+        return {"assembly": leader, "method": "score_sites", "evidence": evidence}
+    return {"assembly": DEFAULT_ASSEMBLY, "method": "default", "evidence": evidence}
+
+
+def resolve_assembly(vcf_path, assembly=AUTO_ASSEMBLY):
+    """(assembly, detection) for a requested assembly; "auto" or None is detected from the VCF."""
+    if assembly in (None, "", AUTO_ASSEMBLY):
+        detection = detect_assembly(vcf_path)
+        return detection["assembly"], detection
+    if assembly not in ASSEMBLIES:
+        raise ValueError(f"Unknown assembly: {assembly}; use one of {', '.join(ASSEMBLIES)} or {AUTO_ASSEMBLY}")
+    return assembly, None
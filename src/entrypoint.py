@@ -3,6 +3,7 @@ import sys
 import subprocess
 from datetime import datetime
 from create_table_with_used_snps import create_prs_table
+from score_registry import registry
 
 def log_message(msg, log_file=None):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -21,16 +22,13 @@ def main():
     assembly = sys.argv[2]
     clean_tmp_files = sys.argv[3].lower() == "true" if len(sys.argv) > 3 else False
 
-    # Choose PRS and FREQ files based on assembly
-    if assembly == "GRCh38":
-        prs_path = "input/prs/PGS000195_hmPOS_GRCh38.txt"
-        freq_path = "input/prs/PGS000195_hmPOS_GRCh38.freq"
-    elif assembly == "GRCh37":
-        prs_path = "input/prs/PGS000195_hmPOS_GRCh37.txt"
-        freq_path = "input/prs/PGS000195_hmPOS_GRCh37.freq"
-    else:
-        print(f"Unknown ASSEMBLY: {assembly}")
+    # Choose PRS and FREQ files based on assembly: the default score of the manifest
+    try:
+        score_model = registry.select(assembly)[0]
+    except ValueError as e:
+        print(e)
         sys.exit(1)
+    prs_path, freq_path = score_model.prs_path, score_model.freq_path
 
     sample = os.path.basename(input_vcf).replace('.vcf', '')
     log_dir = "log"
@@ -130,8 +128,8 @@ def main():
     # Step 7: Table with used snps
     create_prs_table(
     sscore_vars_path="input/plink/lm5515_dedup.prs.sscore.vars",
-    full_score_path="input/prs/PGS000195_hmPOS_GRCh37.txt",
-    afreq_path="input/prs/PGS000195_hmPOS_GRCh37.freq",
+    full_score_path=prs_path,
+    afreq_path=freq_path,
     bfile_prefix="input/plink/lm5515_dedup",
     output_dir="output",
     clean_tmp_files=True
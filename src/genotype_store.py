@@ -0,0 +1,203 @@
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from score_registry import registry
+from scoring import match_dosages, score_dosages
+from vcf_io import passes_pipeline_filters, alt_dosages, normalize_chrom
+from vcf_scanner import VcfConsumer
+
+GENOTYPE_STORE_ENABLED = os.environ.get("PRS_GENOTYPE_STORE", "0") not in ("0", "false", "False")
+GENOTYPE_STORE_DIR = os.environ.get("PRS_GENOTYPE_STORE_DIR", "output/.genotypes")
+
+# 2-bit code per call: the ALT allele count 0-2, or 3 for a missing call
+_MISSING = 3
+_CODE_TO_DOSAGE = np.array([0.0, 1.0, 2.0, np.nan])
+_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+_KEY = re.compile(r"[0-9a-f]{64}")
+
+
+def pack_dosages(dosages):
+    """(sites, samples) ALT dosages, NaN for missing calls -> (sites, ceil(samples / 4)) uint8 codes."""
+    dosages = np.asarray(dosages, dtype=float)
+    sites, samples = dosages.shape
+    codes = np.full((sites, 4 * ((samples + 3) // 4)), _MISSING, dtype=np.uint8)
+    codes[:, :samples] = np.where(np.isnan(dosages), _MISSING, np.nan_to_num(dosages)).astype(np.uint8)
+    return np.bitwise_or.reduce(codes.reshape(sites, -1, 4) << _SHIFTS, axis=2).astype(np.uint8)
+
+
+def unpack_dosages(packed, samples):
+    codes = (packed[:, :, None] >> _SHIFTS) & 0b11
+    return _CODE_TO_DOSAGE[codes.reshape(len(packed), -1)[:, :samples]]
+
+
+class StoredGenotypes:
+    """Calls of every sample of one VCF at the stored sites, as a site index plus packed dosages."""
+
+    def __init__(self, samples, chroms, positions, ids, refs, alts, packed, meta=None):
+        self.samples = list(samples)
+        self.chroms = np.asarray(chroms, dtype=str)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.ids = np.asarray(ids, dtype=str)
+        self.refs = np.asarray(refs, dtype=str)
+        self.alts = np.asarray(alts, dtype=str)
+        self.packed = np.asarray(packed, dtype=np.uint8).reshape(len(self.ids), (len(self.samples) + 3) // 4)
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def dosages(self):
+        return unpack_dosages(self.packed, len(self.samples))
+
+    def score(self, model):
+        """
+        Score `model` on the stored calls the way ScoreSetConsumer scores the VCF:
+        variants are matched by ID and oriented on the effect allele. Returns the
+        .sscore lines and the ALT dosages of the variants used.
+        """
+        matched, effect_dosage, alt_dosage = match_dosages(model, self.ids, self.refs, self.alts, self.dosages())
+        return score_dosages(model, matched, effect_dosage, alt_dosage, self.samples)
+
+    def save(self, path):
+        # Written under a temporary name and renamed, so readers never see a partial file
+        partial = f"{path}.partial"
+        with open(partial, "wb") as f:
+            np.savez_compressed(
+                f, samples=np.asarray(self.samples, dtype=str), chroms=self.chroms, positions=self.positions,
+                ids=self.ids, refs=self.refs, alts=self.alts, packed=self.packed,
+                meta=np.asarray(json.dumps(self.meta))
+            )
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["samples"], data["chroms"], data["positions"], data["ids"], data["refs"],
+                       data["alts"], data["packed"], json.loads(str(data["meta"])))
+
+
+class GenotypeStoreConsumer(VcfConsumer):
+    """
+    Collects the calls at score and annotation sites, with the record filter and
+    first-record-per-ID rule of the pipeline, for the genotype store.
+    """
+
+    name = "genotypes"
+
+    def __init__(self, site_ids=(), positions=(), annotation_ids=(), site_index=None):
+        self.ids = set(site_ids)
+        self.positions = {(normalize_chrom(c), int(p)) for c, p in positions}
+        self.normalized_ids = set(annotation_ids)
+        self.site_index = site_index
+        if site_index:
+            self.positions |= site_index.positions
+        if not self.normalized_ids or (site_index and site_index.covers(self.normalized_ids)):
+            self.fetch_positions = self.positions
+        self.samples = []
+        self.seen = set()
+        self.sites = []
+        self.dosages = []
+
+    def start(self, header_lines, samples):
+        self.samples = samples
+
+    def consume(self, fields, line):
+        if self.site_index:
+            fields = self.site_index.resolve(fields)
+        if len(fields) < 5 or not passes_pipeline_filters(fields):
+            return
+        chrom, pos, variant_id, ref, alt = fields[:5]
+        if variant_id in self.seen or not pos.isdigit():
+            return
+        self.seen.add(variant_id)
+        self.sites.append((normalize_chrom(chrom), int(pos), variant_id, ref, alt))
+        self.dosages.append(alt_dosages(fields))
+
+    def finish(self):
+        chroms, positions, ids, refs, alts = zip(*self.sites) if self.sites else ((),) * 5
+        dosages = np.asarray(self.dosages, dtype=float).reshape(len(self.sites), len(self.samples))
+        return StoredGenotypes(self.samples, chroms, positions, ids, refs, alts, pack_dosages(dosages))
+
+
+class GenotypeStore:
+    """
+    Opt-in store of analyzed genotypes, one file per VCF content (SHA-256), so new or
+    re-weighted scores can be computed without the upload. Only the sites of the
+    registered score files and the drug annotation table are kept.
+    """
+
+    def __init__(self, directory=GENOTYPE_STORE_DIR, enabled=GENOTYPE_STORE_ENABLED):
+        self.directory = directory
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.saves = 0
+        self.loads = 0
+
+    @staticmethod
+    def valid_key(key):
+        return bool(key) and _KEY.fullmatch(key) is not None
+
+    def path_for(self, key):
+        if not self.valid_key(key):
+            raise ValueError(f"Invalid genotype store key: {key!r}")
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def has(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def consumer(self, annotation_ids=(), site_index=None):
+        """
+        Scanner consumer for the union of the sites of every registered score model and
+        `annotation_ids`; records without an rsID are matched through `site_index`.
+        """
+        site_ids, positions = set(), set()
+        for model in registry.models():
+            site_ids.update(model.site_ids)
+            positions.update(model.site_positions)
+        site_ids.discard("")
+        return GenotypeStoreConsumer(site_ids, positions, annotation_ids, site_index)
+
+    def save(self, key, genotypes, **meta):
+        path = self.path_for(key)
+        genotypes.meta = {**genotypes.meta, **meta, "key": key, "created": time.time()}
+        os.makedirs(self.directory, exist_ok=True)
+        genotypes.save(path)
+        with self._lock:
+            self.saves += 1
+        return path
+
+    def load(self, key):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No stored genotypes for {key}")
+        genotypes = StoredGenotypes.load(path)
+        with self._lock:
+            self.loads += 1
+        return genotypes
+
+    def delete(self, key):
+        """Remove a stored VCF's genotypes; returns False if there were none."""
+        try:
+            os.remove(self.path_for(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stats(self):
+        entries, size = 0, 0
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    entries += 1
+                    size += os.path.getsize(os.path.join(self.directory, name))
+        with self._lock:
+            return {"enabled": self.enabled, "entries": entries, "bytes": size, "saves": self.saves,
+                    "loads": self.loads}
+
+
+genotype_store = GenotypeStore()
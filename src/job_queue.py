@@ -0,0 +1,158 @@
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+PIPELINE_WORKERS = int(os.environ.get("PRS_PIPELINE_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PRS_QUEUE_SIZE", "8"))
+
+
+class QueueUnavailable(RuntimeError):
+    """A job was not accepted; the client should retry after `retry_after` seconds."""
+
+    status_code = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFull(QueueUnavailable):
+    status_code = 429
+
+
+class QueueClosed(QueueUnavailable):
+    status_code = 503
+
+
+class PipelineQueue:
+    """
+    Runs pipeline jobs on a fixed number of worker threads. Up to `max_queued` jobs
+    wait for a free worker; further submissions are refused with QueueFull so a burst
+    of uploads cannot start more bcftools/plink2 processes than the host can run.
+    """
+
+    def __init__(self, workers=PIPELINE_WORKERS, max_queued=PIPELINE_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.max_queued = max(0, max_queued)
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._closed = False
+        self.queued = 0
+        self.active = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        # Moving average of job run time, used for Retry-After
+        self.avg_job_seconds = 30.0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"pipeline-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def close(self):
+        """Refuse new jobs; queued and running jobs still finish."""
+        with self._lock:
+            self._closed = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._jobs.put(None)
+
+    def retry_after(self):
+        # Seconds until a slot is likely to free up, from the backlog ahead of a new job
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self):
+        backlog = self.queued + self.active
+        return max(1, math.ceil(self.avg_job_seconds * max(1, backlog - self.workers + 1) / self.workers))
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs); returns a Future or raises QueueFull/QueueClosed."""
+        self.start()
+        future = Future()
+        with self._lock:
+            if self._closed:
+                self.rejected += 1
+                raise QueueClosed("PRS service is shutting down", self._retry_after())
+            if self.queued + self.active >= self.workers + self.max_queued:
+                self.rejected += 1
+                raise QueueFull(
+                    f"PRS service is busy: {self.active} jobs running, {self.queued} queued",
+                    self._retry_after()
+                )
+            self.queued += 1
+            self.submitted += 1
+        self._jobs.put((future, fn, args, kwargs))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Queue fn and wait for its result."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            future, fn, args, kwargs = job
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            started = time.perf_counter()
+            ok = False
+            try:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(fn(*args, **kwargs))
+                    ok = True
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1 if ok else 0
+                    self.failed += 0 if ok else 1
+                    self.avg_job_seconds = 0.8 * self.avg_job_seconds + 0.2 * elapsed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "active_jobs": self.active,
+                "queue_depth": self.queued,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_job_seconds": round(self.avg_job_seconds, 3),
+                "accepting": not self._closed,
+            }
+
+    def to_prometheus(self):
+        stats = self.stats()
+        series = [
+            ("prs_queue_workers", "gauge", "Pipeline worker threads", stats["workers"]),
+            ("prs_queue_active_jobs", "gauge", "Pipeline jobs running", stats["active_jobs"]),
+            ("prs_queue_depth", "gauge", "Pipeline jobs waiting for a worker", stats["queue_depth"]),
+            ("prs_queue_rejected_total", "counter", "Submissions refused with 429/503", stats["rejected"]),
+        ]
+        lines = []
+        for metric, metric_type, help_text, value in series:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+pipeline_queue = PipelineQueue()
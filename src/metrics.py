@@ -0,0 +1,251 @@
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# CPU time of the calling thread only, so concurrent jobs do not count each other's work
+_RUSAGE_STAGE = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+_local = threading.local()
+# VmHWM is process-wide: it is reset, and read as the stage's peak, only while a single
+# stage of a single job is running
+_peak_lock = threading.Lock()
+_active_stages = 0
+_stage_starts = 0
+
+
+def _reset_peak_rss():
+    # Linux resets VmHWM when "5" is written to clear_refs
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _self_peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _begin_peak():
+    # Returns (whether the peak can be measured, start counter to check at the end)
+    global _active_stages, _stage_starts
+    with _peak_lock:
+        _active_stages += 1
+        _stage_starts += 1
+        alone = _active_stages == 1 and _reset_peak_rss()
+        return alone, _stage_starts
+
+
+def _end_peak(alone, starts):
+    global _active_stages
+    with _peak_lock:
+        _active_stages -= 1
+        # Another stage that started meanwhile shares the high-water mark
+        return _self_peak_rss() if alone and _stage_starts == starts else 0
+
+
+def current_stage():
+    """StageRecord of the stage running on the calling thread, or None."""
+    return getattr(_local, "stage", None)
+
+
+def wait_child(process):
+    """
+    Wait for `process`, a subprocess.Popen, with os.wait4 and add its CPU time and
+    peak RSS to the calling thread's stage. Returns the exit code.
+    """
+    if process.returncode is not None:
+        return process.returncode
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    record = current_stage()
+    if record is not None:
+        record.child_exited(usage)
+    return process.returncode
+
+
+def run_child(args, timeout=None):
+    """
+    subprocess.run(args, capture_output=True, text=True, timeout=timeout), with the
+    child reaped by wait_child so the stage gets that process's own resource usage.
+    """
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(args, stdout=stdout, stderr=stderr)
+        expired = threading.Event()
+
+        def kill():
+            expired.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            returncode = wait_child(process)
+        finally:
+            if timer:
+                timer.cancel()
+        stdout.seek(0)
+        stderr.seek(0)
+        output = stdout.read().decode(errors="replace")
+        errors = stderr.read().decode(errors="replace")
+    if expired.is_set():
+        raise subprocess.TimeoutExpired(args, timeout, output, errors)
+    return subprocess.CompletedProcess(args, returncode, output, errors)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class StageRecord:
+    """Measurements of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.variants = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.child_cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.ok = True
+
+    def read_files(self, *paths):
+        # Stages count the bytes they read and write themselves; process-wide
+        # counters would mix in the I/O of concurrent jobs
+        self.bytes_read += sum(_file_size(p) for p in paths)
+
+    def wrote_files(self, *paths):
+        self.bytes_written += sum(_file_size(p) for p in paths)
+
+    def child_exited(self, usage):
+        # rusage of one child from os.wait4
+        self.child_cpu_seconds += usage.ru_utime + usage.ru_stime
+        self.peak_rss_bytes = max(self.peak_rss_bytes, usage.ru_maxrss * 1024)
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "ok": self.ok,
+            "wall_seconds": round(self.wall_seconds, 4),
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "child_cpu_seconds": round(self.child_cpu_seconds, 4),
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "variants": self.variants,
+        }
+
+
+class JobMetrics:
+    """Stage records of one pipeline run, in execution order."""
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, variants=None):
+        record = StageRecord(name)
+        record.variants = variants
+        parent, _local.stage = current_stage(), record
+        alone, starts = _begin_peak()
+        usage = resource.getrusage(_RUSAGE_STAGE)
+        wall_start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record.ok = False
+            raise
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            end = resource.getrusage(_RUSAGE_STAGE)
+            record.cpu_seconds = (end.ru_utime - usage.ru_utime) + (end.ru_stime - usage.ru_stime)
+            # Children's peaks were added as each one was reaped
+            record.peak_rss_bytes = max(record.peak_rss_bytes, _end_peak(alone, starts))
+            _local.stage = parent
+            self.stages.append(record)
+
+    def as_dict(self):
+        return {
+            "job_id": self.job_id,
+            "total_wall_seconds": round(sum(s.wall_seconds for s in self.stages), 4),
+            "stages": [s.as_dict() for s in self.stages],
+        }
+
+
+class MetricsRegistry:
+    """Per-stage totals across jobs, exported in Prometheus text format."""
+
+    _COUNTERS = (
+        ("wall_seconds", "prs_stage_wall_seconds_total", "Wall clock time spent in the stage"),
+        ("cpu_seconds", "prs_stage_cpu_seconds_total", "CPU time of the job's service thread in the stage"),
+        ("child_cpu_seconds", "prs_stage_child_cpu_seconds_total", "CPU time of bcftools/plink2 child processes in the stage"),
+        ("bytes_read", "prs_stage_read_bytes_total", "Bytes read by the stage"),
+        ("bytes_written", "prs_stage_written_bytes_total", "Bytes written by the stage"),
+        ("variants", "prs_stage_variants_total", "Input variants processed by the stage"),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._jobs = {}
+
+    def observe(self, job_metrics, status):
+        with self._lock:
+            self._jobs[status] = self._jobs.get(status, 0) + 1
+            for record in job_metrics.stages:
+                totals = self._stages.setdefault(record.name, {
+                    "runs": 0, "failures": 0, "peak_rss_bytes": 0,
+                    **{attr: 0 for attr, _, _ in self._COUNTERS},
+                })
+                totals["runs"] += 1
+                totals["failures"] += 0 if record.ok else 1
+                totals["peak_rss_bytes"] = max(totals["peak_rss_bytes"], record.peak_rss_bytes)
+                for attr, _, _ in self._COUNTERS:
+                    totals[attr] += getattr(record, attr) or 0
+
+    def to_prometheus(self):
+        with self._lock:
+            stages = {name: dict(totals) for name, totals in self._stages.items()}
+            jobs = dict(self._jobs)
+
+        lines = [
+            "# HELP prs_jobs_total PRS pipeline jobs by outcome",
+            "# TYPE prs_jobs_total counter",
+        ]
+        lines += [f'prs_jobs_total{{status="{status}"}} {count}' for status, count in sorted(jobs.items())]
+
+        series = [
+            ("runs", "prs_stage_runs_total", "counter", "Stage executions"),
+            ("failures", "prs_stage_failures_total", "counter", "Stage executions that raised"),
+        ]
+        series += [(attr, metric, "counter", help_text) for attr, metric, help_text in self._COUNTERS]
+        series.append(("peak_rss_bytes", "prs_stage_peak_rss_bytes", "gauge", "Largest peak RSS seen in the stage"))
+        for attr, metric, metric_type, help_text in series:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for name in sorted(stages):
+                value = stages[name][attr]
+                lines.append(f'{metric}{{stage="{name}"}} {round(value, 6) if isinstance(value, float) else value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
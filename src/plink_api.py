@@ -3,11 +3,22 @@ import json
 import subprocess
 import tempfile
 from datetime import datetime
-from flask import Flask, request, jsonify
-from utils import run_plink_pipeline
+from flask import Flask, request, jsonify, Response
+from utils import run_plink_pipeline, run_batch_pipeline, vcf_sample_name, list_vcf_files, parse_profile_lines, merge_score_records, pipeline_settings, PRS_ENGINES
+from score_registry import registry
+from workspace import new_job_id, results_dir_for
+from metrics import JobMetrics, metrics_registry
+from result_cache import result_cache, sha256_file
+from job_queue import pipeline_queue, QueueUnavailable
+from resources import resource_scheduler
+from score_distribution import distribution_store
+from genotype_store import genotype_store
+from build_detect import resolve_assembly, ASSEMBLIES, AUTO_ASSEMBLY, DEFAULT_ASSEMBLY
 
 app = Flask(__name__)
 
+DEFAULT_ENGINE = os.environ.get("PRS_ENGINE", "plink2")
+
 def log_message(msg, log_file=None):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     log_msg = f"[{timestamp}] {msg}"
@@ -16,31 +27,182 @@ def log_message(msg, log_file=None):
         with open(log_file, 'a') as f:
             f.write(log_msg + '\n')
             
-def run_plink_prediction(vcf_path, assembly='GRCh37', clean_tmp=True):
+def verified_sha256(vcf_path, vcf_sha256=None):
+    # The digest keys the result cache and the genotype store, so it is always taken
+    # from the file; a caller-supplied one is only checked against it
+    digest = sha256_file(vcf_path)
+    if vcf_sha256 and vcf_sha256.lower() != digest:
+        print(f"[WARN] vcf_sha256 {vcf_sha256} does not match {vcf_path} ({digest}); using the file's digest")
+    return digest
+
+def lookup_cached_result(assembly, score_models, sample, job_id, job_metrics, vcf_sha256, engine):
+    # Returns (cache key, cached records or None)
+    with job_metrics.stage("cache_lookup"):
+        score_version = "+".join(f"{model.score_id}:{model.version}" for model in score_models)
+        cache_key = result_cache.key_for(vcf_sha256, assembly, score_version, pipeline_settings(engine))
+        entry = result_cache.restore(cache_key, sample, results_dir_for(job_id))
+    return cache_key, entry["records"] if entry else None
 
+def score_distribution_path(score_model):
+    # Quantile table of the population score distribution, for percentiles in the web view and PDF
     try:
-        result = run_plink_pipeline(vcf_path, assembly, clean_tmp)
-        
-        sample = os.path.basename(vcf_path).replace('.vcf', '')
+        return distribution_store.ensure(score_model)
+    except Exception as e:
+        print(f"[WARN] No score distribution for {score_model.prs_path}: {e}")
+        return None
+
+def score_info(score_model):
+    entry = score_model.entry
+    return {
+        "id": score_model.score_id,
+        "name": entry.get("name"),
+        "trait": entry.get("trait"),
+        "assembly": entry.get("assembly"),
+        "version": entry.get("version"),
+        "score_file": os.path.basename(score_model.prs_path),
+        "distribution": score_distribution_path(score_model)
+    }
+
+def requested_score_ids(data, assembly):
+    # "scores": ids from the manifest; "prs_file" (older clients) must name a registered score file
+    if assembly not in (*ASSEMBLIES, AUTO_ASSEMBLY):
+        raise ValueError(f"assembly must be one of: {', '.join(ASSEMBLIES)}, {AUTO_ASSEMBLY}")
+    build = None if assembly == AUTO_ASSEMBLY else assembly
+    score_ids = data.get('scores')
+    if isinstance(score_ids, str):
+        score_ids = [score_id.strip() for score_id in score_ids.split(',') if score_id.strip()]
+    if not score_ids and data.get('prs_file'):
+        score_ids = [registry.score_id_for_file(data['prs_file'], build)]
+    if build is None:
+        # The build is known only once the worker has read the VCF; ids must exist for some build
+        registered = {entry["id"] for entry in registry.entries()}
+        unknown = [score_id for score_id in score_ids or () if score_id not in registered]
+        if unknown:
+            raise ValueError(f"Unknown score {', '.join(unknown)}; registered: {', '.join(sorted(registered))}")
+        return score_ids or None
+    # Raises ValueError for unknown ids
+    return [model.score_id for model in registry.select(build, score_ids)]
+
+def run_plink_prediction(vcf_path, assembly=AUTO_ASSEMBLY, clean_tmp=True, engine=DEFAULT_ENGINE, include_metrics=False,
+                         batch=False, use_cache=True, vcf_sha256=None, store_genotypes=False, score_ids=None):
+
+    job_id = new_job_id()
+    job_metrics = JobMetrics(job_id)
+    pipeline = run_batch_pipeline if batch else run_plink_pipeline
+    sample = vcf_sample_name(os.path.normpath(vcf_path))
+    try:
+        detection = None
+        if assembly == AUTO_ASSEMBLY:
+            # A directory batch is detected from its first VCF
+            detect_path = vcf_path
+            if os.path.isdir(vcf_path):
+                vcf_files = list_vcf_files(vcf_path)
+                if not vcf_files:
+                    raise ValueError(f"No VCF files found in {vcf_path}")
+                detect_path = vcf_files[0]
+            with job_metrics.stage("build_detect") as stage:
+                assembly, detection = resolve_assembly(detect_path, assembly)
+                stage.variants = detection["evidence"].get("records_sampled")
+            print(f"[INFO] {vcf_path}: {assembly} (detected by {detection['method']})")
+        score_models = registry.select(assembly, score_ids)
+        options, store_key = {"score_ids": [model.score_id for model in score_models]}, None
+        use_cache = use_cache and result_cache.enabled and not batch
+        if use_cache or (store_genotypes and not batch):
+            with job_metrics.stage("vcf_hash") as stage:
+                vcf_sha256 = verified_sha256(vcf_path, vcf_sha256)
+                stage.read_files(vcf_path)
+        if store_genotypes and not batch:
+            store_key = vcf_sha256
+            # A cached result would skip the scan that fills the store
+            use_cache = use_cache and genotype_store.has(store_key)
+            options["store_key"] = store_key
+
+        cache_key, result = None, None
+        if use_cache:
+            cache_key, result = lookup_cached_result(assembly, score_models, sample, job_id, job_metrics, vcf_sha256,
+                                                     engine)
+        cached = result is not None
+
+        if not cached:
+            result = pipeline(vcf_path, assembly, clean_tmp, engine=engine, job_id=job_id, metrics=job_metrics,
+                              **options)
+            if cache_key:
+                result_cache.store(cache_key, sample, results_dir_for(job_id), result)
+        metrics_registry.observe(job_metrics, "cached" if cached else "success")
         
-        return {
+        scores = [score_info(model) for model in score_models]
+        response = {
             "status": "success",
             "results": result,
-            "sample_name": sample
+            "sample_name": sample,
+            "job_id": job_id,
+            "results_dir": results_dir_for(job_id),
+            "cached": cached,
+            "assembly": assembly,
+            "distribution": scores[0]["distribution"],
+            "scores": scores
         }
+        if detection:
+            response["assembly_detection"] = detection
+        if batch:
+            response["samples"] = len(result)
+        if store_key:
+            response["genotype_store"] = store_key
+        if include_metrics:
+            response["metrics"] = job_metrics.as_dict()
+        return response
         
     except Exception as e:
+        metrics_registry.observe(job_metrics, "error")
         error_msg = f"Prediction failed: {str(e)}"
         print(f"[ERROR] {error_msg}")
-        return {
+        response = {
             "status": "error",
             "error": error_msg
         }
+        if include_metrics:
+            response["metrics"] = job_metrics.as_dict()
+        return response
+
+def busy_response(error):
+    # 429 when the pipeline queue is full, 503 while the service shuts down
+    response = jsonify({"status": "error", "error": str(error), "retry_after": error.retry_after})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, error.status_code
+
+def resolve_input_path(vcf_file):
+    # Paths are relative to / in the container; bare paths are looked up under input/
+    if os.path.exists(vcf_file) or vcf_file.startswith('input/'):
+        return vcf_file
+    vcf_path = os.path.join('input', vcf_file)
+    return vcf_path if os.path.exists(vcf_path) else None
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "service": "plink-predictor"})
+    return jsonify({
+        "status": "healthy",
+        "service": "plink-predictor",
+        "score_registry": registry.memory_usage(),
+        "result_cache": result_cache.stats(),
+        "queue": pipeline_queue.stats(),
+        "resources": resource_scheduler.stats(),
+        "genotype_store": genotype_store.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage pipeline metrics in Prometheus text format"""
+    body = metrics_registry.to_prometheus() + result_cache.to_prometheus() + pipeline_queue.to_prometheus()
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+@app.route('/scores', methods=['GET'])
+def scores():
+    """Registered score files, optionally of one ?assembly="""
+    entries = registry.entries(request.args.get('assembly'))
+    return jsonify([
+        {k: v for k, v in entry.items() if k not in ("prs_path", "freq_path")} for entry in entries
+    ])
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -49,8 +211,14 @@ def predict():
     Expected JSON payload:
     {
         "vcf_file": "relative/path/to/file.vcf",
-        "assembly": "GRCh37",  // optional, defaults to GRCh37
-        "clean_tmp": true  // optional, defaults to true
+        "assembly": "auto",  // optional, "GRCh37", "GRCh38" or "auto" (default) to detect it from the VCF
+        "scores": ["PGS000195"],  // optional, registered score ids, defaults to the manifest defaults
+        "clean_tmp": true,  // optional, defaults to true
+        "engine": "plink2",  // optional, "plink2" or "numpy", defaults to $PRS_ENGINE
+        "include_metrics": false,  // optional, adds per-stage timings to the response
+        "use_cache": true,  // optional, serve a previous result for the same VCF content
+        "vcf_sha256": "...",  // optional, SHA-256 the caller computed; checked against the file, which is always hashed
+        "store_genotypes": false  // optional, keep the calls for /rescore, defaults to $PRS_GENOTYPE_STORE
     }
     """
     try:
@@ -60,26 +228,35 @@ def predict():
             return jsonify({"error": "No JSON data provided"}), 400
         
         vcf_file = data.get('vcf_file')
-        assembly = data.get('assembly', 'GRCh37')  # Default to GRCh37
+        assembly = data.get('assembly', AUTO_ASSEMBLY)  # Detected from the VCF by default
         clean_tmp = data.get('clean_tmp', True)
+        engine = data.get('engine', DEFAULT_ENGINE)
+        include_metrics = bool(data.get('include_metrics', False))
+        use_cache = bool(data.get('use_cache', True))
+        vcf_sha256 = data.get('vcf_sha256')
+        store_genotypes = bool(data.get('store_genotypes', genotype_store.enabled))
         
         if not vcf_file:
             return jsonify({"error": "vcf_file is required"}), 400
+
+        if engine not in PRS_ENGINES:
+            return jsonify({"error": f"engine must be one of: {', '.join(PRS_ENGINES)}"}), 400
+
+        try:
+            score_ids = requested_score_ids(data, assembly)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Handle both absolute and relative paths
-        if vcf_file.startswith('/'):
-            vcf_path = vcf_file
-        else:
-            vcf_path = vcf_file  # The utils function will handle path resolution
-        
-        # Validate that the VCF file exists (if using mounted volume approach)
-        if not os.path.exists(vcf_path) and not vcf_file.startswith('input/'):
-            # Try with input/ prefix
-            vcf_path = os.path.join('input', vcf_file)
-            if not os.path.exists(vcf_path):
-                return jsonify({"error": f"VCF file not found: {vcf_file}"}), 404
+        vcf_path = resolve_input_path(vcf_file)
+        if vcf_path is None:
+            return jsonify({"error": f"VCF file not found: {vcf_file}"}), 404
         
-        result = run_plink_prediction(vcf_path, assembly, clean_tmp)
+        try:
+            result = pipeline_queue.run(run_plink_prediction, vcf_path, assembly, clean_tmp, engine, include_metrics,
+                                        use_cache=use_cache, vcf_sha256=vcf_sha256,
+                                        store_genotypes=store_genotypes, score_ids=score_ids)
+        except QueueUnavailable as e:
+            return busy_response(e)
         
         if result["status"] == "error":
             return jsonify(result), 500
@@ -89,6 +266,130 @@ def predict():
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Batch prediction endpoint, one job for a cohort
+    Expected JSON payload:
+    {
+        "vcf_path": "vcf/cohort.vcf" or "vcf/clinic_upload/",  // multi-sample VCF or directory of VCFs
+        "assembly": "auto",  // optional, "GRCh37", "GRCh38" or "auto" (default) to detect it from the VCF
+        "scores": ["PGS000195"],  // optional, registered score ids, defaults to the manifest defaults
+        "clean_tmp": true,  // optional, defaults to true
+        "engine": "plink2",  // optional, defaults to $PRS_ENGINE for a multi-sample VCF and to "numpy" for a directory
+        "include_metrics": false  // optional, adds per-stage timings to the response
+    }
+    """
+    try:
+        data = request.get_json()
+
+        if not data:
+            return jsonify({"error": "No JSON data provided"}), 400
+
+        vcf_file = data.get('vcf_path') or data.get('vcf_file')
+        assembly = data.get('assembly', AUTO_ASSEMBLY)
+        clean_tmp = data.get('clean_tmp', True)
+        engine = data.get('engine')
+        include_metrics = bool(data.get('include_metrics', False))
+
+        if not vcf_file:
+            return jsonify({"error": "vcf_path is required"}), 400
+
+        if engine is not None and engine not in PRS_ENGINES:
+            return jsonify({"error": f"engine must be one of: {', '.join(PRS_ENGINES)}"}), 400
+
+        try:
+            score_ids = requested_score_ids(data, assembly)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        vcf_path = resolve_input_path(vcf_file)
+        if vcf_path is None:
+            return jsonify({"error": f"VCF file or directory not found: {vcf_file}"}), 404
+        if engine is None:
+            # Files of a directory are streamed in-process unless plink2 is asked for
+            engine = "numpy" if os.path.isdir(vcf_path) else DEFAULT_ENGINE
+
+        try:
+            result = pipeline_queue.run(run_plink_prediction, vcf_path, assembly, clean_tmp, engine, include_metrics,
+                                        batch=True, score_ids=score_ids)
+        except QueueUnavailable as e:
+            return busy_response(e)
+
+        if result["status"] == "error":
+            return jsonify(result), 500
+
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@app.route('/rescore', methods=['POST'])
+def rescore():
+    """
+    Score a VCF from the genotype store, without the upload
+    Expected JSON payload:
+    {
+        "vcf_sha256": "...",  // key returned as "genotype_store" by /predict with store_genotypes
+        "assembly": "GRCh37",  // optional, defaults to the build the upload was analyzed with
+        "scores": ["PGS000195"]  // optional, registered score ids, defaults to the manifest defaults
+    }
+    """
+    try:
+        data = request.get_json()
+
+        if not data:
+            return jsonify({"error": "No JSON data provided"}), 400
+
+        vcf_sha256 = data.get('vcf_sha256')
+
+        if not genotype_store.valid_key(vcf_sha256):
+            return jsonify({"error": "vcf_sha256 must be a lowercase hex SHA-256"}), 400
+        if not genotype_store.has(vcf_sha256):
+            return jsonify({"error": f"No stored genotypes for {vcf_sha256}"}), 404
+
+        job_metrics = JobMetrics()
+        with job_metrics.stage("rescore") as stage:
+            genotypes = genotype_store.load(vcf_sha256)
+            stage.variants = len(genotypes)
+            stage.read_files(genotype_store.path_for(vcf_sha256))
+            # The build the upload was stored under, unless the request names one
+            assembly = data.get('assembly', AUTO_ASSEMBLY)
+            if assembly == AUTO_ASSEMBLY:
+                assembly = genotypes.meta.get('assembly') or DEFAULT_ASSEMBLY
+            try:
+                score_models = registry.select(assembly, requested_score_ids(data, assembly))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            score_records = [parse_profile_lines(genotypes.score(model)[0]) for model in score_models]
+        return jsonify({
+            "status": "success",
+            "results": merge_score_records(score_models, score_records),
+            "sample_name": genotypes.meta.get("sample"),
+            "assembly": assembly,
+            "scores": [score_info(model) for model in score_models],
+            "wall_seconds": round(stage.wall_seconds, 4)
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+
+@app.route('/genotypes/<vcf_sha256>', methods=['DELETE'])
+def delete_genotypes(vcf_sha256):
+    """Remove a VCF's calls from the genotype store"""
+    if not genotype_store.valid_key(vcf_sha256):
+        return jsonify({"error": "vcf_sha256 must be a lowercase hex SHA-256"}), 400
+    if not genotype_store.delete(vcf_sha256):
+        return jsonify({"error": f"No stored genotypes for {vcf_sha256}"}), 404
+    return jsonify({"status": "deleted", "vcf_sha256": vcf_sha256})
+
 if __name__ == '__main__':
     print("Starting PLINK Prediction API...")
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    registry.load()
+    print(f"Loaded score registry: {registry.memory_usage()['total_bytes']} bytes")
+    for score_model in registry.models():
+        print(f"Score distribution for {score_model.prs_path}: {score_distribution_path(score_model)}")
+    pipeline_queue.start()
+    print(f"Pipeline workers: {pipeline_queue.workers}, queue size: {pipeline_queue.max_queued}")
+    # Request threads only wait on the pipeline queue, which bounds the actual work
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
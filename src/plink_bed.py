@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+BED_MAGIC = b"\x6c\x1b\x01"
+
+# 2-bit .bed codes -> A1 allele count: 00 hom A1, 01 missing, 10 het, 11 hom A2
+_CODE_TO_DOSAGE = np.array([2.0, np.nan, 1.0, 0.0])
+_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+class PlinkBed:
+    """
+    Read-only view of a PLINK .bed/.bim/.fam trio. The packed genotypes are memory-mapped
+    and only the requested variants are decoded. For plink2-made files A1 is the VCF ALT
+    allele, so dosages are ALT allele counts, the same values `--recode A` reports.
+    """
+
+    def __init__(self, bfile_prefix):
+        self.bfile_prefix = bfile_prefix
+        self.bim = pd.read_csv(
+            f"{bfile_prefix}.bim", sep=r"\s+", header=None, dtype=str,
+            names=["chrom", "id", "cm", "pos", "a1", "a2"]
+        )
+        self.fam = pd.read_csv(
+            f"{bfile_prefix}.fam", sep=r"\s+", header=None, dtype=str,
+            names=["fid", "iid", "pat", "mat", "sex", "phenotype"]
+        )
+        self.n_variants = len(self.bim)
+        self.n_samples = len(self.fam)
+        self.bytes_per_variant = (self.n_samples + 3) // 4
+
+        self._bed = np.memmap(f"{bfile_prefix}.bed", dtype=np.uint8, mode="r")
+        if self._bed[:3].tobytes() != BED_MAGIC:
+            raise ValueError(f"{bfile_prefix}.bed is not a variant-major PLINK .bed file")
+        expected = 3 + self.n_variants * self.bytes_per_variant
+        if self._bed.size != expected:
+            raise ValueError(f"{bfile_prefix}.bed has {self._bed.size} bytes, expected {expected}")
+        # Zero-copy (variant, packed sample bytes) view over the mapping
+        self.packed = self._bed[3:].reshape(self.n_variants, self.bytes_per_variant)
+
+    @property
+    def sample_ids(self):
+        return self.fam["iid"].tolist()
+
+    def variant_indices(self, variant_ids):
+        # .bim row indices of `variant_ids`, in .bim order
+        wanted = set(variant_ids)
+        return np.flatnonzero(self.bim["id"].isin(wanted).to_numpy())
+
+    def read_dosages(self, indices):
+        # (len(indices), n_samples) float array of A1 counts, NaN for missing calls
+        indices = np.asarray(indices, dtype=np.int64)
+        packed = self.packed[indices]
+        codes = (packed[:, :, None] >> _SHIFTS) & 0b11
+        codes = codes.reshape(len(indices), 4 * self.bytes_per_variant)[:, :self.n_samples]
+        return _CODE_TO_DOSAGE[codes]
+
+    def close(self):
+        self.packed = None
+        mmap = getattr(self._bed, "_mmap", None)
+        self._bed = None
+        if mmap is not None:
+            mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,124 @@
+import math
+import os
+import threading
+from contextlib import contextmanager
+
+# Memory kept for the service itself (score registry, scans, pandas) when sizing plink2 --memory
+MEMORY_RESERVE_MB = int(os.environ.get("PRS_MEMORY_RESERVE_MB", "512"))
+MIN_JOB_MEMORY_MB = int(os.environ.get("PRS_MIN_JOB_MEMORY_MB", "256"))
+
+# cgroup v1 reports "no limit" as a huge page-aligned number
+_UNLIMITED = 1 << 60
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit():
+    """CPUs this process may use: its affinity mask, capped by the cgroup CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")  # v2: "<quota> <period>" or "max <period>"
+    if cpu_max:
+        value, _, period = cpu_max.partition(" ")
+        if value != "max" and period:
+            quota = int(value) / int(period)
+    else:
+        value, period = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if value and period and int(value) > 0:
+            quota = int(value) / int(period)
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def memory_limit():
+    """Bytes of memory this process may use: the cgroup limit, or physical memory."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read(path)
+        if value and value != "max" and int(value) < _UNLIMITED:
+            return int(value)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+class JobResources:
+    """Thread and memory budget of one job, re-balanced before each external step."""
+
+    def __init__(self, scheduler, job_id):
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.threads = 1
+        self.memory_mb = MIN_JOB_MEMORY_MB
+        self.running_jobs = 1
+
+    def refresh(self):
+        """Take this job's fair share of the CPUs and memory given the jobs running now."""
+        self.threads, self.memory_mb, self.running_jobs = self.scheduler.share()
+        return self
+
+    def plink_args(self):
+        return ['--threads', str(self.threads), '--memory', str(self.memory_mb)]
+
+    def bcftools_args(self):
+        return ['--threads', str(self.threads)]
+
+    def describe(self):
+        return (f"{self.threads} threads, {self.memory_mb} MiB "
+                f"({self.running_jobs} running jobs sharing {self.scheduler.cpus} CPUs, "
+                f"{self.scheduler.memory_mb} MiB)")
+
+    def as_dict(self):
+        return {"threads": self.threads, "memory_mb": self.memory_mb, "running_jobs": self.running_jobs}
+
+
+class ResourceScheduler:
+    """
+    Splits the container's CPU quota and memory limit between the pipeline jobs
+    that are running, so concurrent plink2/bcftools processes do not oversubscribe
+    the host. Limits are read from the cgroup once, at start-up.
+    """
+
+    def __init__(self, cpus=None, memory_mb=None):
+        self.cpus = cpus or int(os.environ.get("PRS_CPUS", "0")) or cpu_limit()
+        usable = memory_mb or int(os.environ.get("PRS_MEMORY_MB", "0")) or memory_limit() // (1024 * 1024)
+        self.memory_mb = max(MIN_JOB_MEMORY_MB, usable - MEMORY_RESERVE_MB)
+        self._lock = threading.Lock()
+        self._jobs = set()
+
+    @contextmanager
+    def job(self, job_id):
+        resources = JobResources(self, job_id)
+        with self._lock:
+            self._jobs.add(resources)
+        try:
+            yield resources.refresh()
+        finally:
+            with self._lock:
+                self._jobs.discard(resources)
+
+    def share(self):
+        with self._lock:
+            running = max(1, len(self._jobs))
+        threads = max(1, self.cpus // running)
+        memory_mb = max(MIN_JOB_MEMORY_MB, self.memory_mb // running)
+        return threads, memory_mb, running
+
+    def stats(self):
+        with self._lock:
+            running = len(self._jobs)
+        return {"cpus": self.cpus, "memory_mb": self.memory_mb, "running_jobs": running}
+
+
+resource_scheduler = ResourceScheduler()
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+CACHE_DIR = os.environ.get("PRS_CACHE_DIR", "output/.cache")
+CACHE_ENABLED = os.environ.get("PRS_CACHE_ENABLED", "1") not in ("0", "false", "False")
+CACHE_MAX_MB = int(os.environ.get("PRS_CACHE_MAX_MB", "1024"))
+CACHE_TTL_HOURS = float(os.environ.get("PRS_CACHE_TTL_HOURS", "168"))
+
+ENTRY_FILE = "entry.json"
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ResultCache:
+    """
+    Pipeline results keyed by (VCF content, assembly, score file version, pipeline
+    settings such as the engine and annotation table).
+    An entry keeps the result records and the files of output/<job_id>/ with the
+    sample name stripped, so a re-upload under another file name is served too.
+    Entries expire after `ttl_hours`; the least recently used ones are dropped
+    once the cache grows past `max_mb`.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_mb=CACHE_MAX_MB, ttl_hours=CACHE_TTL_HOURS, enabled=CACHE_ENABLED):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_hours * 3600
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(vcf_sha256, assembly, score_version, settings=""):
+        return hashlib.sha256(f"{vcf_sha256}\0{assembly}\0{score_version}\0{settings}".encode()).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_entry(self, key):
+        try:
+            with open(os.path.join(self._entry_dir(key), ENTRY_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _expired(self, entry):
+        return time.time() - entry["created"] > self.ttl_seconds
+
+    def _evict(self, key):
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        self.evictions += 1
+
+    def restore(self, key, sample, results_dir):
+        """Copy a cached entry into `results_dir` under `sample`'s file names; returns the entry or None."""
+        with self._lock:
+            entry = self._read_entry(key)
+            if entry is not None and self._expired(entry):
+                self._evict(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_dir = self._entry_dir(key)
+            os.makedirs(results_dir, exist_ok=True)
+            for suffix in entry["files"]:
+                _link_or_copy(os.path.join(entry_dir, suffix), os.path.join(results_dir, f"{sample}{suffix}"))
+            # Entry mtime is the LRU clock
+            os.utime(os.path.join(entry_dir, ENTRY_FILE))
+            self.hits += 1
+            return entry
+
+    def store(self, key, sample, results_dir, records):
+        """Add the files of a finished job; a concurrent store of the same key keeps the first entry."""
+        names = [name for name in os.listdir(results_dir) if name.startswith(sample)]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".staging_", dir=self.cache_dir)
+        try:
+            size = 0
+            for name in names:
+                suffix = name[len(sample):]
+                _link_or_copy(os.path.join(results_dir, name), os.path.join(staging, suffix))
+                size += os.path.getsize(os.path.join(staging, suffix))
+            entry = {
+                "key": key,
+                "records": records,
+                "files": [name[len(sample):] for name in names],
+                "size": size,
+                "created": time.time(),
+            }
+            with open(os.path.join(staging, ENTRY_FILE), "w") as f:
+                json.dump(entry, f)
+            with self._lock:
+                try:
+                    os.rename(staging, self._entry_dir(key))
+                    staging = None
+                    self.stores += 1
+                except OSError:
+                    pass
+                self._enforce_limits()
+        finally:
+            if staging:
+                shutil.rmtree(staging, ignore_errors=True)
+
+    def _enforce_limits(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            if key.startswith("."):
+                continue
+            entry = self._read_entry(key)
+            if entry is None or self._expired(entry):
+                self._evict(key)
+                continue
+            mtime = os.path.getmtime(os.path.join(self._entry_dir(key), ENTRY_FILE))
+            entries.append((mtime, key, entry["size"]))
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._evict(key)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+    def to_prometheus(self):
+        stats = self.stats()
+        lines = []
+        for name in ("hits", "misses", "stores", "evictions"):
+            lines.append(f"# HELP prs_cache_{name}_total Result cache {name}")
+            lines.append(f"# TYPE prs_cache_{name}_total counter")
+            lines.append(f"prs_cache_{name}_total {stats[name]}")
+        return "\n".join(lines) + "\n"
+
+
+result_cache = ResultCache()
@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+DISTRIBUTION_DIR = os.environ.get("PRS_DISTRIBUTION_DIR", "output/.distributions")
+# Quantile levels stored per score file: 0.0%, 0.1%, ..., 100.0%
+QUANTILE_POINTS = 1001
+GRID_BINS = 1 << 14
+
+
+def hwe_score_quantiles(weights, effect_freqs, points=QUANTILE_POINTS, bins=GRID_BINS):
+    """
+    Quantiles of SCORE1_AVG for genotypes drawn in Hardy-Weinberg equilibrium at the
+    effect allele frequencies, with every score variant observed. The exact
+    distribution of the weighted dosage sum is built by convolving each variant's
+    three-point distribution on a grid of about `bins` points; no sampling is involved.
+    Returns (levels, values).
+    """
+    keep = ~(np.isnan(weights) | np.isnan(effect_freqs))
+    weights, freqs = weights[keep], effect_freqs[keep]
+    if not len(weights):
+        raise ValueError("No score variants with both a weight and an allele frequency")
+
+    # Dosage d of variant i adds d * w_i; shift so that every contribution is >= 0
+    base = np.minimum(0.0, 2 * weights)
+    span = np.maximum(0.0, 2 * weights).sum() - base.sum()
+    step = span / (bins - 1) if span > 0 else 1.0
+    shifts = np.rint((np.arange(3)[None, :] * weights[:, None] - base[:, None]) / step).astype(np.int64)
+    size = int(shifts.max(axis=1).sum()) + 1
+
+    pmf = np.zeros(size)
+    pmf[0] = 1.0
+    for p, variant_shifts in zip(freqs, shifts):
+        probs = ((1 - p) ** 2, 2 * p * (1 - p), p ** 2)
+        convolved = np.zeros(size)
+        for prob, shift in zip(probs, variant_shifts):
+            if prob > 0:
+                convolved[shift:] += prob * pmf[:size - shift]
+        pmf = convolved
+
+    cdf = np.cumsum(pmf)
+    levels = np.linspace(0.0, 1.0, points)
+    index = np.searchsorted(cdf, np.clip(levels, 1e-12, cdf[-1] - 1e-12), side="left")
+    sums = base.sum() + step * index
+    return levels, sums / (2 * len(weights))
+
+
+class DistributionStore:
+    """
+    Quantile tables of the score models, computed once per score file content and
+    kept as JSON under `directory`, where the frontend reads them.
+    """
+
+    def __init__(self, directory=DISTRIBUTION_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path_for(self, model):
+        stem = os.path.splitext(os.path.basename(model.prs_path))[0]
+        return os.path.join(self.directory, f"{stem}.{model.version[:16]}.json")
+
+    def ensure(self, model):
+        """Path of `model`'s quantile table, computing it if this score file version has none yet."""
+        path = self.path_for(model)
+        with self._lock:
+            if os.path.exists(path):
+                return path
+            levels, values = hwe_score_quantiles(model.weights, model.effect_freqs)
+            table = {
+                "score_file": os.path.basename(model.prs_path),
+                "version": model.version,
+                "variants": int((~(np.isnan(model.weights) | np.isnan(model.effect_freqs))).sum()),
+                "levels": [round(float(level), 6) for level in levels],
+                "values": [float(f"{value:.10g}") for value in values],
+            }
+            os.makedirs(self.directory, exist_ok=True)
+            partial = f"{path}.partial"
+            with open(partial, "w") as f:
+                json.dump(table, f)
+            os.replace(partial, path)
+        return path
+
+
+distribution_store = DistributionStore()
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from vcf_io import normalize_chrom
+
+MANIFEST_FILE = "manifest.json"
+_HMPOS_NAME = re.compile(r"(?P<id>.+)_hmPOS_(?P<assembly>GRCh3[78])$")
+
+
+class ScoreModel:
+    """One PGS score file and its .freq file held as typed arrays, one row per score variant."""
+
+    def __init__(self, prs_path, freq_path=None, entry=None):
+        self.prs_path = prs_path
+        self.freq_path = freq_path
+        # Manifest entry: id, trait, assembly and release of the score
+        self.entry = entry or {}
+        self.score_id = self.entry.get("id") or os.path.splitext(os.path.basename(prs_path))[0]
+        self.fingerprint = _fingerprint(prs_path, freq_path)
+        # Content hash of the score and frequency files, part of result cache keys
+        self.version = _content_digest(prs_path, freq_path)
+
+        score = pd.read_csv(prs_path, sep="\t", dtype=str)
+        self.rsids = score["rsID"].fillna("").to_numpy(dtype=str)
+        self.effect_alleles = score["effect_allele"].fillna("").to_numpy(dtype=str)
+        self.other_alleles = score["other_allele"].fillna("").to_numpy(dtype=str)
+        self.weights = score["effect_weight"].astype(float).to_numpy()
+        self.chroms = score["hm_chr"].fillna("").map(normalize_chrom).to_numpy(dtype=str)
+        self.positions = pd.to_numeric(score["hm_pos"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+
+        self.alt_freqs = np.full(len(score), np.nan)
+        self.freq_alts = np.full(len(score), "", dtype=object)
+        if freq_path:
+            freq = pd.read_csv(freq_path, sep="\t", dtype=str).drop_duplicates(subset=["ID"], keep="first")
+            freq = score[["rsID"]].merge(freq, left_on="rsID", right_on="ID", how="left")
+            self.alt_freqs = freq["ALT_FREQS"].astype(float).to_numpy()
+            self.freq_alts = freq["ALT"].fillna("").to_numpy(dtype=str)
+        # Frequency of the effect allele, used for mean imputation of missing calls
+        self.effect_freqs = np.where(self.effect_alleles == self.freq_alts, self.alt_freqs, 1.0 - self.alt_freqs)
+
+        self.row_by_id = {}
+        for row, rsid in enumerate(self.rsids):
+            self.row_by_id.setdefault(rsid, row)
+        self.row_by_pos = {}
+        for row, (chrom, pos) in enumerate(zip(self.chroms, self.positions)):
+            if pos >= 0:
+                self.row_by_pos.setdefault((chrom, int(pos)), row)
+
+    def __len__(self):
+        return len(self.rsids)
+
+    @property
+    def site_ids(self):
+        return set(self.row_by_id)
+
+    @property
+    def site_positions(self):
+        return set(self.row_by_pos)
+
+    def rows_for(self, rsids):
+        # Score file rows whose rsID is in `rsids`, in score file order
+        rsids = set(rsids)
+        return np.array([row for row, rsid in enumerate(self.rsids) if rsid in rsids], dtype=np.int64)
+
+    def is_stale(self):
+        return _fingerprint(self.prs_path, self.freq_path) != self.fingerprint
+
+    def memory_usage(self):
+        arrays = (self.rsids, self.effect_alleles, self.other_alleles, self.weights, self.chroms,
+                  self.positions, self.alt_freqs, self.freq_alts, self.effect_freqs)
+        return sum(a.nbytes for a in arrays) + sys.getsizeof(self.row_by_id) + sys.getsizeof(self.row_by_pos)
+
+
+class ScoreRegistry:
+    """
+    Score models of the score files listed in `prs_dir`/manifest.json, loaded once and
+    reloaded when the files or the manifest change. Without a manifest every
+    <id>_hmPOS_<assembly>.txt file under `prs_dir` is registered.
+    """
+
+    def __init__(self, prs_dir="input/prs"):
+        self.prs_dir = prs_dir
+        self._models = {}
+        self._entries = []
+        self._manifest_fingerprint = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            self._models = {}
+            self._read_manifest()
+            for entry in self._entries:
+                self._load(entry["prs_path"])
+        return self
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.prs_dir, MANIFEST_FILE)
+        self._manifest_fingerprint = _fingerprint(manifest_path)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                entries = json.load(f)["scores"]
+            for entry in entries:
+                entry["prs_path"] = os.path.normpath(os.path.join(self.prs_dir, entry["score_file"]))
+                freq_file = entry.get("freq_file")
+                entry["freq_path"] = os.path.normpath(os.path.join(self.prs_dir, freq_file)) if freq_file else None
+        else:
+            entries = []
+            for prs_path in sorted(glob(os.path.join(self.prs_dir, "*.txt"))):
+                match = _HMPOS_NAME.match(os.path.splitext(os.path.basename(prs_path))[0])
+                if match is None or os.path.basename(prs_path).startswith("header_"):
+                    continue
+                freq_path = os.path.splitext(prs_path)[0] + ".freq"
+                entries.append({
+                    "id": match["id"],
+                    "assembly": match["assembly"],
+                    "score_file": os.path.basename(prs_path),
+                    "prs_path": os.path.normpath(prs_path),
+                    "freq_path": os.path.normpath(freq_path) if os.path.exists(freq_path) else None,
+                })
+        self._entries = entries
+
+    def _entry_for(self, prs_path):
+        for entry in self._entries:
+            if entry["prs_path"] == prs_path:
+                return entry
+        return None
+
+    def _load(self, prs_path):
+        key = os.path.normpath(prs_path)
+        entry = self._entry_for(key)
+        if entry is not None:
+            freq_path = entry["freq_path"]
+        else:
+            freq_path = os.path.splitext(prs_path)[0] + ".freq"
+            freq_path = freq_path if os.path.exists(freq_path) else None
+        model = ScoreModel(prs_path, freq_path, entry)
+        self._models[key] = model
+        return model
+
+    def get(self, prs_path):
+        key = os.path.normpath(prs_path)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None or model.is_stale():
+                if not os.path.exists(prs_path):
+                    raise FileNotFoundError(f"Score file not found: {prs_path}")
+                model = self._load(prs_path)
+            return model
+
+    def entries(self, assembly=None):
+        """Manifest entries, of `assembly` only when given; the manifest is re-read when it changed."""
+        with self._lock:
+            if _fingerprint(os.path.join(self.prs_dir, MANIFEST_FILE)) != self._manifest_fingerprint:
+                # Models loaded before carry the old entries
+                self._models = {}
+                self._read_manifest()
+            return [dict(entry) for entry in self._entries if assembly is None or entry["assembly"] == assembly]
+
+    def select(self, assembly, score_ids=None):
+        """
+        Score models of `score_ids` for `assembly`, in request order; without ids, the
+        entries marked "default" (or else the first one). Raises ValueError for an
+        unknown assembly or score id.
+        """
+        entries = self.entries(assembly)
+        if not entries:
+            raise ValueError(f"No score files registered for assembly {assembly}")
+        if not score_ids:
+            selected = [entry for entry in entries if entry.get("default")] or entries[:1]
+        else:
+            by_id = {entry["id"]: entry for entry in entries}
+            unknown = [score_id for score_id in score_ids if score_id not in by_id]
+            if unknown:
+                raise ValueError(
+                    f"Unknown score {', '.join(unknown)} for {assembly}; registered: {', '.join(sorted(by_id))}"
+                )
+            selected = [by_id[score_id] for score_id in dict.fromkeys(score_ids)]
+        return [self.get(entry["prs_path"]) for entry in selected]
+
+    def score_id_for_file(self, prs_file, assembly):
+        """Id of the registered score whose file name is that of `prs_file`."""
+        name = os.path.basename(prs_file)
+        for entry in self.entries(assembly):
+            if entry["score_file"] == name:
+                return entry["id"]
+        raise ValueError(f"Score file {name} is not registered for {assembly}")
+
+    def models(self):
+        """Every loaded score model, loading the score directory first if nothing is loaded yet."""
+        if not self._models:
+            self.load()
+        with self._lock:
+            return list(self._models.values())
+
+    def memory_usage(self):
+        with self._lock:
+            per_model = {os.path.basename(k): m.memory_usage() for k, m in self._models.items()}
+        return {"models": per_model, "total_bytes": sum(per_model.values())}
+
+
+registry = ScoreRegistry()
+
+
+def _fingerprint(*paths):
+    return tuple((os.stat(p).st_mtime_ns, os.stat(p).st_size) if p and os.path.exists(p) else None for p in paths)
+
+
+def _content_digest(*paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
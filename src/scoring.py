@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+
+from vcf_io import passes_pipeline_filters, alt_dosages
+from vcf_scanner import VcfConsumer, VcfScanner
+
+
+class ScoreSetConsumer(VcfConsumer):
+    """
+    Computes several PGS in one pass the way
+    bcftools view | plink2 --make-bed | plink2 --rm-dup force-first | plink2 --score
+    does it for each of them. The ALT dosages at the union of the models' sites are
+    collected once; finish() returns, per model, the .sscore lines plink2 would
+    write and the ALT dosages of the variants used (what --recode A would report).
+    With a SiteIndex, records without a score rsID are matched by position and alleles.
+    """
+
+    name = "score"
+
+    def __init__(self, models, site_index=None):
+        self.models = list(models)
+        self.site_index = site_index
+        self.ids = set().union(*(model.site_ids for model in self.models))
+        self.positions = site_index.positions if site_index else ()
+        self.fetch_positions = set().union(*(model.site_positions for model in self.models), self.positions)
+        self.samples = []
+        self.seen = set()
+        self.variant_ids = []
+        self.refs = []
+        self.alts = []
+        self.dosages = []
+
+    def start(self, header_lines, samples):
+        self.samples = samples
+
+    def consume(self, fields, line):
+        if self.site_index:
+            fields = self.site_index.resolve(fields)
+        if len(fields) < 5 or not passes_pipeline_filters(fields):
+            return
+        variant_id = fields[2]
+        # --rm-dup force-first keeps the first record of every ID
+        if variant_id in self.seen:
+            return
+        self.seen.add(variant_id)
+        self.variant_ids.append(variant_id)
+        self.refs.append(fields[3])
+        self.alts.append(fields[4])
+        self.dosages.append(alt_dosages(fields))
+
+    def finish(self):
+        if not self.samples:
+            raise RuntimeError("PRS calculation failed: VCF has no samples")
+        dosages = np.asarray(self.dosages, dtype=float).reshape(len(self.variant_ids), len(self.samples))
+        return [
+            score_dosages(model, *match_dosages(model, self.variant_ids, self.refs, self.alts, dosages), self.samples)
+            for model in self.models
+        ]
+
+
+class ScoreConsumer(ScoreSetConsumer):
+    """ScoreSetConsumer of a single model; finish() returns its .sscore lines and dosages."""
+
+    def __init__(self, model):
+        super().__init__([model])
+        self.model = model
+
+    def finish(self):
+        return super().finish()[0]
+
+
+def match_dosages(model, variant_ids, refs, alts, dosages):
+    """
+    Place (variants, samples) ALT dosages on `model`'s score file rows by variant ID.
+    Dosages are oriented on the effect allele; plink2 skips score variants whose
+    allele matches neither REF nor ALT. Returns (matched, effect_dosage, alt_dosage).
+    """
+    samples = dosages.shape[1]
+    effect_dosage = np.full((len(model), samples), np.nan)
+    alt_dosage = np.full((len(model), samples), np.nan)
+    matched = np.zeros(len(model), dtype=bool)
+
+    rows = np.array([model.row_by_id.get(variant_id, -1) for variant_id in variant_ids], dtype=np.int64)
+    found = np.flatnonzero(rows >= 0)
+    rows = rows[found]
+    effect_alleles = model.effect_alleles[rows]
+    is_alt = effect_alleles == np.asarray(alts, dtype=str)[found]
+    is_ref = ~is_alt & (effect_alleles == np.asarray(refs, dtype=str)[found])
+    keep = is_alt | is_ref
+    rows, found, is_alt = rows[keep], found[keep], is_alt[keep]
+
+    alt_dosage[rows] = dosages[found]
+    effect_dosage[rows] = np.where(is_alt[:, None], dosages[found], 2.0 - dosages[found])
+    matched[rows] = True
+    return matched, effect_dosage, alt_dosage
+
+
+def score_dosages(model, matched, effect_dosage, alt_dosage, samples):
+    """
+    plink2 --score arithmetic over score file rows: `matched` marks the rows found in
+    the genotypes, `effect_dosage`/`alt_dosage` are (rows, samples) arrays with NaN
+    for missing calls. Returns the .sscore lines and the ALT dosages of the variants used.
+    """
+    if not matched.any():
+        raise RuntimeError("PRS calculation failed: no score variants found in the VCF")
+
+    weights = model.weights[matched]
+    freqs = model.effect_freqs[matched]
+    dosage = effect_dosage[matched]
+    observed = ~np.isnan(dosage)
+
+    imputed = np.where(observed, dosage, 2.0 * freqs[:, None])
+    score_sum = (weights[:, None] * imputed).sum(axis=0)
+    allele_ct = 2 * observed.sum(axis=0)
+    dosage_sum = np.where(observed, dosage, 0.0).sum(axis=0)
+    genotypes = pd.DataFrame(alt_dosage[matched], columns=samples)
+    genotypes.insert(0, "rsid", model.rsids[matched])
+    return _sscore_lines(samples, allele_ct, dosage_sum, score_sum), genotypes
+
+
+def _sscore_lines(samples, allele_ct, dosage_sum, score_sum):
+    score_avg = np.divide(score_sum, allele_ct, out=np.zeros_like(score_sum), where=allele_ct > 0)
+    sscore_lines = ["#IID\tALLELE_CT\tNAMED_ALLELE_DOSAGE_SUM\tSCORE1_AVG"]
+    for i, sample in enumerate(samples):
+        sscore_lines.append(f"{sample}\t{int(allele_ct[i])}\t{int(round(dosage_sum[i]))}\t{score_avg[i]:g}")
+    return sscore_lines
+
+
+def write_merged_score_file(models, path):
+    """
+    One plink2 --score file for several models: ID, CHR, POS, A1 (effect allele), A2
+    and one weight column per model, named by score id, so a single
+    `--score path 1 4 header --score-col-nums 6-<5 + len(models)>` scores them all.
+    A variant weighted on different alleles by two models gets a line per allele.
+    Returns the number of weight columns.
+    """
+    lines = {}
+    for column, model in enumerate(models):
+        for rsid, row in model.row_by_id.items():
+            if not rsid:
+                continue
+            key = (rsid, model.effect_alleles[row])
+            if key not in lines:
+                lines[key] = [rsid, model.chroms[row], model.positions[row], model.effect_alleles[row],
+                              model.other_alleles[row]] + [0.0] * len(models)
+            lines[key][5 + column] = model.weights[row]
+    merged = pd.DataFrame(list(lines.values()),
+                          columns=["ID", "CHR", "POS", "A1", "A2", *(model.score_id for model in models)])
+    merged.to_csv(path, sep="\t", index=False)
+    return len(models)
+
+
+def split_merged_sscore(models, sscore_lines, bed, used_ids):
+    """
+    Per-model .sscore lines from a plink2 run on a write_merged_score_file() file
+    (with cols=+scoresums). plink2 reports one ALLELE_CT and NAMED_ALLELE_DOSAGE_SUM
+    over every line of the file, so those are recounted per model from the calls of
+    the `used_ids` (--score list-variants) in `bed`, a PlinkBed, and SCORE1_AVG is
+    the model's plink2 SUM column over its own ALLELE_CT. Returns, per model, the
+    .sscore lines and the IDs of the variants it used.
+    """
+    lines = [line.split() for line in sscore_lines if line.strip()]
+    header, rows = lines[0], lines[1:]
+    indices = bed.variant_indices(used_ids)
+    bim = bed.bim.iloc[indices]
+    dosages = bed.read_dosages(indices)
+    results = []
+    for model in models:
+        # .bim A1 is the VCF ALT and A2 the REF for plink2-made files
+        matched, effect_dosage, _ = match_dosages(model, bim["id"].tolist(), bim["a2"].to_numpy(),
+                                                  bim["a1"].to_numpy(), dosages)
+        dosage = effect_dosage[matched]
+        observed = ~np.isnan(dosage)
+        column = header.index(f"{model.score_id}_SUM")
+        score_sum = np.array([float(row[column]) for row in rows])
+        results.append((
+            _sscore_lines(bed.sample_ids, 2 * observed.sum(axis=0), np.where(observed, dosage, 0.0).sum(axis=0),
+                          score_sum),
+            model.rsids[matched].tolist(),
+        ))
+    return results
+
+
+def score_vcf(input_vcf, model, stage=None):
+    """
+    Stream a VCF once and score it with a ScoreConsumer. Returns the .sscore lines
+    and the ALT dosages of the variants used. Indexed .vcf.gz inputs are read by
+    region fetch of the score sites only. The number of records read is stored on
+    `stage`, a metrics StageRecord, when one is given.
+    """
+    scanner = VcfScanner(input_vcf, [ScoreConsumer(model)])
+    result = scanner.run()["score"]
+    if stage is not None:
+        stage.variants = scanner.records
+    return result
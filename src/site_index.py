@@ -0,0 +1,116 @@
+import re
+
+from vcf_io import normalize_chrom
+
+_COMPLEMENT = str.maketrans("ACGTacgt", "TGCAtgca")
+# Optional position columns of the drug annotation table
+_ANNOTATION_CHROM_COLUMNS = ("chrom", "chromosome", "chr", "hm_chr")
+_ANNOTATION_POS_COLUMNS = ("pos", "position", "hm_pos")
+_RSID = re.compile(r"rs\d+", re.IGNORECASE)
+
+
+def _column(df, names):
+    columns = {str(column).lower(): column for column in df.columns}
+    for name in names:
+        if name in columns:
+            return columns[name]
+    return None
+
+
+def has_annotation_positions(annotations):
+    """True when the annotation table has its own chromosome and position columns."""
+    return (_column(annotations, _ANNOTATION_CHROM_COLUMNS) is not None
+            and _column(annotations, _ANNOTATION_POS_COLUMNS) is not None)
+
+
+class SiteIndex:
+    """
+    (chrom, pos) index of the score and annotation sites with their alleles, so
+    records without an rsID (ID "." or a chr:pos style name) are matched by position
+    and both alleles. A matched record takes the site's rsID; REF/ALT are complemented
+    when the record is on the other strand. Allele swaps need no rewrite, scoring
+    orients dosages on the effect allele either way.
+    """
+
+    def __init__(self):
+        self._sites = {}
+        self.ids = set()
+
+    def add(self, chrom, pos, rsid, *alleles):
+        if not rsid or pos is None or int(pos) < 0:
+            return
+        key = (normalize_chrom(chrom), int(pos))
+        self._sites.setdefault(key, []).append((rsid, frozenset(a.upper() for a in alleles if a)))
+        self.ids.add(rsid)
+
+    @classmethod
+    def for_models(cls, models, annotations=None, assembly=None):
+        """
+        Sites of the score models' hm_chr/hm_pos and effect/other alleles, plus the
+        rows of the annotation table that carry a chromosome and position (of
+        `assembly` only, when the table has an assembly column).
+        """
+        index = cls()
+        for model in models:
+            for rsid, chrom, pos, effect_allele, other_allele in zip(
+                    model.rsids, model.chroms, model.positions, model.effect_alleles, model.other_alleles):
+                index.add(chrom, pos, rsid, effect_allele, other_allele)
+        if annotations is not None:
+            index.add_annotations(annotations, assembly)
+        return index
+
+    def add_annotations(self, annotations, assembly=None):
+        if not has_annotation_positions(annotations):
+            return
+        chrom_column = _column(annotations, _ANNOTATION_CHROM_COLUMNS)
+        pos_column = _column(annotations, _ANNOTATION_POS_COLUMNS)
+        rows = annotations
+        assembly_column = _column(annotations, ("assembly", "genome_build"))
+        if assembly and assembly_column is not None:
+            rows = rows[rows[assembly_column] == assembly]
+        ref_column = _column(annotations, ("ref",))
+        alt_column = _column(annotations, ("alt",))
+        for _, row in rows.iterrows():
+            pos = str(row[pos_column]).strip()
+            if pos.isdigit():
+                alleles = [row[c] for c in (ref_column, alt_column) if c is not None]
+                self.add(row[chrom_column], pos, row["Variant"], *alleles)
+
+    @property
+    def positions(self):
+        return set(self._sites)
+
+    def positions_for(self, rsids):
+        """Positions of the sites whose rsID, lower-cased, is in `rsids`."""
+        return {key for key, sites in self._sites.items() if any(rsid.lower() in rsids for rsid, _ in sites)}
+
+    def covers(self, rsids):
+        """True when every rsID of `rsids` (lower-cased) has a site, so a region fetch of positions_for() finds them all."""
+        return set(rsids) <= {rsid.lower() for rsid in self.ids}
+
+    def resolve(self, fields):
+        """
+        `fields` of a VCF record with ID, REF and ALT of the matching site, or `fields`
+        itself when it has an rsID of its own or no site at its position has both its
+        alleles, in either order. Sites with a single known allele are never matched.
+        Palindromic (A/T, C/G) SNVs are only matched on the forward strand, as plink2 does.
+        """
+        if len(fields) < 5 or not fields[1].isdigit():
+            return fields
+        # A different rsID at a site's position is another variant, not a missing label
+        if fields[2] in self.ids or _RSID.fullmatch(fields[2]):
+            return fields
+        candidates = self._sites.get((normalize_chrom(fields[0]), int(fields[1])))
+        if not candidates or "," in fields[4]:
+            return fields
+        ref, alt = fields[3].upper(), fields[4].upper()
+        flipped = (ref.translate(_COMPLEMENT), alt.translate(_COMPLEMENT))
+        can_flip = len(ref) == len(alt) == 1 and {ref, alt} != set(flipped)
+        for rsid, alleles in candidates:
+            if len(alleles) != 2:
+                continue
+            if alleles == {ref, alt}:
+                return fields[:2] + [rsid] + fields[3:]
+            if can_flip and alleles == set(flipped):
+                return fields[:2] + [rsid, *flipped] + fields[5:]
+        return fields
@@ -1,13 +1,32 @@
 from datetime import datetime
 import os
-import subprocess
 import json
 import sys
 import os
 import pandas as pd
-import subprocess
+import io
 from pathlib import Path
 
+from scoring import ScoreSetConsumer, write_merged_score_file, split_merged_sscore
+from score_registry import registry
+from plink_bed import PlinkBed
+from workspace import JobWorkspace, STEP_TIMEOUT, new_job_id
+from metrics import JobMetrics, run_child
+from resources import resource_scheduler, JobResources
+from genotype_store import genotype_store
+from build_detect import resolve_assembly, AUTO_ASSEMBLY
+from site_index import SiteIndex
+from annotation_sites import annotation_sites
+from vcf_io import open_vcf
+from vcf_scanner import VcfConsumer, VcfScanner, PrefilterConsumer, QcConsumer
+
+# Rows parsed at a time when the VCF is filtered by ID
+VCF_CHUNK_ROWS = int(os.environ.get("PRS_VCF_CHUNK_ROWS", "100000"))
+# QC statistics need every record, so an indexed VCF is no longer read by region fetch
+QC_ENABLED = os.environ.get("PRS_QC_ENABLED", "0") not in ("0", "false", "False")
+# Match records without a known rsID by (chrom, pos, ref, alt) against the score and annotation sites
+POSITION_MATCHING = os.environ.get("PRS_POSITION_MATCHING", "1") not in ("0", "false", "False")
+
 def log_message(msg, log_file=None):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     log_msg = f"[{timestamp}] {msg}"
@@ -18,7 +37,10 @@ def log_message(msg, log_file=None):
 
 def parse_profile_file(input_path):
     with open(input_path) as f:
-        lines = [line.strip() for line in f if line.strip()]
+        return parse_profile_lines(f)
+
+def parse_profile_lines(lines):
+    lines = [line.strip() for line in lines if line.strip()]
     if len(lines) < 2:
         raise ValueError("No data rows found in the file.")
 
@@ -30,7 +52,7 @@ def parse_profile_file(input_path):
         # Rename fields as requested
         out = {}
         for k, v in record.items():
-            if k == "IID":
+            if k in ("IID", "#IID"):
                 out["id"] = v
             elif k == "ALLELE_CT":
                 out["number_of_alleles_observed"] = int(v)
@@ -44,153 +66,175 @@ def parse_profile_file(input_path):
 
 def create_prs_table(
     sscore_vars_path,
-    full_score_path,
-    afreq_path,
+    score_model,
     bfile_prefix,
     sample,
     output_dir="output",
-    clean_tmp_files=True
+    metrics=None,
+    per_sample=False
 ):
+    metrics = metrics or JobMetrics()
     os.makedirs(output_dir, exist_ok=True)
     # Prefix log file with sample name
     log_file = os.path.join(output_dir, f"{sample}_create_table_with_used_snps.log")
 
     log_message("Starting PRS table creation pipeline", log_file)
 
-    # 1. Subset score file using grep
-    subset_score_path = os.path.join(output_dir, f"{sample}_subset_score.txt")
-    grep_cmd = [
-        "grep", "-Fwf", sscore_vars_path, full_score_path
-    ]
-    log_message(f"Running grep to subset score file: {' '.join(grep_cmd)}", log_file)
-    with open(subset_score_path, "w") as out_f:
-        result = subprocess.run(grep_cmd, stdout=out_f)
-    if result.returncode != 0:
-        log_message("grep command failed", log_file)
-        raise RuntimeError("grep command failed")
-    log_message(f"Subset score file created at {subset_score_path}", log_file)
-
-    # 2. Extract genotypes using plink2
-    plink_out_prefix = os.path.join(output_dir, f"{sample}_plink_extract")
-    os.makedirs(os.path.dirname(plink_out_prefix), exist_ok=True)
-    plink_cmd = [
-        "plink2", "--bfile", bfile_prefix,
-        "--extract", sscore_vars_path,
-        "--recode", "A",
-        "--out", plink_out_prefix
-    ]
-    log_message(f"Running plink2 to extract genotypes: {' '.join(plink_cmd)}", log_file)
-    result = subprocess.run(plink_cmd)
-    if result.returncode != 0:
-        log_message("plink2 command failed", log_file)
-        raise RuntimeError("plink2 command failed")
-
-
-    # 3. Read subset_score.txt
-    log_message("Reading subset score file", log_file)
-    score_cols = [
-        "rsID", "chr_name", "chr_position", "effect_allele", "other_allele", "effect_weight",
-        "allelefrequency_effect", "is_haplotype", "imputation_method", "variant_type", "OR",
-        "hm_source", "hm_rsID", "hm_chr", "hm_pos", "hm_inferOtherAllele", "hm_match_chr", "hm_match_pos"
-    ]
-    score = pd.read_csv(subset_score_path, sep="\t", header=None, names=score_cols, dtype=str)
-    score = score[["rsID", "other_allele", "effect_allele", "effect_weight"]]
-    score = score.rename(columns={
-        "rsID": "rsid",
-        "other_allele": "ref",
-        "effect_allele": "effect_allele",
-        "effect_weight": "effect_size"
-    })
-    score["effect_size"] = score["effect_size"].astype(float)
-
-    # 4. Read .afreq (PLINK2 frequency file)
-    log_message("Reading allele frequency file", log_file)
-    afreq_cols = ["#CHROM", "POS", "ID", "REF", "ALT", "ALT_FREQS", "OBS_CT"]
-    afreq = pd.read_csv(afreq_path, sep="\t", header=0, names=afreq_cols, dtype=str)
-    afreq = afreq[["ID", "ALT_FREQS"]]
-
-    # 5. Read .raw (PLINK2 genotype file)
-    log_message("Reading PLINK2 .raw genotype file", log_file)
-    raw_file = plink_out_prefix + ".raw"
-    raw = pd.read_csv(raw_file, sep=r'\s+')
-    genotype_cols = [col for col in raw.columns if col not in ["FID", "IID", "PAT", "MAT", "SEX", "PHENOTYPE"]]
-    genotypes = raw.loc[0, genotype_cols].to_frame().reset_index()
-    genotypes.columns = ["rsid", "genotype"]
-    genotypes['rsid'] = genotypes['rsid'].str.split('_').str[0]
-
-    # 6. Merge all
+    # 1. Variants plink2 used for the score (--score list-variants)
+    with open(sscore_vars_path) as f:
+        used_ids = [line.strip() for line in f if line.strip()]
+    log_message(f"{len(score_model.rows_for(used_ids))} score variants used", log_file)
+
+    # 2. ALT dosages of those variants for every sample, decoded straight from the dedup .bed
+    log_message(f"Reading genotypes from {bfile_prefix}.bed", log_file)
+    with metrics.stage("bed_decode") as stage, PlinkBed(bfile_prefix) as bed:
+        stage.variants = bed.n_variants
+        indices = bed.variant_indices(used_ids)
+        genotypes = pd.DataFrame(bed.read_dosages(indices), columns=bed.sample_ids)
+        genotypes.insert(0, "rsid", bed.bim["id"].to_numpy()[indices])
+        # Decoded pages of the memory-mapped .bed are not counted by /proc/self/io
+        stage.bytes_read += len(indices) * bed.bytes_per_variant
+
+    return write_prs_tables(score_model, genotypes, sample, output_dir, log_file, metrics, per_sample)
+
+def create_prs_table_from_genotypes(genotypes, score_model, sample, output_dir="output", metrics=None, per_sample=False):
+    # Same tables as create_prs_table, for genotypes already decoded in-process
+    os.makedirs(output_dir, exist_ok=True)
+    log_file = os.path.join(output_dir, f"{sample}_create_table_with_used_snps.log")
+    log_message("Starting PRS table creation from in-process genotypes", log_file)
+
+    return write_prs_tables(score_model, genotypes, sample, output_dir, log_file, metrics or JobMetrics(), per_sample)
+
+def write_prs_tables(score_model, genotypes, sample, output_dir, log_file, metrics, per_sample=False):
+    """
+    Write used-SNP tables from `genotypes`, an rsid column followed by one ALT dosage
+    column per sample. By default only the first sample is written, as
+    {sample}_final_prs_table.tsv. With `per_sample` every sample of a multi-sample
+    VCF gets {sample}_{sample ID}_final_prs_table.tsv. Returns {table name: table}.
+    """
+    rows = score_model.rows_for(genotypes["rsid"])
+    columns = list(genotypes.columns[1:])
+    if not per_sample or len(columns) == 1:
+        targets = {sample: columns[0]}
+    else:
+        targets = {f"{sample}_{column}": column for column in columns}
+
+    tables = {}
+    with metrics.stage("prs_table", variants=len(rows) * len(targets)) as stage:
+        for name, column in targets.items():
+            sample_genotypes = genotypes[["rsid", column]].rename(columns={column: "genotype"})
+            if not sample_genotypes["genotype"].isna().any():
+                sample_genotypes["genotype"] = sample_genotypes["genotype"].astype(int)
+            tables[name] = build_prs_table(score_model, rows, sample_genotypes, name, output_dir, log_file)
+            stage.wrote_files(os.path.join(output_dir, f"{name}_final_prs_table.tsv"))
+    return tables
+
+def build_prs_table(score_model, rows, genotypes, sample, output_dir, log_file):
+    # Score and frequency columns come from the resident score registry
     log_message("Merging score, frequency, and genotype data", log_file)
-    merged = score.merge(afreq, left_on="rsid", right_on="ID", how="left")
+    merged = pd.DataFrame({
+        "rsid": score_model.rsids[rows],
+        "ref": score_model.other_alleles[rows],
+        "effect_allele": score_model.effect_alleles[rows],
+        "effect_size": score_model.weights[rows],
+        "ALT_FREQS": score_model.alt_freqs[rows],
+    })
     merged = merged.merge(genotypes, on="rsid", how="left")
-    merged.drop(columns="ID", inplace=True)
-
-    # 7. Reorder columns
-    merged = merged[["rsid", "ref", "effect_allele", "effect_size", "ALT_FREQS", "genotype"]]
 
-    # 8. Save to file
+    # Save to file
     final_table_path = os.path.join(output_dir, f"{sample}_final_prs_table.tsv")
     merged.to_csv(final_table_path, sep="\t", index=False)
     log_message(f"Done! Output written to {final_table_path}", log_file)
 
-    # 9. Clean up temporary files
-    if clean_tmp_files:
-        log_message("Cleaning up temporary files...", log_file)
-        tmp_files = [
-            subset_score_path,
-            raw_file,
-            plink_out_prefix + ".log",
-            plink_out_prefix + ".nosex"
-        ]
-        for f in tmp_files:
-            if os.path.exists(f):
-                os.remove(f)
-        log_message("Temporary files removed.", log_file)
-
     return merged
 
-def read_vcf_as_df(vcf_path: str) -> pd.DataFrame:
+def read_vcf_header(vcf_path: str) -> list:
     # Grab real header (so we capture sample column names)
-    with open(vcf_path, "r", encoding="utf-8", errors="ignore") as f:
+    with open_vcf(vcf_path) as f:
         for line in f:
             if line.startswith("#CHROM"):
-                header = line.lstrip("#").strip().split("\t")
-                break
-        else:
-            header = ['CHROM','POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', 'sample']
+                return parse_vcf_header(line)
+    return parse_vcf_header(None)
+
+def parse_vcf_header(chrom_line) -> list:
+    if chrom_line:
+        header = chrom_line.lstrip("#").strip().split("\t")
+    else:
+        header = ['CHROM','POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', 'sample']
 
     if header[-1] != "sample":
         header[-1] = "sample"
+    return header
 
-    df = pd.read_csv(
+def _read_vcf_records(vcf_path, header: list, chunksize: int = None):
+    return pd.read_csv(
         vcf_path,
         sep="\t",
         comment="#",
         names=header,
         dtype=str,
         engine="c",
+        chunksize=chunksize,
     )
-    if "#CHROM" in df.columns:
-        df = df.rename(columns={"#CHROM": "CHROM"})
 
+def _normalize_ids(df: pd.DataFrame) -> pd.DataFrame:
     df["ID"] = df["ID"].fillna("").str.lower()
     df.loc[~df["ID"].str.startswith("rs"), "ID"] = "rs" + df["ID"]
-
     return df
 
-def intersect_vcf_with_tsv(vcf_path: str, tsv_path: str, out_csv: str, sample: str) -> pd.DataFrame:
+def read_vcf_as_df(vcf_path: str, keep_ids: set = None, chunksize: int = VCF_CHUNK_ROWS) -> pd.DataFrame:
+    """
+    VCF records as a DataFrame of strings with normalized IDs. With `keep_ids`, only
+    rows whose normalized ID is in the set are kept and the file is read in chunks.
+    """
+    if keep_ids is not None:
+        return filter_vcf_by_ids(vcf_path, keep_ids, chunksize)[0]
+    header = read_vcf_header(vcf_path)
+    with open_vcf(vcf_path) as f:
+        return _normalize_ids(_read_vcf_records(f, header))
+
+def filter_vcf_by_ids(vcf_path: str, keep_ids: set, chunksize: int = VCF_CHUNK_ROWS):
+    # (rows whose normalized ID is in keep_ids, records read); at most `chunksize` rows are parsed at a time
+    header = read_vcf_header(vcf_path)
+    kept = []
+    records = 0
+    # open_vcf streams .vcf.gz through multi-threaded bgzip where available
+    with open_vcf(vcf_path) as f, _read_vcf_records(f, header, chunksize) as reader:
+        for chunk in reader:
+            records += len(chunk)
+            chunk = _normalize_ids(chunk)
+            kept.append(chunk[chunk["ID"].str.strip().isin(keep_ids)])
+    if not kept:
+        return pd.DataFrame(columns=header), records
+    return pd.concat(kept, ignore_index=True), records
+
+def intersect_vcf_with_tsv(vcf_path: str, tsv_path: str, out_csv: str, sample: str, metrics: JobMetrics = None,
+                           chunksize: int = VCF_CHUNK_ROWS) -> pd.DataFrame:
     # Prefix the output file with the sample name if not already present
     out_dir = Path(out_csv).parent
     out_name = Path(out_csv).name
     if not out_name.startswith(f"{sample}_"):
         out_csv = str(out_dir / f"{sample}_{out_name}")
 
-    # Read inputs
-    vcf_df = read_vcf_as_df(vcf_path)
+    metrics = metrics or JobMetrics()
+
+    with metrics.stage("drug_annotation") as stage:
+        # Read inputs; only VCF rows with an annotated ID are kept in memory
+        ann = load_drug_annotations(tsv_path)
+        vcf_df, stage.variants = filter_vcf_by_ids(vcf_path, set(ann["Variant"]), chunksize)
+        merged = merge_drug_annotations(vcf_df, ann, out_csv)
+        stage.read_files(vcf_path, tsv_path)
+        stage.wrote_files(out_csv)
+        return merged
 
+def load_drug_annotations(tsv_path: str) -> pd.DataFrame:
     ann = pd.read_csv(tsv_path, sep="\t", dtype=str).fillna("")
     # Normalize rsID case for safe join
-    vcf_df["ID"] = vcf_df["ID"].str.strip().str.lower()
     ann["Variant"] = ann["Variant"].str.strip().str.lower()
+    return ann
+
+def merge_drug_annotations(vcf_df: pd.DataFrame, ann: pd.DataFrame, out_csv: str) -> pd.DataFrame:
+    vcf_df["ID"] = vcf_df["ID"].str.strip().str.lower()
 
     # If TSV can have duplicate rows per rsID, keep first (or change to aggregate if you prefer)
     ann = ann.drop_duplicates(subset=["Variant"], keep="first")
@@ -200,131 +244,441 @@ def intersect_vcf_with_tsv(vcf_path: str, tsv_path: str, out_csv: str, sample: s
         left_on="ID",
         right_on="Variant",
         how="inner",
-        copy=False,
     )
     Path(out_csv).parent.mkdir(parents=True, exist_ok=True)
     merged.to_csv(out_csv, index=False)
     return merged
 
+class DrugAnnotationConsumer(VcfConsumer):
+    """
+    Scanner consumer writing the same intersection CSV as intersect_vcf_with_tsv.
+    After use_site_index(), records at annotated positions are joined on the rsID
+    they were matched to.
+    """
+
+    name = "drug_annotation"
+
+    def __init__(self, tsv_path: str, out_csv: str):
+        self.annotations = load_drug_annotations(tsv_path)
+        self.normalized_ids = set(self.annotations["Variant"])
+        self.out_csv = out_csv
+        self.header = parse_vcf_header(None)
+        self.lines = []
+        self.site_index = None
+
+    def use_site_index(self, site_index):
+        self.site_index = site_index
+        self.positions = site_index.positions_for(self.normalized_ids)
+        # Region fetch only when every annotated variant has a known site
+        if site_index.covers(self.normalized_ids):
+            self.fetch_positions = self.positions
+
+    def start(self, header_lines, samples):
+        if header_lines and header_lines[-1].startswith("#CHROM"):
+            self.header = parse_vcf_header(header_lines[-1])
+
+    def consume(self, fields, line):
+        if self.site_index:
+            resolved = self.site_index.resolve(fields)
+            if resolved is not fields:
+                line = "\t".join(resolved) + "\n"
+        self.lines.append(line)
+
+    def finish(self):
+        # Parsed with the same read_csv options as read_vcf_as_df
+        if self.lines:
+            vcf_df = _read_vcf_records(io.StringIO("".join(self.lines)), self.header)
+        else:
+            vcf_df = pd.DataFrame(columns=self.header)
+        return merge_drug_annotations(_normalize_ids(vcf_df), self.annotations, self.out_csv)
+
+
+PRS_ENGINES = ("plink2", "numpy")
+DRUG_ANNOTATIONS_PATH = os.environ.get("PRS_DRUG_ANNOTATIONS", "input/annotations/drug_toxicity_annotations.tsv")
+VCF_SUFFIXES = (".vcf", ".vcf.gz", ".vcf.bgz")
+
+def pipeline_settings(engine):
+    """
+    The settings besides the VCF, build and score files that change a run's output:
+    engine, position matching, QC and the size and mtime of the drug annotation table.
+    Part of the result cache key.
+    """
+    try:
+        stat = os.stat(DRUG_ANNOTATIONS_PATH)
+        annotations = f"{stat.st_size}:{stat.st_mtime_ns}"
+    except FileNotFoundError:
+        annotations = "missing"
+    return f"engine={engine};position_matching={int(POSITION_MATCHING)};qc={int(QC_ENABLED)};annotations={annotations}"
+
+def merge_score_records(score_models, score_records):
+    """
+    Records of the first score model, each with a "scores" entry holding the result
+    of every model by score id. `score_records` has one record list per model.
+    """
+    records = score_records[0]
+    for i, record in enumerate(records):
+        record["scores"] = {
+            model.score_id: {k: v for k, v in model_records[i].items() if k != "id"}
+            for model, model_records in zip(score_models, score_records)
+        }
+    return records
 
-def run_plink_pipeline(input_vcf, assembly='GRCh37', clean_tmp_files=True):
-    # Set up paths
-    if assembly == "GRCh38":
-        prs_path = "input/prs/PGS000195_hmPOS_GRCh38.txt"
-        freq_path = "input/prs/PGS000195_hmPOS_GRCh38.freq"
-    elif assembly == "GRCh37":
-        prs_path = "input/prs/PGS000195_hmPOS_GRCh37.txt"
-        freq_path = "input/prs/PGS000195_hmPOS_GRCh37.freq"
-    else:
-        raise ValueError(f"Unknown ASSEMBLY: {assembly}")
+def vcf_sample_name(vcf_path):
+    name = os.path.basename(vcf_path)
+    for suffix in VCF_SUFFIXES[::-1]:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name.replace('.vcf', '')
+
+def list_vcf_files(vcf_dir):
+    return sorted(
+        os.path.join(vcf_dir, name) for name in os.listdir(vcf_dir)
+        if name.endswith(VCF_SUFFIXES) and not name.endswith((".prefiltered.vcf", ".filtered.vcf"))
+    )
 
-    drug_annotations_path = "input/annotations/drug_toxicity_annotations.tsv"
-    sample = os.path.basename(input_vcf).replace('.vcf', '')
-    log_dir = "log"
+def job_log_file(job_id):
+    # Named by job, so concurrent uploads with the same sample name keep separate logs
+    log_dir = os.environ.get("PRS_LOG_DIR", "log")
     os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, f"{sample}.log")
-
-    filtered_vcf = f"input/vcf/{sample}.filtered.vcf"
-    plink_prefix = f"input/plink/{sample}"
-    output_json = f"output/{sample}.json"
+    return os.path.join(log_dir, f"{job_id}.log")
+
+def bfile_paths(prefix):
+    return [f"{prefix}.bed", f"{prefix}.bim", f"{prefix}.fam"]
+
+def merged_freq_file(score_models, path):
+    # --read-freq input covering every model's variants; the first model's line wins for a shared ID
+    if len(score_models) == 1:
+        return score_models[0].freq_path
+    freqs = pd.concat([pd.read_csv(model.freq_path, sep="\t", dtype=str) for model in score_models])
+    freqs.drop_duplicates(subset=["ID"], keep="first").to_csv(path, sep="\t", index=False)
+    return path
+
+def count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+def score_vcf_file(vcf_path, sample, score_models, workspace, log_file, metrics,
+                   engine="plink2", prefilter=True, per_sample=False, resources=None, store_key=None):
+    """
+    Score one VCF inside `workspace`: every PRS of `score_models` for all of its
+    samples, used-SNP table(s) per score, the drug annotation intersection and, if
+    enabled, QC statistics. The numpy engine scores all models in the one VCF scan;
+    plink2 in one --score call on a merged weight file (two when only some models
+    have a frequency file), split per model afterwards. The first model's tables
+    are {sample}_final_prs_table.tsv, the others' {sample}_{score id}_final_prs_table.tsv.
+    bcftools/plink2 get the thread and memory budget of `resources` (a JobResources),
+    refreshed per step. With `store_key` the calls at score and annotation sites are
+    kept in the genotype store.
+    Returns (records, names of the result files written to the workspace).
+    """
+    prefiltered_vcf = workspace.file(f"{sample}.prefiltered.vcf")
+    filtered_vcf = workspace.file(f"{sample}.filtered.vcf")
+    plink_prefix = workspace.file(sample)
+    stage_vcf = vcf_path
+    stage_records = None
+    outputs = [f"{sample}_intersection_with_drug_annotation.csv", f"{sample}_create_table_with_used_snps.log"]
+
+    # Step 0: Read the upload once. Every consumer gets the records at its sites:
+    # drug annotation hits, QC statistics, and the PGS (numpy engine) or the
+    # score/annotation sites handed to bcftools and plink2
+    drug_annotations = DrugAnnotationConsumer(
+        DRUG_ANNOTATIONS_PATH, workspace.file(f"{sample}_intersection_with_drug_annotation.csv")
+    )
+    # Records without a known rsID are matched by position and alleles; the
+    # prefilter writes them with the matched rsID for bcftools/plink2
+    site_index = None
+    if POSITION_MATCHING:
+        assembly = score_models[0].entry.get("assembly")
+        # Annotation rsIDs located in the reference sites VCF let an indexed upload be region fetched
+        site_index = SiteIndex.for_models(score_models, annotation_sites.locate(drug_annotations.annotations, assembly),
+                                          assembly)
+        drug_annotations.use_site_index(site_index)
+    consumers = [drug_annotations]
+    if QC_ENABLED:
+        consumers.append(QcConsumer())
+    if engine == "numpy":
+        consumers.append(ScoreSetConsumer(score_models, site_index))
+    elif prefilter:
+        consumers.append(PrefilterConsumer(
+            prefiltered_vcf,
+            rsids=set().union(*(model.site_ids for model in score_models)),
+            positions=set().union(*(model.site_positions for model in score_models)),
+            annotation_ids=drug_annotations.normalized_ids,
+            site_index=site_index
+        ))
+    if store_key:
+        consumers.append(genotype_store.consumer(drug_annotations.normalized_ids, site_index))
+    scanner = VcfScanner(vcf_path, consumers)
+    log_message(f"Scanning VCF for: {', '.join(c.name for c in consumers)}...", log_file)
+    with metrics.stage("vcf_scan") as stage:
+        scan = scanner.run()
+        stage.variants = scanner.records
+        stage.bytes_read += scanner.bytes_read
+        stage.wrote_files(drug_annotations.out_csv, *([prefiltered_vcf] if "prefilter" in scan else []))
+    log_message(f"Read {scanner.records} records in {stage.wall_seconds:.1f} seconds", log_file)
+
+    if QC_ENABLED:
+        with open(workspace.file(f"{sample}_qc.json"), "w") as f:
+            json.dump(scan["qc"], f, indent=2)
+        outputs.append(f"{sample}_qc.json")
+
+    if store_key:
+        with metrics.stage("genotype_store", variants=len(scan["genotypes"])) as stage:
+            stage.wrote_files(genotype_store.save(store_key, scan["genotypes"], sample=sample,
+                                                  assembly=score_models[0].entry.get("assembly")))
+        log_message(f"Stored {len(scan['genotypes'])} sites in the genotype store", log_file)
+
+    if engine == "numpy":
+        # Steps 1-4 were done by the scan, without intermediate files
+        score_records, tables = [], {}
+        for score_model, (sscore_lines, genotypes) in zip(score_models, scan["score"]):
+            score_records.append(parse_profile_lines(sscore_lines))
+            tables.update(create_prs_table_from_genotypes(
+                genotypes,
+                score_model=score_model,
+                sample=score_table_name(sample, score_model, score_models),
+                output_dir=workspace.path,
+                metrics=metrics,
+                per_sample=per_sample
+            ))
+    else:
+        resources = resources or JobResources(resource_scheduler, workspace.job_id)
+
+        # Only score and drug-annotation sites go to bcftools
+        if prefilter:
+            stage_vcf = prefiltered_vcf
+            stage_records = scan["prefilter"]
+            log_message(f"Kept {stage_records} of {scanner.records} records for plink2", log_file)
+            workspace.check_budget()
+
+        # Step 1: Filter VCF
+        log_message("Filtering VCF (removing variants with missing ID and sex chromosomes)...", log_file)
+        log_message(f"bcftools resources: {resources.refresh().describe()}", log_file)
+        with metrics.stage("bcftools_filter", variants=stage_records) as stage:
+            result = run_child([
+                'bcftools', 'view', '-e', 'ID=="."', '-t', '^chrX,chrY,X,Y', '-m2', '-M2',
+                *resources.bcftools_args(), stage_vcf, '-o', filtered_vcf
+            ], timeout=STEP_TIMEOUT)
+            if result.returncode != 0:
+                log_message(f"BCFtools filtering failed: {result.stderr}", log_file)
+                raise RuntimeError("BCFtools filtering failed")
+            stage.read_files(stage_vcf)
+            stage.wrote_files(filtered_vcf)
+        log_message(f"VCF filtered in {stage.wall_seconds:.1f} seconds", log_file)
+        workspace.check_budget()
+
+        # Step 2: Convert to PLINK
+        log_message("Converting filtered VCF to PLINK format...", log_file)
+        log_message(f"plink2 resources: {resources.refresh().describe()}", log_file)
+        with metrics.stage("plink_make_bed") as stage:
+            result = run_child([
+                'plink2', '--vcf', filtered_vcf, '--make-bed', *resources.plink_args(), '--out', plink_prefix
+            ], timeout=STEP_TIMEOUT)
+            if result.returncode != 0:
+                log_message(f"PLINK2 conversion failed: {result.stderr}", log_file)
+                raise RuntimeError("PLINK2 conversion failed")
+            stage.variants = count_lines(f"{plink_prefix}.bim")
+            stage.read_files(filtered_vcf)
+            stage.wrote_files(*bfile_paths(plink_prefix))
+        log_message(f"PLINK files created in {stage.wall_seconds:.1f} seconds", log_file)
+        workspace.check_budget()
+
+        # Step 3: Remove duplicate variants
+        log_message("Removing duplicate variants with PLINK2...", log_file)
+        log_message(f"plink2 resources: {resources.refresh().describe()}", log_file)
+        with metrics.stage("plink_rm_dup", variants=count_lines(f"{plink_prefix}.bim")) as stage:
+            result = run_child([
+                'plink2', '--bfile', plink_prefix, '--rm-dup', 'force-first', '--make-bed', *resources.plink_args(),
+                '--out', f"{plink_prefix}_dedup"
+            ], timeout=STEP_TIMEOUT)
+            if result.returncode != 0:
+                log_message(f"PLINK2 duplicate removal failed: {result.stderr}", log_file)
+                raise RuntimeError("PLINK2 duplicate removal failed")
+            stage.read_files(*bfile_paths(plink_prefix))
+            stage.wrote_files(*bfile_paths(f"{plink_prefix}_dedup"))
+        log_message(f"Duplicates removed in {stage.wall_seconds:.1f} seconds", log_file)
+        workspace.check_budget()
+
+        # Step 4: Calculate every PRS in one --score pass over the genotypes, from a weight
+        # file with a column per model. Models with and without a --read-freq file get
+        # separate passes, since plink2 takes one frequency source per run.
+        records_by_id, tables = {}, {}
+        groups = [group for group in ([m for m in score_models if m.freq_path],
+                                      [m for m in score_models if not m.freq_path]) if group]
+        for i, group in enumerate(groups):
+            score_prefix = f"{plink_prefix}_dedup.prs{i}"
+            weights_path = f"{score_prefix}.weights.tsv"
+            columns = write_merged_score_file(group, weights_path)
+            freq_args = ['--read-freq', merged_freq_file(group, f"{score_prefix}.freq")] if group[0].freq_path else []
+            log_message(f"Calculating PRS {', '.join(model.score_id for model in group)}...", log_file)
+            log_message(f"plink2 resources: {resources.refresh().describe()}", log_file)
+            with metrics.stage("plink_score", variants=count_lines(f"{plink_prefix}_dedup.bim")) as stage:
+                result = run_child([
+                    'plink2', '--bfile', f"{plink_prefix}_dedup", *freq_args,
+                    '--score', weights_path, '1', '4', 'header', 'list-variants', 'cols=+scoresums',
+                    '--score-col-nums', f"6-{5 + columns}", *resources.plink_args(),
+                    '--out', score_prefix
+                ], timeout=STEP_TIMEOUT)
+                if result.returncode != 0:
+                    log_message(f"PLINK2 PRS calculation failed: {result.stderr}", log_file)
+                    raise RuntimeError("PLINK2 PRS calculation failed")
+                stage.read_files(*bfile_paths(f"{plink_prefix}_dedup"), *freq_args[1:], weights_path)
+                stage.wrote_files(f"{score_prefix}.sscore", f"{score_prefix}.sscore.vars")
+            log_message(f"PRS calculated in {stage.wall_seconds:.1f} seconds", log_file)
+
+            # Step 5: Per-sample results of each model from the shared .sscore
+            with open(f"{score_prefix}.sscore") as f:
+                sscore_lines = f.readlines()
+            with open(f"{score_prefix}.sscore.vars") as f:
+                used_ids = [line.strip() for line in f if line.strip()]
+            with PlinkBed(f"{plink_prefix}_dedup") as bed:
+                split = split_merged_sscore(group, sscore_lines, bed, used_ids)
+
+            for score_model, (model_lines, model_ids) in zip(group, split):
+                records_by_id[score_model.score_id] = parse_profile_lines(model_lines)
+                vars_path = f"{plink_prefix}_dedup.{score_model.score_id}.prs.sscore.vars"
+                with open(vars_path, "w") as f:
+                    f.writelines(f"{rsid}\n" for rsid in model_ids)
+
+                # Step 6: Table with used snps
+                tables.update(create_prs_table(
+                    sscore_vars_path=vars_path,
+                    score_model=score_model,
+                    bfile_prefix=f"{plink_prefix}_dedup",
+                    output_dir=workspace.path,
+                    sample=score_table_name(sample, score_model, score_models),
+                    metrics=metrics,
+                    per_sample=per_sample
+                ))
+        score_records = [records_by_id[model.score_id] for model in score_models]
+
+    outputs += [f"{name}_final_prs_table.tsv" for name in tables]
+    outputs += [f"{score_table_name(sample, model, score_models)}_create_table_with_used_snps.log"
+                for model in score_models[1:]]
+    return merge_score_records(score_models, score_records), outputs
+
+def score_table_name(sample, score_model, score_models):
+    # The first score keeps the single-score file names
+    return sample if score_model is score_models[0] else f"{sample}_{score_model.score_id}"
+
+def run_plink_pipeline(input_vcf, assembly=AUTO_ASSEMBLY, clean_tmp_files=True, engine="plink2", prefilter=True, job_id=None, metrics=None,
+                       store_key=None, score_ids=None):
+    """
+    Score one VCF with the registered scores `score_ids` of `assembly` (the manifest
+    defaults when None); "auto" detects the build from the VCF. Returns one record per sample for the first score, each
+    with a "scores" entry holding every requested score.
+    """
+    if engine not in PRS_ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
 
-    os.makedirs("input/vcf", exist_ok=True)
-    os.makedirs("input/plink", exist_ok=True)
-    os.makedirs("output", exist_ok=True)
+    # Set up paths
+    sample = vcf_sample_name(input_vcf)
+    job_id = job_id or new_job_id()
+    log_file = job_log_file(job_id)
 
     start_time = datetime.now()
     log_message("Script started", log_file)
     log_message(f"Input VCF: {input_vcf}", log_file)
-    log_message(f"PRS file: {prs_path}", log_file)
+    assembly, detection = resolve_assembly(input_vcf, assembly)
+    log_message(f"Assembly: {assembly}" + (f" (detected by {detection['method']})" if detection else ""), log_file)
+    score_models = registry.select(assembly, score_ids)
+    log_message(f"PRS files: {', '.join(model.prs_path for model in score_models)}", log_file)
+    log_message(f"Engine: {engine}", log_file)
     log_message(f"Clean temporary files: {clean_tmp_files}", log_file)
 
-    # Step 1: Filter VCF
-    log_message("Filtering VCF (removing variants with missing ID and sex chromosomes)...", log_file)
-    step_start = datetime.now()
-    result = subprocess.run([
-        'bcftools', 'view', '-e', 'ID=="."', '-t', '^chrX,chrY,X,Y', '-m2', '-M2',
-        input_vcf, '-o', filtered_vcf
-    ], capture_output=True, text=True)
-    if result.returncode != 0:
-        log_message(f"BCFtools filtering failed: {result.stderr}", log_file)
-        raise RuntimeError("BCFtools filtering failed")
-    log_message(f"VCF filtered in {(datetime.now() - step_start).total_seconds():.1f} seconds", log_file)
-
-    # Step 2: Convert to PLINK
-    log_message("Converting filtered VCF to PLINK format...", log_file)
-    step_start = datetime.now()
-    result = subprocess.run([
-        'plink2', '--vcf', filtered_vcf, '--make-bed', '--out', plink_prefix
-    ], capture_output=True, text=True)
-    if result.returncode != 0:
-        log_message(f"PLINK2 conversion failed: {result.stderr}", log_file)
-        raise RuntimeError("PLINK2 conversion failed")
-    log_message(f"PLINK files created in {(datetime.now() - step_start).total_seconds():.1f} seconds", log_file)
-
-    # Step 3: Remove duplicate variants
-    log_message("Removing duplicate variants with PLINK2...", log_file)
-    step_start = datetime.now()
-    result = subprocess.run([
-        'plink2', '--bfile', plink_prefix, '--rm-dup', 'force-first', '--make-bed', '--out', f"{plink_prefix}_dedup"
-    ], capture_output=True, text=True)
-    if result.returncode != 0:
-        log_message(f"PLINK2 duplicate removal failed: {result.stderr}", log_file)
-        raise RuntimeError("PLINK2 duplicate removal failed")
-    log_message(f"Duplicates removed in {(datetime.now() - step_start).total_seconds():.1f} seconds", log_file)
-
-    # Step 4: Calculate PRS
-    log_message("Calculating PRS...", log_file)
-    step_start = datetime.now()
-    result = subprocess.run([
-        'plink2', '--bfile', f"{plink_prefix}_dedup", '--read-freq', freq_path,
-        '--score', prs_path, '1', '4', '6', 'header', 'list-variants',
-        '--out', f"{plink_prefix}_dedup.prs"
-    ], capture_output=True, text=True)
-    if result.returncode != 0:
-        log_message(f"PLINK2 PRS calculation failed: {result.stderr}", log_file)
-        raise RuntimeError("PLINK2 PRS calculation failed")
-    log_message(f"PRS calculated in {(datetime.now() - step_start).total_seconds():.1f} seconds", log_file)
-
-    # Step 5: Save output
-    output_json_data = parse_profile_file(f"{plink_prefix}_dedup.prs.sscore")
-    with open(output_json, "w") as f:
-        json.dump(output_json_data, f, indent=2)
-
-    # Step 6: Table with used snps
-    create_prs_table(
-        sscore_vars_path=f"{plink_prefix}_dedup.prs.sscore.vars",
-        full_score_path=prs_path,
-        afreq_path=freq_path,
-        bfile_prefix=f"{plink_prefix}_dedup",
-        output_dir="output",
-        clean_tmp_files=clean_tmp_files,
-        sample=sample
-    )
+    metrics = metrics or JobMetrics(job_id)
+
+    with JobWorkspace(job_id, keep=not clean_tmp_files) as workspace, \
+            resource_scheduler.job(workspace.job_id) as resources:
+        log_message(f"Job {workspace.job_id} scratch directory: {workspace.path}", log_file)
+        log_message(f"Job {workspace.job_id} resources: {resources.describe()}", log_file)
+        metrics.job_id = workspace.job_id
+
+        output_json_data, outputs = score_vcf_file(
+            input_vcf, sample, score_models, workspace, log_file, metrics,
+            engine=engine, prefilter=prefilter, resources=resources, store_key=store_key
+        )
+        with open(workspace.file(f"{sample}.json"), "w") as f:
+            json.dump(output_json_data, f, indent=2)
+
+        # Step 7: Move results to output/<job_id>/, the workspace is removed on exit
+        for name in [f"{sample}.json", *outputs]:
+            workspace.publish(name)
+        results_dir = workspace.results_dir
+
+    total_duration = (datetime.now() - start_time).total_seconds()
+    log_message(f"Done. Output at {results_dir}", log_file)
+    log_message(f"Total runtime: {total_duration:.1f} seconds", log_file)
+
+    return output_json_data
+
+def run_batch_pipeline(input_path, assembly=AUTO_ASSEMBLY, clean_tmp_files=True, engine=None, prefilter=True, job_id=None, metrics=None,
+                       score_ids=None):
+    """
+    Score a multi-sample VCF, or every VCF in a directory, as one job.
+    A multi-sample VCF goes through `engine` (plink2 by default) once for all of its
+    samples. Files of a directory go through `engine` one by one; by default that is
+    the in-process scorer, so no per-file bcftools/plink2 chain is started. Writes a
+    used-SNP table per sample and {batch}.json, and returns one record per sample.
+    With assembly "auto" the build is detected from the first VCF.
+    """
+    if os.path.isdir(input_path):
+        vcf_paths = list_vcf_files(input_path)
+        if not vcf_paths:
+            raise ValueError(f"No VCF files found in {input_path}")
+        batch_name = os.path.basename(os.path.normpath(input_path))
+        file_engine = engine or "numpy"
+    else:
+        vcf_paths = [input_path]
+        batch_name = vcf_sample_name(input_path)
+        file_engine = engine or "plink2"
+    if file_engine not in PRS_ENGINES:
+        raise ValueError(f"Unknown engine: {file_engine}")
+
+    job_id = job_id or new_job_id()
+    log_file = job_log_file(job_id)
 
-    #Step 6.5: Parse supplementary mutations
-    intersect_vcf_with_tsv(
-        input_vcf,
-        drug_annotations_path,
-        f"output/{sample}_intersection_with_drug_annotation.csv",
-        sample)
-
-    # Step 7: Clean up
-    if clean_tmp_files:
-        log_message("Cleaning up temporary files...", log_file)
-        temp_files = [
-            filtered_vcf,
-            f"{plink_prefix}.bed", f"{plink_prefix}.bim", f"{plink_prefix}.fam", f"{plink_prefix}.log", f"{plink_prefix}.nosex",
-            f"{plink_prefix}_dedup.bed", f"{plink_prefix}_dedup.bim", f"{plink_prefix}_dedup.fam", f"{plink_prefix}_dedup.log",
-            f"{plink_prefix}_dedup.prs.log", f"{plink_prefix}_dedup.prs.nosex", f"{plink_prefix}_dedup.prs.profile",
-            f"{plink_prefix}_dedup.prs.sscore", f"{plink_prefix}_dedup.prs.sscore.vars"
-        ]
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-        log_message("Temporary files removed", log_file)
+    start_time = datetime.now()
+    log_message("Batch started", log_file)
+    log_message(f"Input: {input_path} ({len(vcf_paths)} VCF files)", log_file)
+    assembly, detection = resolve_assembly(vcf_paths[0], assembly)
+    log_message(f"Assembly: {assembly}" + (f" (detected by {detection['method']})" if detection else ""), log_file)
+    score_models = registry.select(assembly, score_ids)
+    log_message(f"PRS files: {', '.join(model.prs_path for model in score_models)}", log_file)
+    log_message(f"Engine: {file_engine}", log_file)
+
+    metrics = metrics or JobMetrics(job_id)
+
+    records = []
+    with JobWorkspace(job_id, keep=not clean_tmp_files) as workspace, \
+            resource_scheduler.job(workspace.job_id) as resources:
+        log_message(f"Job {workspace.job_id} scratch directory: {workspace.path}", log_file)
+        log_message(f"Job {workspace.job_id} resources: {resources.describe()}", log_file)
+        metrics.job_id = workspace.job_id
+
+        outputs = []
+        for vcf_path in vcf_paths:
+            sample = vcf_sample_name(vcf_path)
+            file_records, file_outputs = score_vcf_file(
+                vcf_path, sample, score_models, workspace, log_file, metrics,
+                engine=file_engine, prefilter=prefilter, per_sample=True, resources=resources
+            )
+            # sample_name is the prefix of the sample's used-SNP table
+            for record in file_records:
+                record["sample_name"] = sample if len(file_records) == 1 else f"{sample}_{record.get('id')}"
+                record["vcf_file"] = os.path.basename(vcf_path)
+            records.extend(file_records)
+            outputs.extend(file_outputs)
+            workspace.check_budget()
+
+        with open(workspace.file(f"{batch_name}.json"), "w") as f:
+            json.dump(records, f, indent=2)
+        for name in [f"{batch_name}.json", *outputs]:
+            workspace.publish(name)
+        results_dir = workspace.results_dir
 
     total_duration = (datetime.now() - start_time).total_seconds()
-    log_message(f"Done. Output at {output_json}", log_file)
+    log_message(f"Done. {len(records)} samples scored, output at {results_dir}", log_file)
     log_message(f"Total runtime: {total_duration:.1f} seconds", log_file)
 
-    return output_json_data
\ No newline at end of file
+    return records
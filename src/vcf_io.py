@@ -0,0 +1,179 @@
+import gzip
+import io
+import os
+import re
+import shutil
+import subprocess
+
+from metrics import wait_child
+
+try:
+    import pysam
+except ImportError:  # only installed in the plink image
+    pysam = None
+
+# Chromosomes dropped by `bcftools view -t ^chrX,chrY,X,Y`
+EXCLUDED_CHROMS = {"chrX", "chrY", "X", "Y"}
+
+_GT_SPLIT = re.compile(r"[/|]")
+
+# Worker threads of `bgzip -d`; BGZF blocks are inflated in parallel with libdeflate
+DECOMPRESS_THREADS = int(os.environ.get("PRS_DECOMPRESS_THREADS", min(4, os.cpu_count() or 1)))
+
+
+class BgzipReader:
+    """
+    Text stream of a gzipped file inflated by `bgzip -dc -@ threads` in a child
+    process. Closing it before the end stops the child; a failed child raises.
+    """
+
+    def __init__(self, path, threads=DECOMPRESS_THREADS):
+        self.path = str(path)
+        self._proc = subprocess.Popen(
+            ["bgzip", "-dc", "-@", str(max(1, threads)), self.path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        self._text = io.TextIOWrapper(self._proc.stdout, encoding="utf-8", errors="ignore")
+        self._eof = False
+
+    def __iter__(self):
+        for line in self._text:
+            yield line
+        self._eof = True
+
+    def read(self, size=-1):
+        data = self._text.read(size)
+        if not data:
+            self._eof = True
+        return data
+
+    def readline(self):
+        line = self._text.readline()
+        if not line:
+            self._eof = True
+        return line
+
+    def close(self):
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        if not self._eof:
+            proc.kill()
+        self._text.close()
+        stderr = proc.stderr.read().decode(errors="ignore").strip()
+        proc.stderr.close()
+        # Reaped with wait4 so the inflate CPU is charged to the stage reading the file
+        returncode = wait_child(proc)
+        if self._eof and returncode != 0:
+            raise RuntimeError(f"bgzip failed to decompress {self.path}: {stderr}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_vcf(vcf_path):
+    if str(vcf_path).endswith((".gz", ".bgz")):
+        # Streams through htslib when it is installed (the plink image), gzip otherwise
+        if shutil.which("bgzip"):
+            return BgzipReader(vcf_path)
+        return gzip.open(vcf_path, "rt", encoding="utf-8", errors="ignore")
+    return open(vcf_path, "r", encoding="utf-8", errors="ignore")
+
+
+def find_vcf_index(vcf_path):
+    # Tabix/CSI index next to a bgzipped VCF, if any
+    if not str(vcf_path).endswith((".gz", ".bgz")):
+        return None
+    for suffix in (".tbi", ".csi"):
+        if os.path.exists(f"{vcf_path}{suffix}"):
+            return f"{vcf_path}{suffix}"
+    return None
+
+
+def has_indexed_access(vcf_path):
+    return pysam is not None and find_vcf_index(vcf_path) is not None
+
+
+def iter_vcf_lines(input_vcf, positions=None):
+    """
+    Yield the header lines and data lines of a VCF. When `positions` is given and the
+    file is bgzipped with a .tbi/.csi index, only the records at those (chrom, pos)
+    sites are fetched; otherwise the whole file is streamed.
+    """
+    index_path = find_vcf_index(input_vcf) if positions else None
+    if pysam is None or index_path is None:
+        with open_vcf(input_vcf) as f:
+            yield from f
+        return
+    yield from _fetch_vcf_lines(input_vcf, index_path, positions)
+
+
+def _fetch_vcf_lines(input_vcf, index_path, positions):
+    wanted = {}
+    for chrom, pos in positions:
+        wanted.setdefault(normalize_chrom(chrom), set()).add(int(pos))
+
+    tbx = pysam.TabixFile(str(input_vcf), index=index_path)
+    try:
+        for line in tbx.header:
+            yield line + "\n"
+        # Walk contigs in index order so records come out in file order
+        for contig in tbx.contigs:
+            for pos in sorted(wanted.get(normalize_chrom(contig), ())):
+                for line in tbx.fetch(contig, pos - 1, pos):
+                    # fetch() also returns longer records overlapping the site
+                    if line.split("\t", 2)[1] == str(pos):
+                        yield line + "\n"
+    finally:
+        tbx.close()
+
+
+def read_sample_names(header_line):
+    # '#CHROM POS ID REF ALT QUAL FILTER INFO FORMAT s1 s2 ...'
+    return header_line.rstrip("\n").split("\t")[9:]
+
+
+def passes_pipeline_filters(fields):
+    # Same record filter as `bcftools view -e 'ID=="."' -t ^chrX,chrY,X,Y -m2 -M2`
+    chrom, _, variant_id, _, alt = fields[:5]
+    if variant_id == "." or chrom in EXCLUDED_CHROMS:
+        return False
+    return alt != "." and "," not in alt
+
+
+def alt_dosages(fields):
+    # ALT allele count per sample, NaN where the call is missing.
+    # Haploid calls are doubled the same way plink2 imports them on autosomes.
+    if len(fields) < 10:
+        return []
+    format_keys = fields[8].split(":")
+    gt_index = format_keys.index("GT") if "GT" in format_keys else 0
+    dosages = []
+    for sample_field in fields[9:]:
+        parts = sample_field.split(":")
+        gt = parts[gt_index] if gt_index < len(parts) else "."
+        alleles = _GT_SPLIT.split(gt)
+        if any(a == "." or a == "" for a in alleles):
+            dosages.append(float("nan"))
+        elif len(alleles) == 1:
+            dosages.append(2.0 if alleles[0] != "0" else 0.0)
+        else:
+            dosages.append(float(sum(a != "0" for a in alleles[:2])))
+    return dosages
+
+
+def normalize_chrom(chrom):
+    chrom = str(chrom).strip()
+    return chrom[3:] if chrom.lower().startswith("chr") else chrom
+
+
+def normalize_variant_id(variant_id):
+    # Same normalization read_vcf_as_df/intersect_vcf_with_tsv apply before joining on ID
+    variant_id = str(variant_id).lower()
+    if not variant_id.startswith("rs"):
+        variant_id = "rs" + variant_id
+    return variant_id.strip()
+
@@ -0,0 +1,253 @@
+from vcf_io import (
+    iter_vcf_lines, read_sample_names, passes_pipeline_filters, alt_dosages,
+    normalize_chrom, normalize_variant_id,
+)
+
+
+class VcfConsumer:
+    """
+    Receives the VCF records it declared interest in from a VcfScanner.
+    Sites are declared as raw `ids`, `normalized_ids` (compared after
+    normalize_variant_id) or (chrom, pos) `positions`; `all_records` asks for every
+    record. `fetch_positions`, when not None, are sites that cover everything the
+    consumer needs, so an indexed VCF may be read by region fetch of them only.
+    """
+
+    name = "consumer"
+    ids = ()
+    normalized_ids = ()
+    positions = ()
+    fetch_positions = None
+    all_records = False
+
+    def start(self, header_lines, samples):
+        pass
+
+    def consume(self, fields, line):
+        pass
+
+    def finish(self):
+        return None
+
+
+class VcfScanner:
+    """
+    Reads a VCF once and dispatches each record to the consumers that asked for it.
+    `records` and `bytes_read` count the data records and the VCF text read.
+    """
+
+    def __init__(self, vcf_path, consumers):
+        self.vcf_path = vcf_path
+        self.consumers = list(consumers)
+        self.records = 0
+        self.bytes_read = 0
+
+        # Combined site index: key -> bitmask of interested consumers
+        self._by_id = {}
+        self._by_normalized_id = {}
+        self._by_position = {}
+        self._all_mask = 0
+        for i, consumer in enumerate(self.consumers):
+            bit = 1 << i
+            if consumer.all_records:
+                self._all_mask |= bit
+            for variant_id in consumer.ids:
+                self._by_id[variant_id] = self._by_id.get(variant_id, 0) | bit
+            for variant_id in consumer.normalized_ids:
+                self._by_normalized_id[variant_id] = self._by_normalized_id.get(variant_id, 0) | bit
+            for chrom, pos in consumer.positions:
+                key = (normalize_chrom(chrom), int(pos))
+                self._by_position[key] = self._by_position.get(key, 0) | bit
+
+    @property
+    def fetch_positions(self):
+        # Region fetch is only possible when every consumer can do with it
+        if not self.consumers or any(c.fetch_positions is None for c in self.consumers):
+            return None
+        positions = set()
+        for consumer in self.consumers:
+            positions.update((normalize_chrom(c), int(p)) for c, p in consumer.fetch_positions)
+        return positions
+
+    def _targets(self, line):
+        head = line.split("\t", 3)
+        if len(head) < 3:
+            return self._all_mask
+        chrom, pos, variant_id = head[0], head[1], head[2]
+        mask = self._all_mask | self._by_id.get(variant_id, 0)
+        if self._by_normalized_id:
+            mask |= self._by_normalized_id.get(normalize_variant_id(variant_id), 0)
+        if self._by_position and pos.isdigit():
+            mask |= self._by_position.get((normalize_chrom(chrom), int(pos)), 0)
+        return mask
+
+    def run(self):
+        """Scan the file and return {consumer name: consumer.finish()}."""
+        header_lines = []
+        started = False
+        for line in iter_vcf_lines(self.vcf_path, self.fetch_positions):
+            self.bytes_read += len(line)
+            if line.startswith("#"):
+                header_lines.append(line)
+                continue
+            if not started:
+                self._start(header_lines)
+                started = True
+            self.records += 1
+            mask = self._targets(line)
+            if not mask:
+                continue
+            fields = line.rstrip("\n").split("\t")
+            for i, consumer in enumerate(self.consumers):
+                if mask >> i & 1:
+                    consumer.consume(fields, line)
+        if not started:
+            self._start(header_lines)
+        return {consumer.name: consumer.finish() for consumer in self.consumers}
+
+    def _start(self, header_lines):
+        samples = read_sample_names(header_lines[-1]) if header_lines and header_lines[-1].startswith("#CHROM") else []
+        for consumer in self.consumers:
+            consumer.start(header_lines, samples)
+
+
+class PrefilterConsumer(VcfConsumer):
+    """
+    Copies the header and the records at score or drug-annotation sites to `output_vcf`.
+    With a SiteIndex, records matched by position and alleles are written with the
+    site's rsID (and complemented alleles on the other strand), so bcftools and plink2,
+    which work by ID, use them.
+    """
+
+    name = "prefilter"
+
+    def __init__(self, output_vcf, rsids=(), positions=(), annotation_ids=(), site_index=None):
+        self.output_vcf = output_vcf
+        self.site_index = site_index
+        self.ids = set(rsids)
+        self.positions = {(normalize_chrom(c), int(p)) for c, p in positions}
+        if site_index:
+            self.positions |= site_index.positions
+        self.normalized_ids = set(annotation_ids)
+        # Annotation sites matched by ID only are found by a full scan
+        if not self.normalized_ids or (site_index and site_index.covers(self.normalized_ids)):
+            self.fetch_positions = self.positions
+        self.kept = 0
+        self._out = None
+
+    def start(self, header_lines, samples):
+        self._out = open(self.output_vcf, "w")
+        self._out.writelines(header_lines)
+
+    def consume(self, fields, line):
+        if self.site_index:
+            resolved = self.site_index.resolve(fields)
+            if resolved is not fields:
+                line = "\t".join(resolved) + "\n"
+        self._out.write(line)
+        self.kept += 1
+
+    def finish(self):
+        if self._out:
+            self._out.close()
+        return self.kept
+
+
+def prefilter_vcf(input_vcf, output_vcf, rsids=(), positions=(), annotation_ids=()):
+    """
+    Copy the VCF header and only the records whose ID is in `rsids`, whose normalized
+    ID is in `annotation_ids`, or whose (chrom, pos) is in `positions`.
+    Indexed .vcf.gz inputs are read by region fetch of `positions` only, when there
+    are no `annotation_ids`.
+    Returns (records kept, records read).
+    """
+    scanner = VcfScanner(input_vcf, [PrefilterConsumer(output_vcf, rsids, positions, annotation_ids)])
+    kept = scanner.run()["prefilter"]
+    return kept, scanner.records
+
+
+_TRANSITIONS = {("A", "G"), ("G", "A"), ("C", "T"), ("T", "C")}
+
+
+class QcConsumer(VcfConsumer):
+    """Record and per-sample genotype statistics of the whole upload."""
+
+    name = "qc"
+    all_records = True
+
+    def __init__(self):
+        self.stats = {
+            "records": 0,
+            "passing_pipeline_filters": 0,
+            "non_pass_filter": 0,
+            "missing_id": 0,
+            "multiallelic": 0,
+            "snvs": 0,
+            "indels": 0,
+            "transitions": 0,
+            "transversions": 0,
+            "records_per_chrom": {},
+        }
+        self.samples = []
+        self._called = []
+        self._het = []
+        self._hom_alt = []
+
+    def start(self, header_lines, samples):
+        self.samples = samples
+        self._called = [0] * len(samples)
+        self._het = [0] * len(samples)
+        self._hom_alt = [0] * len(samples)
+
+    def consume(self, fields, line):
+        stats = self.stats
+        stats["records"] += 1
+        if len(fields) < 8:
+            return
+        chrom, ref, alt, filter_value = fields[0], fields[3], fields[4], fields[6]
+        per_chrom = stats["records_per_chrom"]
+        per_chrom[chrom] = per_chrom.get(chrom, 0) + 1
+        if passes_pipeline_filters(fields):
+            stats["passing_pipeline_filters"] += 1
+        if filter_value not in ("PASS", "."):
+            stats["non_pass_filter"] += 1
+        if fields[2] == ".":
+            stats["missing_id"] += 1
+        alts = alt.split(",")
+        if len(alts) > 1:
+            stats["multiallelic"] += 1
+        for allele in alts:
+            if len(ref) == 1 and len(allele) == 1 and allele != ".":
+                stats["snvs"] += 1
+                if (ref.upper(), allele.upper()) in _TRANSITIONS:
+                    stats["transitions"] += 1
+                else:
+                    stats["transversions"] += 1
+            elif allele not in (".", "*"):
+                stats["indels"] += 1
+
+        # Non-reference allele count per sample, NaN for missing calls
+        for i, dosage in enumerate(alt_dosages(fields)):
+            if dosage != dosage:
+                continue
+            self._called[i] += 1
+            if dosage == 1:
+                self._het[i] += 1
+            elif dosage == 2:
+                self._hom_alt[i] += 1
+
+    def finish(self):
+        stats = dict(self.stats)
+        stats["ti_tv"] = round(stats["transitions"] / stats["transversions"], 4) if stats["transversions"] else None
+        records = stats["records"]
+        stats["samples"] = {
+            sample: {
+                "called": self._called[i],
+                "missing": records - self._called[i],
+                "call_rate": round(self._called[i] / records, 4) if records else None,
+                "het": self._het[i],
+                "hom_alt": self._hom_alt[i],
+            }
+            for i, sample in enumerate(self.samples)
+        }
+        return stats
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import uuid
+
+RESULTS_DIR = os.environ.get("PRS_RESULTS_DIR", "output")
+SCRATCH_BUDGET_MB = int(os.environ.get("PRS_SCRATCH_BUDGET_MB", "1024"))
+# Per-subprocess wall clock limit; the workspace is removed when a step times out
+STEP_TIMEOUT = int(os.environ.get("PRS_STEP_TIMEOUT", "600"))
+
+
+class ScratchBudgetExceeded(RuntimeError):
+    pass
+
+
+def default_scratch_root(budget_bytes=0):
+    # $PRS_SCRATCH_DIR, else tmpfs at /dev/shm if it can hold the job budget, else the system temp dir
+    configured = os.environ.get("PRS_SCRATCH_DIR")
+    if configured:
+        return configured
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        if shutil.disk_usage("/dev/shm").free >= budget_bytes:
+            return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def results_dir_for(job_id):
+    return os.path.join(RESULTS_DIR, job_id)
+
+
+class JobWorkspace:
+    """
+    Isolated scratch directory for one pipeline run. Intermediates live here and are
+    removed on exit, whether the job succeeded, failed or timed out; final artifacts
+    are moved into output/<job_id>/ with publish().
+    """
+
+    def __init__(self, job_id=None, scratch_root=None, budget_mb=SCRATCH_BUDGET_MB, keep=False):
+        self.job_id = job_id or new_job_id()
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.scratch_root = scratch_root or default_scratch_root(self.budget_bytes)
+        self.keep = keep
+        self.path = None
+        self.results_dir = results_dir_for(self.job_id)
+
+    def __enter__(self):
+        os.makedirs(self.scratch_root, exist_ok=True)
+        free = shutil.disk_usage(self.scratch_root).free
+        if free < self.budget_bytes:
+            raise ScratchBudgetExceeded(
+                f"Scratch space {self.scratch_root} has {free // 2**20} MB free, job budget is {self.budget_bytes // 2**20} MB"
+            )
+        self.path = tempfile.mkdtemp(prefix=f"prs_{self.job_id}_", dir=self.scratch_root)
+        return self
+
+    def __exit__(self, *exc):
+        if self.path and not self.keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def usage(self):
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def check_budget(self):
+        used = self.usage()
+        if used > self.budget_bytes:
+            raise ScratchBudgetExceeded(
+                f"Job {self.job_id} used {used // 2**20} MB of scratch, budget is {self.budget_bytes // 2**20} MB"
+            )
+        return used
+
+    def publish(self, name):
+        # Move a workspace file into the job's results directory; readers never see a partial file
+        os.makedirs(self.results_dir, exist_ok=True)
+        dest = os.path.join(self.results_dir, name)
+        partial = f"{dest}.partial"
+        shutil.move(self.file(name), partial)
+        os.replace(partial, dest)
+        return dest
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The plink service modules import each other flat, as they do when run from src/
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def repo_cwd(monkeypatch):
+    """Run from the repository root, where the services find input/ and output/."""
+    monkeypatch.chdir(REPO_ROOT)
+    return REPO_ROOT
+
+
+def write_bfile(prefix, bim_lines, fam_ids, genotypes):
+    """Variant-major PLINK .bed/.bim/.fam; `genotypes` are (variants, samples) A1 counts, None for missing."""
+    codes = {2: 0b00, None: 0b01, 1: 0b10, 0: 0b11}
+    body = bytearray()
+    for row in genotypes:
+        packed = [0] * ((len(row) + 3) // 4)
+        for i, call in enumerate(row):
+            packed[i // 4] |= codes[call] << (2 * (i % 4))
+        body += bytes(packed)
+    with open(f"{prefix}.bed", "wb") as f:
+        f.write(b"\x6c\x1b\x01" + bytes(body))
+    with open(f"{prefix}.bim", "w") as f:
+        f.write("".join(line + "\n" for line in bim_lines))
+    with open(f"{prefix}.fam", "w") as f:
+        f.write("".join(f"{iid}\t{iid}\t0\t0\t0\t-9\n" for iid in fam_ids))
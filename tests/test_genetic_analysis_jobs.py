@@ -0,0 +1,136 @@
+import inspect
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("fastapi", "dependency_injector", "sqlmodel", "jose", "celery", "httpx", "email_validator", "requests"):
+    pytest.importorskip(module)
+
+from dependency_injector import providers  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend.api.v1.endpoints import genetic_analysis  # noqa: E402
+from backend.core.container import Container  # noqa: E402
+from backend.core.exceptions import NotFoundError  # noqa: E402
+from backend.model.genetic_analysis_job import JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED  # noqa: E402
+from backend.schema.auth_schema import Payload  # noqa: E402
+from backend.services.genetic_analysis_service import GENETIC_ANALYSIS_COST  # noqa: E402
+
+USER = Payload(id=7, email="user@example.com", name="User", is_superuser=False)
+VCF = b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+
+
+class FakeBillingService:
+    def __init__(self, funds=True):
+        self.funds = funds
+        self.reserved = []
+        self.cancelled = []
+
+    def reserve_funds(self, user_id, cost):
+        if self.funds:
+            self.reserved.append((user_id, cost))
+        return self.funds
+
+    def cancel_reservation(self, user_id, cost):
+        self.cancelled.append((user_id, cost))
+
+
+class FakeGeneticAnalysisService:
+    def __init__(self):
+        self.jobs = {}
+        self.uploads = []
+        self.fail_submit = False
+
+    def submit_job(self, user_id, filename, upload):
+        if self.fail_submit:
+            raise RuntimeError("broker unavailable")
+        self.uploads.append((user_id, filename, upload.read()))
+        job = SimpleNamespace(id=len(self.jobs) + 1, user_id=user_id, status=JOB_QUEUED, cost=GENETIC_ANALYSIS_COST,
+                              cached=False, error=None, result=None, transaction_id=None,
+                              created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 1))
+        self.jobs[job.id] = job
+        return job
+
+    def get_job(self, job_id, user_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            raise NotFoundError(detail=f"not found id : {job_id}")
+        return job
+
+
+@pytest.fixture
+def services():
+    container = Container()
+    billing, analysis = FakeBillingService(), FakeGeneticAnalysisService()
+    container.billing_service.override(providers.Object(billing))
+    container.genetic_analysis_service.override(providers.Object(analysis))
+
+    app = FastAPI()
+    app.include_router(genetic_analysis.router)
+    # The endpoints' own Depends() target, as wired by the container
+    current_user = inspect.signature(genetic_analysis.get_genetic_analysis_job).parameters["current_user_payload"]
+    app.dependency_overrides[current_user.default.dependency] = lambda: USER
+    yield TestClient(app), billing, analysis
+    container.unwire()
+
+
+def test_submit_reserves_funds_and_answers_202(services):
+    client, billing, analysis = services
+
+    response = client.post("/genetic-analysis/jobs", files={"vcf_file": ("sample.vcf", VCF)})
+
+    assert response.status_code == 202
+    assert response.json()["job_id"] == 1
+    assert response.json()["status"] == JOB_QUEUED
+    assert billing.reserved == [(USER.id, GENETIC_ANALYSIS_COST)]
+    assert analysis.uploads == [(USER.id, "sample.vcf", VCF)]
+
+
+def test_submit_is_refused_without_funds_or_with_a_bad_file_name(services):
+    client, billing, analysis = services
+
+    assert client.post("/genetic-analysis/jobs", files={"vcf_file": ("sample.txt", VCF)}).status_code == 422
+    billing.funds = False
+    assert client.post("/genetic-analysis/jobs", files={"vcf_file": ("sample.vcf", VCF)}).status_code == 400
+    assert analysis.uploads == []
+
+
+def test_failed_submit_cancels_the_reservation(services):
+    client, billing, analysis = services
+    analysis.fail_submit = True
+
+    response = client.post("/genetic-analysis/jobs", files={"vcf_file": ("sample.vcf", VCF)})
+
+    assert response.status_code == 400
+    assert billing.cancelled == billing.reserved == [(USER.id, GENETIC_ANALYSIS_COST)]
+
+
+def test_result_is_a_conflict_until_the_job_succeeded(services):
+    client, _, analysis = services
+    job_id = client.post("/genetic-analysis/jobs", files={"vcf_file": ("sample.vcf", VCF)}).json()["job_id"]
+    job = analysis.jobs[job_id]
+
+    for status in (JOB_QUEUED, JOB_RUNNING):
+        job.status = status
+        assert client.get(f"/genetic-analysis/jobs/{job_id}").json()["status"] == status
+        assert client.get(f"/genetic-analysis/jobs/{job_id}/result").status_code == 409
+
+    job.status, job.result, job.transaction_id = JOB_SUCCEEDED, {"status": "success"}, 3
+    response = client.get(f"/genetic-analysis/jobs/{job_id}/result")
+    assert response.status_code == 200
+    assert response.json()["analysis_result"] == {"status": "success"}
+    assert response.json()["transaction_id"] == 3
+
+    job.status, job.error = JOB_FAILED, "Analysis service error"
+    response = client.get(f"/genetic-analysis/jobs/{job_id}/result")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Analysis service error"
+
+
+def test_another_users_job_is_not_found(services):
+    client, _, analysis = services
+    job = analysis.submit_job(USER.id + 1, "other.vcf", SimpleNamespace(read=lambda: VCF))
+
+    assert client.get(f"/genetic-analysis/jobs/{job.id}").status_code == 404
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from job_queue import PipelineQueue, QueueClosed, QueueFull
+
+
+@pytest.fixture
+def busy_queue():
+    """A queue with its one worker running a job and its one slot taken."""
+    release = threading.Event()
+    started = threading.Event()
+
+    def job():
+        started.set()
+        release.wait(10)
+        return "done"
+
+    queue = PipelineQueue(workers=1, max_queued=1)
+    futures = [queue.submit(job)]
+    assert started.wait(10)
+    futures.append(queue.submit(job))
+    yield queue
+    release.set()
+    assert [future.result(10) for future in futures] == ["done", "done"]
+    queue.close()
+
+
+def test_full_queue_refuses_with_retry_after(busy_queue):
+    busy_queue.avg_job_seconds = 12.0
+
+    with pytest.raises(QueueFull) as error:
+        busy_queue.submit(lambda: None)
+
+    assert error.value.status_code == 429
+    # Two jobs ahead of a new one on a single worker
+    assert error.value.retry_after == 24
+    assert busy_queue.stats()["rejected"] == 1
+
+
+def test_closed_queue_refuses_with_503():
+    queue = PipelineQueue(workers=1, max_queued=0)
+    assert queue.run(lambda: 42) == 42
+    queue.close()
+
+    with pytest.raises(QueueClosed) as error:
+        queue.submit(lambda: None)
+
+    assert error.value.status_code == 503
+    assert error.value.retry_after >= 1
+
+
+def test_predict_answers_429_with_retry_after_header(busy_queue, monkeypatch, tmp_path):
+    pytest.importorskip("flask")
+    import plink_api
+
+    vcf = tmp_path / "sample.vcf"
+    vcf.write_text("##fileformat=VCFv4.2\n")
+    monkeypatch.setattr(plink_api, "pipeline_queue", busy_queue)
+    busy_queue.avg_job_seconds = 5.0
+
+    response = plink_api.app.test_client().post("/predict", json={"vcf_file": str(vcf), "assembly": "GRCh37"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "10"
+    assert response.get_json()["retry_after"] == 10
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from conftest import write_bfile
+from plink_bed import PlinkBed
+
+SAMPLES = ["S1", "S2", "S3", "S4", "S5"]
+BIM = ["1\trs1\t0\t1000\tA\tG", "1\trs2\t0\t2000\tT\tC", "2\trs3\t0\t3000\tG\tA"]
+
+
+def _bfile(tmp_path, body):
+    prefix = str(tmp_path / "sample")
+    write_bfile(prefix, BIM, SAMPLES, [])
+    with open(f"{prefix}.bed", "wb") as f:
+        f.write(b"\x6c\x1b\x01" + body)
+    return prefix
+
+
+def test_codes_are_decoded_as_a1_counts(tmp_path):
+    # 5 samples take 2 bytes per variant, low bits first; the last 6 bits are padding.
+    # rs1: 00 10 11 01 | 00 -> 2, 1, 0, missing, 2
+    # rs2: all 11 -> 0, with set padding bits that must be ignored
+    # rs3: 01 01 01 01 | 10 -> missing x4, 1
+    prefix = _bfile(tmp_path, bytes([0b01111000, 0b00000000, 0b11111111, 0b11111111, 0b01010101, 0b00000010]))
+
+    with PlinkBed(prefix) as bed:
+        assert bed.sample_ids == SAMPLES
+        assert bed.bytes_per_variant == 2
+        dosages = bed.read_dosages([0, 1, 2])
+
+    np.testing.assert_array_equal(dosages, [
+        [2, 1, 0, np.nan, 2],
+        [0, 0, 0, 0, 0],
+        [np.nan, np.nan, np.nan, np.nan, 1],
+    ])
+
+
+def test_selected_variants_are_read_in_bim_order(tmp_path):
+    prefix = str(tmp_path / "sample")
+    write_bfile(prefix, BIM, SAMPLES, [[2, 2, 2, 2, 2], [1, None, 1, 0, 0], [0, 1, 2, None, 1]])
+
+    with PlinkBed(prefix) as bed:
+        indices = bed.variant_indices(["rs3", "rs9", "rs1"])
+        dosages = bed.read_dosages(indices)
+
+    assert indices.tolist() == [0, 2]
+    np.testing.assert_array_equal(dosages, [[2, 2, 2, 2, 2], [0, 1, 2, np.nan, 1]])
+
+
+def test_sample_major_file_is_rejected(tmp_path):
+    prefix = _bfile(tmp_path, bytes(6))
+    with open(f"{prefix}.bed", "r+b") as f:
+        f.seek(2)
+        f.write(b"\x00")
+
+    with pytest.raises(ValueError, match="not a variant-major"):
+        PlinkBed(prefix)
+
+
+def test_size_mismatch_with_bim_and_fam_is_rejected(tmp_path):
+    prefix = _bfile(tmp_path, bytes(5))
+
+    with pytest.raises(ValueError, match="has 8 bytes, expected 9"):
+        PlinkBed(prefix)
@@ -0,0 +1,70 @@
+import json
+import os
+import time
+
+from result_cache import ENTRY_FILE, ResultCache
+
+RECORDS = [{"id": "S1", "score": 2.1}]
+
+
+def _results(tmp_path, sample, size=10):
+    results_dir = tmp_path / "results" / sample
+    results_dir.mkdir(parents=True)
+    (results_dir / f"{sample}_prs.csv").write_text("x" * size)
+    (results_dir / f"{sample}_qc.json").write_text("{}")
+    (results_dir / "other_prs.csv").write_text("not this job's")
+    return str(results_dir)
+
+
+def _age(cache, key, seconds):
+    # Move an entry back in time, both its creation and its last use
+    path = os.path.join(cache.cache_dir, key, ENTRY_FILE)
+    with open(path) as f:
+        entry = json.load(f)
+    entry["created"] -= seconds
+    with open(path, "w") as f:
+        json.dump(entry, f)
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_entry_is_restored_under_another_sample_name(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_mb=1, ttl_hours=1, enabled=True)
+    key = ResultCache.key_for("sha", "GRCh37", "v1", "engine=numpy")
+    cache.store(key, "upload", _results(tmp_path, "upload"), RECORDS)
+
+    restored_dir = tmp_path / "restored"
+    entry = cache.restore(key, "reupload", str(restored_dir))
+
+    assert entry["records"] == RECORDS
+    assert sorted(os.listdir(restored_dir)) == ["reupload_prs.csv", "reupload_qc.json"]
+    assert cache.restore(ResultCache.key_for("sha", "GRCh37", "v1", "engine=plink2"), "x", str(restored_dir)) is None
+    assert cache.stats() == {"enabled": True, "hits": 1, "misses": 1, "stores": 1, "evictions": 0}
+
+
+def test_expired_entry_is_a_miss_and_removed(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_mb=1, ttl_hours=1, enabled=True)
+    key = ResultCache.key_for("sha", "GRCh37", "v1")
+    cache.store(key, "upload", _results(tmp_path, "upload"), RECORDS)
+    _age(cache, key, 2 * 3600)
+
+    assert cache.restore(key, "upload", str(tmp_path / "restored")) is None
+    assert not os.path.exists(os.path.join(cache.cache_dir, key))
+    assert cache.stats()["evictions"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_past_the_size_limit(tmp_path):
+    # Room for two entries of ~400 KB
+    cache = ResultCache(str(tmp_path / "cache"), max_mb=1, ttl_hours=1, enabled=True)
+    keys = [ResultCache.key_for(f"sha{i}", "GRCh37", "v1") for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        cache.store(key, f"job{i}", _results(tmp_path, f"job{i}", size=400 * 1024), RECORDS)
+    _age(cache, keys[0], 60)
+    _age(cache, keys[1], 120)
+    # Using the older entry makes the other one the least recently used
+    assert cache.restore(keys[1], "job1", str(tmp_path / "restored")) is not None
+
+    cache.store(keys[2], "job2", _results(tmp_path, "job2", size=400 * 1024), RECORDS)
+
+    assert sorted(os.listdir(cache.cache_dir)) == sorted([keys[1], keys[2]])
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,37 @@
+import numpy as np
+
+from frontend.services.score_distribution import fallback_distribution, percentile_of, score_average
+from score_distribution import hwe_score_quantiles
+from score_registry import ScoreModel
+from scoring import score_dosages
+from utils import parse_profile_lines
+
+
+def _simulated_results(model, samples=200, seed=0):
+    # Genotypes in HWE at the effect allele frequencies, scored like the numpy engine
+    rng = np.random.default_rng(seed)
+    matched = ~np.isnan(model.effect_freqs)
+    freqs = np.nan_to_num(model.effect_freqs)
+    effect_dosage = rng.binomial(2, freqs[:, None], size=(len(model), samples)).astype(float)
+    names = [f"S{i}" for i in range(samples)]
+    sscore_lines, _ = score_dosages(model, matched, effect_dosage, 2.0 - effect_dosage, names)
+    return parse_profile_lines(sscore_lines)
+
+
+def test_typical_sample_lands_inside_the_quantile_table(repo_cwd):
+    model = ScoreModel("input/prs/PGS000195_hmPOS_GRCh37.txt", "input/prs/PGS000195_hmPOS_GRCh37.freq")
+    levels, values = hwe_score_quantiles(model.weights, model.effect_freqs)
+    results = _simulated_results(model)
+
+    averages = np.array([score_average(result) for result in results])
+    assert ((averages > values[0]) & (averages < values[-1])).all()
+    percentiles = np.array([percentile_of(average, levels, values) for average in averages])
+    assert 30 < np.median(percentiles) < 70
+    assert (percentiles < 100).mean() > 0.95
+
+
+def test_fallback_table_is_on_the_score_average_scale(repo_cwd):
+    model = ScoreModel("input/prs/PGS000195_hmPOS_GRCh37.txt", "input/prs/PGS000195_hmPOS_GRCh37.freq")
+    levels, values = fallback_distribution()
+    percentiles = [percentile_of(score_average(result), levels, values) for result in _simulated_results(model)]
+    assert 30 < np.median(percentiles) < 70
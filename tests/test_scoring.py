@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import REPO_ROOT, write_bfile
+
+DATA = os.path.join(REPO_ROOT, "tests", "data", "parity")
+
+
+def _expected_sscore():
+    # Worked out by hand from plink2 --score (no-mean-imputation off, cols=+scoresums):
+    #   rs1 A is the ALT, rs2 C is the REF (2 - ALT dosage), rs3 is missing for S2 and
+    #   mean-imputed as 2 * 0.25, the second rs4 record is dropped by --rm-dup force-first,
+    #   rs5 is not in the VCF and rs6 is skipped because A is neither REF nor ALT.
+    #   S1: 0.5*1 - 0.25*2 + 0.8*2 + 1.2*1 = 2.8  over 8 alleles
+    #   S2: 0.5*2 - 0.25*1 + 0.8*0.5 + 1.2*0 = 1.15 over 6 alleles
+    with open(os.path.join(DATA, "expected.sscore")) as f:
+        return f.read().splitlines()
+
+
+@pytest.fixture
+def model():
+    from score_registry import ScoreModel
+
+    return ScoreModel(os.path.join(DATA, "score.txt"), os.path.join(DATA, "score.freq"), {"id": "PGS_TEST"})
+
+
+def test_numpy_engine_matches_plink2_sscore(model):
+    from scoring import score_vcf
+
+    sscore_lines, genotypes = score_vcf(os.path.join(DATA, "sample.vcf"), model)
+
+    assert sscore_lines == _expected_sscore()
+    assert genotypes["rsid"].tolist() == ["rs1", "rs2", "rs3", "rs4"]
+    assert genotypes["S1"].tolist() == [1.0, 0.0, 2.0, 1.0]
+    assert np.isnan(genotypes["S2"][2])
+
+
+def test_profile_records_scale_the_average_by_the_dosage_sum(model):
+    from scoring import score_vcf
+    from utils import parse_profile_lines
+
+    sscore_lines, _ = score_vcf(os.path.join(DATA, "sample.vcf"), model)
+    records = parse_profile_lines(sscore_lines)
+
+    assert [record["id"] for record in records] == ["S1", "S2"]
+    assert [round(record["score"], 4) for record in records] == [2.1, 0.575]
+
+
+def test_merged_plink2_sscore_is_split_per_model(tmp_path, model):
+    from plink_bed import PlinkBed
+    from scoring import split_merged_sscore
+
+    # The fixture VCF after plink2 --make-bed --rm-dup force-first
+    prefix = str(tmp_path / "sample_dedup")
+    write_bfile(prefix, [
+        "1\trs1\t0\t1000\tA\tG",
+        "1\trs2\t0\t2000\tT\tC",
+        "1\trs3\t0\t3000\tG\tA",
+        "2\trs4\t0\t4000\tT\tC",
+        "2\trs6\t0\t6000\tT\tG",
+    ], ["S1", "S2"], [[1, 2], [0, 1], [2, None], [1, 0], [1, 2]])
+    # plink2 counts ALLELE_CT over the whole merged file; only the _SUM column is per model
+    merged = [
+        "#IID\tALLELE_CT\tNAMED_ALLELE_DOSAGE_SUM\tPGS_TEST_AVG\tPGS_TEST_SUM",
+        "S1\t12\t9\t0.233333\t2.8",
+        "S2\t10\t6\t0.115\t1.15",
+    ]
+
+    with PlinkBed(prefix) as bed:
+        [(sscore_lines, used)] = split_merged_sscore([model], merged, bed, ["rs1", "rs2", "rs3", "rs4"])
+
+    assert sscore_lines == _expected_sscore()
+    assert used == ["rs1", "rs2", "rs3", "rs4"]
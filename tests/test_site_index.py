@@ -0,0 +1,60 @@
+from site_index import SiteIndex
+
+
+def _index():
+    index = SiteIndex()
+    index.add("1", 1000, "rs1", "A", "G")
+    index.add("1", 2000, "rs2", "A", "T")
+    index.add("chr2", 3000, "rs3", "C", "")
+    return index
+
+
+def _record(chrom, pos, variant_id, ref, alt):
+    return [chrom, str(pos), variant_id, ref, alt, ".", "PASS", ".", "GT", "0/1"]
+
+
+def test_unlabelled_record_takes_the_site_rsid():
+    resolved = _index().resolve(_record("chr1", 1000, ".", "A", "G"))
+    assert resolved[2:5] == ["rs1", "A", "G"]
+    assert resolved[5:] == [".", "PASS", ".", "GT", "0/1"]
+
+
+def test_swapped_alleles_match_without_rewrite():
+    resolved = _index().resolve(_record("1", 1000, "1:1000:G:A", "G", "A"))
+    assert resolved[2:5] == ["rs1", "G", "A"]
+
+
+def test_reverse_strand_alleles_are_complemented():
+    assert _index().resolve(_record("1", 1000, ".", "T", "C"))[2:5] == ["rs1", "A", "G"]
+    assert _index().resolve(_record("1", 1000, ".", "C", "T"))[2:5] == ["rs1", "G", "A"]
+
+
+def test_both_alleles_must_match():
+    index = _index()
+    for ref, alt in (("A", "C"), ("A", "AG"), ("T", "G")):
+        record = _record("1", 1000, ".", ref, alt)
+        assert index.resolve(record) is record
+
+
+def test_palindromic_site_matches_only_forward_strand():
+    index = _index()
+    # A/T complemented is T/A: the same pair, so the strand cannot be told and no flip is tried
+    assert index.resolve(_record("1", 2000, ".", "A", "T"))[2:5] == ["rs2", "A", "T"]
+    assert index.resolve(_record("1", 2000, ".", "T", "A"))[2:5] == ["rs2", "T", "A"]
+    record = _record("1", 2000, ".", "C", "G")
+    assert index.resolve(record) is record
+
+
+def test_site_without_other_allele_is_skipped():
+    record = _record("2", 3000, ".", "C", "T")
+    assert _index().resolve(record) is record
+
+
+def test_record_with_another_rsid_is_not_relabelled():
+    record = _record("1", 1000, "rs999", "A", "G")
+    assert _index().resolve(record) is record
+
+
+def test_multiallelic_record_is_not_resolved():
+    record = _record("1", 1000, ".", "A", "G,T")
+    assert _index().resolve(record) is record
@@ -0,0 +1,100 @@
+import os
+import sys
+
+import pytest
+
+from conftest import REPO_ROOT
+
+pytest.importorskip("pysam")
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+
+from generate_vcf import generate_vcf, load_pgs_sites  # noqa: E402
+
+
+@pytest.fixture
+def indexed_vcf(tmp_path):
+    return generate_vcf(str(tmp_path / "indexed.vcf.gz"), records=5000, samples=2, assembly="GRCh37", index=True)
+
+
+@pytest.fixture
+def drug_annotations(tmp_path, monkeypatch):
+    import utils
+
+    path = tmp_path / "drug_toxicity_annotations.tsv"
+    rsids = load_pgs_sites("GRCh37")["id"].head(20)
+    path.write_text("Variant\tDrug\tAnnotation\n" + "".join(f"{rsid}\tdrug\ttest\n" for rsid in rsids))
+    monkeypatch.setattr(utils, "DRUG_ANNOTATIONS_PATH", str(path))
+    return path
+
+
+def test_indexed_input_is_read_by_region_fetch_with_default_settings(repo_cwd, tmp_path, indexed_vcf,
+                                                                    drug_annotations):
+    from metrics import JobMetrics
+    from score_registry import registry
+    from utils import score_vcf_file
+    from workspace import JobWorkspace
+
+    registry.load()
+    models = registry.select("GRCh37")
+    metrics = JobMetrics()
+    with JobWorkspace(scratch_root=str(tmp_path / "scratch"), budget_mb=1) as workspace:
+        score_vcf_file(indexed_vcf, "indexed", models, workspace, None, metrics, engine="numpy")
+        written = os.listdir(workspace.path)
+
+    scan = next(stage for stage in metrics.as_dict()["stages"] if stage["stage"] == "vcf_scan")
+    assert 0 < scan["variants"] <= len(load_pgs_sites("GRCh37")) * 2
+    assert "indexed_intersection_with_drug_annotation.csv" in written
+    assert "indexed_qc.json" not in written
+
+
+def _score(vcf_path, sample, tmp_path):
+    from metrics import JobMetrics
+    from score_registry import registry
+    from utils import score_vcf_file
+    from workspace import JobWorkspace
+
+    registry.load()
+    metrics = JobMetrics()
+    with JobWorkspace(scratch_root=str(tmp_path / "scratch"), budget_mb=1) as workspace:
+        score_vcf_file(vcf_path, sample, registry.select("GRCh37"), workspace, None, metrics, engine="numpy")
+        with open(workspace.file(f"{sample}_intersection_with_drug_annotation.csv")) as f:
+            intersection = f.read()
+    scan = next(stage for stage in metrics.as_dict()["stages"] if stage["stage"] == "vcf_scan")
+    return scan["variants"], intersection
+
+
+def test_rsid_only_annotations_are_region_fetched_through_the_sites_reference(repo_cwd, tmp_path, monkeypatch,
+                                                                            indexed_vcf):
+    import gzip
+
+    import utils
+    from annotation_sites import AnnotationSites
+
+    # Drug annotations on variants that are not score sites, named by rsID only
+    score_ids = set(load_pgs_sites("GRCh37")["id"])
+    with gzip.open(indexed_vcf, "rt") as f:
+        plain = f.read()
+    records = [line.split("\t") for line in plain.splitlines() if not line.startswith("#")]
+    annotated = [fields for fields in records if fields[2].startswith("rs") and fields[2] not in score_ids][::250]
+    assert len(annotated) >= 10
+    table = tmp_path / "drug_toxicity_annotations.tsv"
+    table.write_text("Variant\tDrug\tAnnotation\n" + "".join(f"{f[2].upper()}\tdrug\ttest\n" for f in annotated))
+    monkeypatch.setattr(utils, "DRUG_ANNOTATIONS_PATH", str(table))
+
+    # The reference has the annotated sites among others, as a dbSNP extract would
+    reference = tmp_path / "sites_GRCh37.vcf"
+    reference.write_text("##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\n" + "".join(
+        "\t".join(fields[:5]) + "\n" for fields in records[::7] + annotated))
+    sites = AnnotationSites(str(tmp_path / "sites_{assembly}.vcf"), str(tmp_path / "sites"))
+    monkeypatch.setattr(utils, "annotation_sites", sites)
+
+    plain_vcf = tmp_path / "plain.vcf"
+    plain_vcf.write_text(plain)
+    full_records, full_intersection = _score(str(plain_vcf), "sample", tmp_path)
+    fetched_records, fetched_intersection = _score(indexed_vcf, "sample", tmp_path)
+
+    assert fetched_records < full_records / 2
+    assert fetched_intersection == full_intersection
+    assert full_intersection.count("\n") == len(annotated) + 1
+    # The reference is read once; the second job used the sites found by the first
+    assert sites.lookups == 1